@@ -77,104 +77,66 @@ def mongodb_examples():
 
 
 def redis_examples():
-    """Ejemplos de consultas en Redis."""
+    """Ejemplos de consultas en Redis (todas sobre una sola foto del keyspace)."""
     print("\n" + "="*60)
     print(" 🔴 EJEMPLOS DE CONSULTAS REDIS")
     print("="*60)
     
-    from src.config import get_redis_connection
-    import json
-    
-    r = get_redis_connection()
-    if not r:
+    from src.snapshot import (
+        conversion_rates,
+        event_counts,
+        revenue_totals,
+        take_cart_snapshot,
+        top_carts,
+        unique_customers,
+    )
+    
+    # Una pasada SCAN + HMGET en pipeline; el resto son consultas en memoria
+    snap = take_cart_snapshot()
+    if snap is None:
         print("❌ No se pudo conectar a Redis")
         return
     
     # 1. Carritos totales
     print("\n1️⃣  Carritos totales:")
-    cart_keys = r.keys("cart:CART-*")
-    print(f"   Total: {len(cart_keys)} carritos")
+    print(f"   Total: {len(snap)} carritos")
     
     # 2. Detalles de carritos
     print("\n2️⃣  Detalles de carritos:")
-    for key in cart_keys[:3]:  # Primeros 3
-        data = r.hgetall(key)
-        cart_id = key.replace("cart:", "")
-        customer_id = data.get("customer_id", "Unknown")
-        revenue = data.get("total_revenue", 0)
-        print(f"   {cart_id} ({customer_id}): ${revenue}")
+    for cart_id, row in snap.head(3).iterrows():  # Primeros 3
+        print(f"   {cart_id} ({row['customer_id']}): ${row['total_revenue']}")
+    
+    print("\n   Top 3 por ingresos:")
+    for cart_id, row in top_carts(snap, 3).iterrows():
+        print(f"   {cart_id} ({row['customer_id']}): ${row['total_revenue']:.2f} [{row['outcome']}]")
+    
+    totals = revenue_totals(snap)
     
     # 3. Ingresos totales
     print("\n3️⃣  Ingresos totales por carrito:")
-    total_revenue = 0
-    for key in cart_keys:
-        data = r.hgetall(key)
-        revenue = float(data.get("total_revenue", 0))
-        total_revenue += revenue
-    print(f"   Total: ${total_revenue:.2f}")
+    print(f"   Total: ${totals['total_revenue']:.2f}")
     
     # 4. Ingresos perdidos
     print("\n4️⃣  Ingresos perdidos:")
-    total_lost = 0
-    for key in cart_keys:
-        data = r.hgetall(key)
-        lost = float(data.get("lost_revenue", 0))
-        total_lost += lost
-    print(f"   Total: ${total_lost:.2f}")
+    print(f"   Total: ${totals['lost_revenue']:.2f}")
     
     # 5. Análisis de eventos
     print("\n5️⃣  Análisis de eventos:")
-    event_counts = {}
-    for key in cart_keys:
-        data = r.hgetall(key)
-        try:
-            events = json.loads(data.get("events", "[]"))
-            for event in events:
-                event_type = event.get("event_type", "unknown")
-                event_counts[event_type] = event_counts.get(event_type, 0) + 1
-        except:
-            pass
-    
-    for event_type, count in sorted(event_counts.items(), key=lambda x: x[1], reverse=True):
+    for event_type, count in event_counts(snap).items():
         print(f"   {event_type}: {count} eventos")
     
     # 6. Clientes únicos
     print("\n6️⃣  Clientes únicos:")
-    customers = set()
-    for key in cart_keys:
-        data = r.hgetall(key)
-        customer = data.get("customer_id")
-        if customer:
-            customers.add(customer)
+    customers = unique_customers(snap)
     print(f"   Total: {len(customers)} clientes")
-    for cust in sorted(customers):
+    for cust in customers:
         print(f"     - {cust}")
     
-    # 7. Cálculo de tasas
+    # 7. Cálculo de tasas (por carrito: nunca superan el 100%)
     print("\n7️⃣  Tasas de conversión:")
-    total_carts = len(cart_keys)
-    checkouts = 0
-    abandons = 0
-    
-    for key in cart_keys:
-        data = r.hgetall(key)
-        try:
-            events = json.loads(data.get("events", "[]"))
-            for event in events:
-                if event.get("event_type") == "checkout":
-                    checkouts += 1
-                elif event.get("event_type") == "abandon":
-                    abandons += 1
-        except:
-            pass
-    
-    checkout_rate = (checkouts / total_carts * 100) if total_carts > 0 else 0
-    abandon_rate = (abandons / total_carts * 100) if total_carts > 0 else 0
-    
-    print(f"   Completados: {checkouts} ({checkout_rate:.1f}%)")
-    print(f"   Abandonados: {abandons} ({abandon_rate:.1f}%)")
-    
-    r.close()
+    rates = conversion_rates(snap)
+    print(f"   Completados: {rates['checkout_carts']} ({rates['checkout_rate']:.1%})")
+    print(f"   Abandonados: {rates['abandoned_carts']} ({rates['abandon_rate']:.1%})")
 
 
 def cross_database_analysis():
@@ -184,34 +146,34 @@ def cross_database_analysis():
     print("="*60)
     
     from src.config import get_mongo_connection, get_redis_connection
-    import json
+    import pandas as pd
     
     _, _, mongo_col = get_mongo_connection()
     redis = get_redis_connection()
     
-    if not mongo_col or not redis:
+    if mongo_col is None or redis is None:
         print("❌ Error de conexión")
         return
     
-    # 1. Productos más comprados
+    # 1. Productos más comprados (hash join columnar eventos × catálogo)
     print("\n1️⃣  Top productos comprados:")
-    product_counts = {}
-    cart_keys = redis.keys("cart:CART-*")
-    
-    for key in cart_keys:
-        data = redis.hgetall(key)
-        try:
-            events = json.loads(data.get("events", "[]"))
-            for event in events:
-                if event.get("event_type") == "checkout":
-                    prod = event.get("product_id")
-                    product_counts[prod] = product_counts.get(prod, 0) + 1
-        except:
-            pass
-    
-    for prod, count in sorted(product_counts.items(), key=lambda x: x[1], reverse=True):
-        print(f"   {prod}: {count} ventas")
-    
+    from src.joins import fetch_cart_events_frame, fetch_catalog_frame, join_events_with_catalog
+    from src.sharding import close_cart_clients, get_cart_clients
+
+    cart_clients = get_cart_clients(redis)
+    events = fetch_cart_events_frame(cart_clients) if cart_clients is not None else pd.DataFrame()
+    if not events.empty:
+        # Mismo catálogo que el reporte: proyectado, sin product_id repetidos y con columnas aunque esté vacío
+        catalog = fetch_catalog_frame(mongo_col)
+        enriched, rollup = join_events_with_catalog(events, catalog)
+        checkouts = enriched[enriched["event_type"] == "checkout"]
+        for (prod, name), count in checkouts.groupby(["product_id", "product_name"]).size().sort_values(ascending=False).items():
+            print(f"   {prod} ({name[:40]}): {count} ventas")
+
+        print("\n   Ingresos por categoría (carritos):")
+        for category, row in rollup.head(10).iterrows():
+            print(f"   {category[:40]}: ${row['revenue']:.2f} ({int(row['checkouts'])} checkouts)")
+
     # 2. Ingresos por categoría
     print("\n2️⃣  Estadísticas por categoría:")
     pipeline = [
@@ -229,28 +191,41 @@ def cross_database_analysis():
         avg_price = doc["avg_price"]
         print(f"   {category}: {count} productos, ${avg_price:.2f} promedio")
     
-    redis.close()
+    close_cart_clients(cart_clients, redis)
+
 
+def main(trace: bool = False):
+    """Ejecuta todos los ejemplos (con trace=True reporta las llamadas a las bases de cada uno)."""
+    from src.metrics import set_stage
+    from src.tracing import enable_tracing, print_trace_report
 
-def main():
-    """Ejecuta todos los ejemplos."""
+    if trace:
+        enable_tracing()
+
+    set_stage("examples_mongo")
     try:
         mongodb_examples()
     except Exception as e:
         print(f"⚠️  Error en MongoDB: {e}")
     
+    set_stage("examples_redis")
     try:
         redis_examples()
     except Exception as e:
         print(f"⚠️  Error en Redis: {e}")
     
+    set_stage("examples_cross")
     try:
         cross_database_analysis()
     except Exception as e:
         print(f"⚠️  Error en análisis cruzado: {e}")
     
     print("\n" + "="*60 + "\n")
+    if trace:
+        print_trace_report()
 
 
 if __name__ == "__main__":
-    main()
+    import sys
+
+    main(trace="--trace" in sys.argv)
@@ -9,19 +9,28 @@ Flujo del pipeline:
 5. INTEGRATION → Análisis cruzado y métricas
 6. VISUALIZACIONES → Generar gráficos
 7. RESUMEN → Estadísticas finales
+
+Uso:
+    python main.py                 # pipeline completo (igual que `run`)
+    python main.py check           # solo verifica conexiones
+    python main.py [--timing] {extract,transform,load,report,viz,stream,consume,run}
+    python main.py check --timing  # --timing también se acepta después del subcomando
+    python main.py run --from load            # reanuda desde una etapa
+    python main.py run --only integration     # ejecuta solo algunas etapas
+    python main.py stream                     # extract/transform/load solapados (colas acotadas)
+
+Cada subcomando importa solo los módulos que necesita: `check` no carga
+pandas ni matplotlib, lo que lo hace apto para cron y healthchecks.
 """
 
+import time
+
+_START = time.perf_counter()
+
+import argparse
 import sys
 from datetime import datetime
 
-# Importar módulos del pipeline
-from src.extract import extract_all
-from src.config import get_mongo_connection, get_redis_connection
-from src.transform import transform_all, get_transformation_stats
-from src.load import load_all
-from src.integration import integration_all
-from src.visualizations import generate_all_visualizations
-
 def print_header(title: str):
     """Imprime encabezado formateado."""
     print("\n" + "=" * 70)
@@ -34,22 +43,16 @@ def print_footer():
     print("=" * 70 + "\n")
 
 
-def main():
-    """Ejecuta el pipeline ETL completo."""
-
-    print_header("PIPELINE ETL: CYBERDAY AMAZON CON MONGODB Y REDIS")
-    print(f"Inicio: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print_footer()
-
-    # ===== VERIFICAR CONEXIONES =====
-    print_header("VERIFICANDO CONEXIONES A BASES DE DATOS")
+def check_connections() -> bool:
+    """Verifica que MongoDB y Redis respondan."""
+    from src.config import get_mongo_connection, get_redis_connection
 
     print("[CONEXION] Verificando MongoDB...")
     mongo_client, mongo_db, mongo_col = get_mongo_connection()
     if mongo_client is None:
         print("[ERROR] No se pudo conectar a MongoDB")
         print("  Asegurate de ejecutar: mongod")
-        sys.exit(1)
+        return False
     mongo_client.close()
     print("[OK] MongoDB conectado exitosamente")
 
@@ -58,52 +61,188 @@ def main():
     if redis_client is None:
         print("[ERROR] No se pudo conectar a Redis")
         print("  Asegurate de ejecutar: redis-server")
-        sys.exit(1)
+        return False
     redis_client.close()
     print("[OK] Redis conectado exitosamente")
+    return True
 
-    print_footer()
 
-    # ===== ETAPA 1: EXTRACT =====
-    print_header("ETAPA 1: EXTRACT (Extraccion)")
-    amazon_df, redis_cart_df = extract_all()
+# Títulos y salidas guardadas de cada etapa (ver src/checkpoints.py)
+STAGE_TITLES = {
+    "extract": "ETAPA 1: EXTRACT (Extraccion)",
+    "transform": "ETAPA 2: TRANSFORM (Transformacion)",
+    "load": "ETAPA 3: LOAD (Carga a MongoDB y Redis)",
+    "integration": "ETAPA 4: INTEGRATION (Analisis Cruzado)",
+    "visualizations": "ETAPA 5: VISUALIZACIONES (Graficos)",
+}
+STAGE_OUTPUTS = {
+    "extract": ["amazon_df", "redis_cart_df"],
+    "transform": ["amazon_transformed", "cart_transformed"],
+    "integration": ["report"],
+}
+# Etapa cuya salida necesita cada etapa como entrada
+STAGE_INPUTS = {"transform": "extract", "load": "transform"}
+
+
+def _stage_extract(state: dict) -> bool:
+    from src.extract import extract_all
 
-    if amazon_df is None or redis_cart_df is None:
+    state["amazon_df"], state["redis_cart_df"] = extract_all()
+    if state["amazon_df"] is None or state["redis_cart_df"] is None:
         print("[ERROR] No se pudieron cargar los datos")
-        sys.exit(1)
+        return False
+    return True
 
-    print_footer()
 
-    # ===== ETAPA 2: TRANSFORM =====
-    print_header("ETAPA 2: TRANSFORM (Transformacion)")
-    amazon_transformed, cart_transformed = transform_all()
-    stats = get_transformation_stats(amazon_transformed, cart_transformed)
-    print_footer()
+def _stage_transform(state: dict) -> bool:
+    from src.transform import transform_all
 
-    # ===== ETAPA 3: LOAD =====
-    print_header("ETAPA 3: LOAD (Carga a MongoDB y Redis)")
-    load_success = load_all(amazon_transformed, cart_transformed, simulate_realtime=False)
+    state["amazon_transformed"], state["cart_transformed"] = transform_all(
+        state["amazon_df"], state["redis_cart_df"]
+    )
+    return state["amazon_transformed"] is not None and state["cart_transformed"] is not None
 
+
+def _stage_load(state: dict) -> bool:
+    from src.load import load_all
+
+    load_success = load_all(state["amazon_transformed"], state["cart_transformed"], simulate_realtime=False)
     if not load_success:
         print("[ADVERTENCIA] La carga no fue completamente exitosa")
         print("  Asegurate de que MongoDB y Redis esten ejecutandose")
+    return load_success
 
-    print_footer()
 
-    # ===== ETAPA 4: INTEGRATION =====
-    print_header("ETAPA 4: INTEGRATION (Analisis Cruzado)")
-    report = integration_all()
-    print_footer()
+def _stage_integration(state: dict) -> bool:
+    from src.integration import integration_all
+
+    # El embudo usa los eventos transformados si esta ejecución los tiene
+    state["report"] = integration_all(state.get("cart_transformed"), state.get("amazon_transformed"))
+    return True
+
+
+def _stage_visualizations(state: dict) -> bool:
+    from src.visualizations import generate_all_visualizations
 
-    # ===== ETAPA 5: VISUALIZACIONES =====
-    print_header("ETAPA 5: VISUALIZACIONES (Graficos)")
     try:
         generate_all_visualizations()
+        return True
     except Exception as e:
         print(f"[ADVERTENCIA] Error generando visualizaciones: {e}")
+        return False
+
+
+STAGE_RUNNERS = {
+    "extract": _stage_extract,
+    "transform": _stage_transform,
+    "load": _stage_load,
+    "integration": _stage_integration,
+    "visualizations": _stage_visualizations,
+}
+
+
+def select_stages(manifest: dict, from_stage: str = None, only: list = None) -> list:
+    """Etapas a ejecutar: subconjunto explícito, desde una etapa, o desde la primera incompleta."""
+    from src.checkpoints import STAGES, first_incomplete_stage
+
+    if only:
+        return [stage for stage in STAGES if stage in only]
+    if from_stage is None:
+        from_stage = first_incomplete_stage(manifest) or STAGES[0]
+        if from_stage != STAGES[0]:
+            print(f"[CHECKPOINT] Reanudando desde la etapa {from_stage}")
+    return STAGES[STAGES.index(from_stage):]
+
+
+def _ensure_inputs(stage: str, state: dict) -> bool:
+    """Carga desde checkpoint la salida de la etapa previa si no está en memoria."""
+    from src.checkpoints import load_stage_output
+
+    source = STAGE_INPUTS.get(stage)
+    if source is None or all(state.get(name) is not None for name in STAGE_OUTPUTS[source]):
+        return True
+    outputs = load_stage_output(source, STAGE_OUTPUTS[source])
+    if outputs is None:
+        print(f"[ERROR] No hay checkpoint de {source}; ejecuta esa etapa primero")
+        return False
+    state.update(outputs)
+    return True
+
+
+def main(from_stage: str = None, only: list = None, fresh: bool = False) -> bool:
+    """
+    Ejecuta el pipeline ETL. Por defecto reanuda desde la primera etapa
+    incompleta de la última ejecución; from_stage y only permiten elegir las
+    etapas y fresh=True ignora los checkpoints. Devuelve True si todas las
+    etapas ejecutadas terminaron bien.
+    """
+    from src.checkpoints import (
+        compute_input_hashes,
+        mark_stage,
+        new_manifest,
+        open_run,
+        save_manifest,
+        save_stage_output,
+    )
+    from src.metrics import set_stage, timed
+    from src.transform import get_transformation_stats
+
+    print_header("PIPELINE ETL: CYBERDAY AMAZON CON MONGODB Y REDIS")
+    print(f"Inicio: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print_footer()
 
+    # ===== VERIFICAR CONEXIONES =====
+    print_header("VERIFICANDO CONEXIONES A BASES DE DATOS")
+    if not check_connections():
+        sys.exit(1)
+    print_footer()
+
+    input_hashes = compute_input_hashes()
+    if fresh:
+        manifest = new_manifest(input_hashes)
+        save_manifest(manifest)
+    else:
+        manifest = open_run(input_hashes)
+    stages = select_stages(manifest, from_stage, only)
+    print(f"[CHECKPOINT] Ejecución {manifest['run_id']}: {', '.join(stages)}")
+
+    # ===== ETAPAS =====
+    state = {}
+    failed = []
+    for stage in stages:
+        print_header(STAGE_TITLES[stage])
+        if not _ensure_inputs(stage, state):
+            mark_stage(manifest, stage, "failed", error="checkpoint de entrada no disponible")
+            sys.exit(1)
+
+        set_stage(stage)
+        started = time.perf_counter()
+        try:
+            with timed("stage"):
+                ok = STAGE_RUNNERS[stage](state)
+        except Exception as e:
+            mark_stage(manifest, stage, "failed", time.perf_counter() - started, str(e))
+            print(f"[ERROR] Etapa {stage} falló: {e}")
+            sys.exit(1)
+        elapsed = time.perf_counter() - started
+
+        if ok:
+            if stage in STAGE_OUTPUTS:
+                save_stage_output(stage, {name: state.get(name) for name in STAGE_OUTPUTS[stage]})
+            mark_stage(manifest, stage, "completed", elapsed)
+        else:
+            mark_stage(manifest, stage, "failed", elapsed)
+            failed.append(stage)
+            if stage in ("extract", "transform"):
+                sys.exit(1)
+        print(f"[CHECKPOINT] {stage}: {'completada' if ok else 'fallida'} en {elapsed:.2f} s")
+        print_footer()
+
     # ===== RESUMEN FINAL =====
+    if not _ensure_inputs("load", state):
+        return not failed
+    stats = get_transformation_stats(state["amazon_transformed"], state["cart_transformed"])
+
     print_header("RESUMEN DEL PIPELINE")
     print(f"Productos Amazon: {stats['products']['total']}")
     print(f"Categorias: {stats['products']['categories']}")
@@ -116,8 +255,231 @@ def main():
     print(f"Timestamp: {stats['timestamp']}")
     print_footer()
 
+    if failed:
+        print(f"Pipeline terminado con etapas fallidas: {', '.join(failed)}")
+        return False
     print("Pipeline completado exitosamente")
+    return True
+
+
+# ===== CLI =====
+
+def _cmd_check(args) -> int:
+    return 0 if check_connections() else 1
+
+
+def _cmd_extract(args) -> int:
+    from src.extract import extract_all
+
+    amazon_df, redis_cart_df = extract_all()
+    return 0 if amazon_df is not None and redis_cart_df is not None else 1
+
+
+def _cmd_transform(args) -> int:
+    from src.transform import transform_all
+
+    amazon_df, cart_df = transform_all()
+    return 0 if amazon_df is not None and cart_df is not None else 1
+
+
+def _cmd_load(args) -> int:
+    if args.incremental:
+        from src.incremental import ingest_incremental
+
+        return 0 if ingest_incremental(store_history=args.history) is not None else 1
+
+    from src.load import load_all
+
+    return 0 if load_all(simulate_realtime=args.realtime, store_history=args.history) else 1
+
+
+def _cmd_report(args) -> int:
+    from src.integration import integration_all
+
+    if not args.funnel:
+        integration_all()
+        return 0
+
+    # El embudo necesita los eventos transformados: checkpoint si existe, si no se transforma
+    from src.checkpoints import load_stage_output
+
+    outputs = load_stage_output("transform", STAGE_OUTPUTS["transform"])
+    if outputs is None:
+        from src.transform import transform_all
+
+        amazon_transformed, cart_transformed = transform_all()
+    else:
+        amazon_transformed, cart_transformed = outputs["amazon_transformed"], outputs["cart_transformed"]
+    integration_all(cart_transformed, amazon_transformed)
+    return 0
+
+
+def _cmd_viz(args) -> int:
+    from src.visualizations import generate_all_visualizations
+
+    generate_all_visualizations(parallel=not args.serial, force=args.force)
+    return 0
+
+
+def _cmd_stream(args) -> int:
+    from src.stream_etl import run_streaming_pipeline
+
+    print_header("PIPELINE EN STREAMING (EXTRACT → TRANSFORM → LOAD SOLAPADOS)")
+    summary = run_streaming_pipeline(
+        chunksize=args.chunk_size, queue_depth=args.queue_depth, transform_workers=args.workers
+    )
+    return 0 if summary is not None else 1
+
+
+def _cmd_consume(args) -> int:
+    from src.streaming import get_live_report, run_stream_consumer
+
+    print_header("CONSUMIDOR DEL STREAM DE CARRITOS (INTEGRATION EN VIVO)")
+    try:
+        run_stream_consumer(consumer_name=args.consumer, max_batches=args.max_batches)
+    except RuntimeError as e:
+        print(f"[ERROR] {e}")
+        return 1
+    if args.report:
+        get_live_report()
+    return 0
+
+
+def _cmd_run(args) -> int:
+    ok = main(
+        from_stage=getattr(args, "from_stage", None),
+        only=getattr(args, "only", None),
+        fresh=getattr(args, "fresh", False),
+    )
+    return 0 if ok else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Construye el parser de la CLI con un subcomando por etapa."""
+    parser = argparse.ArgumentParser(description="Pipeline ETL Cyberday (MongoDB + Redis)")
+    parser.add_argument("--timing", action="store_true", help="Muestra el tiempo total del comando")
+    # --timing también después del subcomando (SUPPRESS: no pisa el valor global si no se pasa)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--timing", action="store_true", default=argparse.SUPPRESS, help="Muestra el tiempo total del comando")
+    parser.add_argument(
+        "--trace", action="store_true",
+        help="Traza las llamadas a MongoDB y Redis y reporta N+1 y llamadas lentas al final",
+    )
+    parser.add_argument(
+        "--metrics", action="store_true",
+        help="Expone /metrics en METRICS_PORT y al terminar escribe METRICS_TEXTFILE",
+    )
+    parser.add_argument(
+        "--metrics-port", type=int, metavar="PORT",
+        help="Expone /metrics (Prometheus) en este puerto mientras corre el comando",
+    )
+    parser.add_argument(
+        "--metrics-file", metavar="PATH",
+        help="Al terminar escribe las métricas en este archivo .prom (textfile collector)",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    for name, help_text, func in (
+        ("check", "Verifica conexiones a MongoDB y Redis", _cmd_check),
+        ("extract", "Lee los CSV crudos", _cmd_extract),
+        ("transform", "Limpia y transforma los datos", _cmd_transform),
+    ):
+        subparsers.add_parser(name, parents=[common], help=help_text).set_defaults(func=func)
+
+    load_parser = subparsers.add_parser("load", parents=[common], help="Carga MongoDB y Redis")
+    load_parser.add_argument("--realtime", action="store_true", help="Simula los eventos en tiempo real")
+    load_parser.add_argument(
+        "--incremental", action="store_true", help="Carga solo los eventos nuevos de data/raw (sin flushdb)"
+    )
+    load_parser.add_argument(
+        "--history", action="store_true", help="Guarda también los eventos en la colección time-series de MongoDB"
+    )
+    load_parser.set_defaults(func=_cmd_load)
+
+    report_parser = subparsers.add_parser("report", parents=[common], help="Enriquecimiento y reporte del Cyberday")
+    report_parser.add_argument("--funnel", action="store_true", help="Incluye el embudo de conversión por categoría")
+    report_parser.set_defaults(func=_cmd_report)
+
+    viz_parser = subparsers.add_parser("viz", parents=[common], help="Genera los gráficos")
+    viz_parser.add_argument("--force", action="store_true", help="Renderiza aunque los datos no cambien")
+    viz_parser.add_argument("--serial", action="store_true", help="Renderiza sin pool de procesos")
+    viz_parser.set_defaults(func=_cmd_viz)
+
+    from src.config import EXTRACT_CHUNK_SIZE, STREAM_QUEUE_DEPTH, STREAM_TRANSFORM_WORKERS
+
+    stream_parser = subparsers.add_parser(
+        "stream", parents=[common], help="Extract, transform y load solapados con colas acotadas (carga completa)"
+    )
+    stream_parser.add_argument("--workers", type=int, default=STREAM_TRANSFORM_WORKERS, help="Hilos de transformación")
+    stream_parser.add_argument("--queue-depth", type=int, default=STREAM_QUEUE_DEPTH, help="Bloques por cola")
+    stream_parser.add_argument("--chunk-size", type=int, default=EXTRACT_CHUNK_SIZE, help="Filas por bloque")
+    stream_parser.set_defaults(func=_cmd_stream)
+
+    consume_parser = subparsers.add_parser(
+        "consume", parents=[common], help="Consume el stream de eventos de carrito y actualiza las métricas en vivo"
+    )
+    consume_parser.add_argument("--consumer", default="consumer-1", help="Nombre dentro del grupo de consumidores")
+    consume_parser.add_argument("--max-batches", type=int, help="Se detiene tras N micro-lotes (por defecto no para)")
+    consume_parser.add_argument("--report", action="store_true", help="Al terminar genera el reporte con las métricas en vivo")
+    consume_parser.set_defaults(func=_cmd_consume)
+
+    # Etapas de src/checkpoints.STAGES (mismo orden); no se importa acá para que construir la CLI sea liviano
+    stages = list(STAGE_TITLES)
+    run_parser = subparsers.add_parser("run", parents=[common], help="Pipeline completo (reanuda desde checkpoints)")
+    stage_group = run_parser.add_mutually_exclusive_group()
+    stage_group.add_argument("--from", dest="from_stage", choices=stages, help="Ejecuta desde esta etapa")
+    stage_group.add_argument("--only", nargs="+", choices=stages, help="Ejecuta solo estas etapas")
+    run_parser.add_argument("--fresh", action="store_true", help="Ignora los checkpoints previos")
+    run_parser.set_defaults(func=_cmd_run)
+    return parser
+
+
+def cli(argv=None) -> int:
+    """Punto de entrada de la CLI; sin subcomando ejecuta el pipeline completo."""
+    args = build_parser().parse_args(argv)
+    func = getattr(args, "func", _cmd_run)
+    if args.metrics and args.metrics_port is None:
+        from src.config import METRICS_PORT
+
+        args.metrics_port = METRICS_PORT
+    if args.metrics and args.metrics_file is None:
+        from src.config import METRICS_TEXTFILE
+
+        args.metrics_file = METRICS_TEXTFILE
+    if args.metrics_port is not None:
+        from src.metrics import start_metrics_server
+
+        start_metrics_server(args.metrics_port)
+    if args.trace:
+        from src.metrics import set_stage
+        from src.tracing import enable_tracing
+
+        set_stage(args.command or "run")
+        enable_tracing()
+
+    # El reporte de trazas y el archivo de métricas se escriben también si el comando falla
+    code = 1
+    try:
+        code = func(args)
+    except SystemExit as e:
+        code = e.code
+    finally:
+        if args.trace:
+            from src.tracing import print_trace_report
+
+            print_trace_report()
+
+        if args.metrics_file is not None:
+            from src.metrics import write_textfile
+
+            write_textfile(args.metrics_file)
+
+    if args.timing:
+        heavy = [m for m in ("pandas", "pymongo", "redis", "matplotlib", "seaborn") if m in sys.modules]
+        print(f"[CLI] {args.command or 'run'} en {(time.perf_counter() - _START) * 1000:.0f} ms "
+              f"(módulos cargados: {', '.join(heavy) or 'ninguno pesado'})")
+    return code
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(cli())
\ No newline at end of file
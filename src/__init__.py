@@ -3,13 +3,19 @@ Pipeline ETL: Cyberday con MongoDB y Redis
 Módulo principal del ETL
 """
 
+import importlib
+
 __version__ = "1.0.0"
 __author__ = "ETL Pipeline"
 
-from src.extract import extract_all
-from src.transform import transform_all
-from src.load import load_all
-from src.integration import integration_all
+# Las etapas se importan de forma diferida (PEP 562): `import src` no carga
+# pandas, pymongo, redis ni matplotlib hasta que se usa una etapa.
+_LAZY_EXPORTS = {
+    "extract_all": "src.extract",
+    "transform_all": "src.transform",
+    "load_all": "src.load",
+    "integration_all": "src.integration",
+}
 
 __all__ = [
     "extract_all",
@@ -17,3 +23,15 @@ __all__ = [
     "load_all",
     "integration_all",
 ]
+
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        value = getattr(importlib.import_module(_LAZY_EXPORTS[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,131 @@
+"""
+Checkpoints del pipeline: cada etapa guarda su salida en data/checkpoints y un
+manifiesto (manifest.json) registra los hashes de los archivos de entrada y el
+estado de cada etapa. Así una ejecución fallida puede reanudarse desde la
+primera etapa incompleta sin volver a extraer ni recargar las bases de datos.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from src.config import AMAZON_CSV, CHECKPOINT_DIR, REDIS_CART_CSV
+from src.metrics import record_bytes
+
+STAGES = ["extract", "transform", "load", "integration", "visualizations"]
+MANIFEST_FILE = f"{CHECKPOINT_DIR}/manifest.json"
+
+
+def hash_file(path_str: str) -> Optional[str]:
+    """SHA-256 de un archivo leído por bloques (None si no existe)."""
+    path = Path(path_str)
+    if not path.is_file():
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def compute_input_hashes() -> dict:
+    """Hashes de los datasets crudos que alimentan el pipeline."""
+    return {path: hash_file(path) for path in (AMAZON_CSV, REDIS_CART_CSV)}
+
+
+def new_manifest(input_hashes: dict) -> dict:
+    """Crea un manifiesto vacío para una nueva ejecución."""
+    return {
+        "run_id": uuid.uuid4().hex[:12],
+        "created_at": datetime.utcnow().isoformat(),
+        "input_hashes": input_hashes,
+        "stages": {stage: {"status": "pending"} for stage in STAGES},
+    }
+
+
+def load_manifest() -> Optional[dict]:
+    """Lee el manifiesto de la última ejecución."""
+    try:
+        with open(MANIFEST_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(manifest: dict):
+    """Guarda el manifiesto de forma atómica."""
+    Path(MANIFEST_FILE).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{MANIFEST_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(tmp_path, MANIFEST_FILE)
+
+
+def open_run(input_hashes: dict) -> dict:
+    """
+    Reutiliza el manifiesto anterior si las entradas no cambiaron; si cambiaron
+    (o no existe) inicia una ejecución nueva y descarta los checkpoints.
+    """
+    manifest = load_manifest()
+    if manifest is None or manifest.get("input_hashes") != input_hashes:
+        if manifest is not None:
+            print("[CHECKPOINT] Los datos de entrada cambiaron, se inicia una ejecución nueva")
+        manifest = new_manifest(input_hashes)
+        save_manifest(manifest)
+    return manifest
+
+
+def first_incomplete_stage(manifest: dict) -> Optional[str]:
+    """Primera etapa no completada (None si todas terminaron)."""
+    for stage in STAGES:
+        if manifest["stages"].get(stage, {}).get("status") != "completed":
+            return stage
+    return None
+
+
+def mark_stage(manifest: dict, stage: str, status: str, duration: float = None, error: str = None):
+    """Actualiza el estado de una etapa; al completar una etapa las siguientes quedan pendientes."""
+    entry = {"status": status, "updated_at": datetime.utcnow().isoformat()}
+    if duration is not None:
+        entry["duration_s"] = round(duration, 3)
+    if error:
+        entry["error"] = error
+    manifest["stages"][stage] = entry
+
+    if status == "completed":
+        # Las etapas posteriores dependen de esta salida: deben volver a ejecutarse
+        for later in STAGES[STAGES.index(stage) + 1:]:
+            manifest["stages"][later] = {"status": "pending"}
+    save_manifest(manifest)
+
+
+def save_stage_output(stage: str, outputs: dict):
+    """Guarda los DataFrames de salida de una etapa (pickle, escritura atómica)."""
+    stage_dir = Path(CHECKPOINT_DIR) / stage
+    stage_dir.mkdir(parents=True, exist_ok=True)
+    for name, df in outputs.items():
+        if df is None:
+            continue
+        path = stage_dir / f"{name}.pkl"
+        tmp_path = stage_dir / f"{name}.pkl.tmp"
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+        record_bytes("checkpoint", path)
+
+
+def load_stage_output(stage: str, names: list) -> Optional[dict]:
+    """Carga los DataFrames guardados por una etapa (None si falta alguno)."""
+    import pandas as pd
+
+    outputs = {}
+    for name in names:
+        path = Path(CHECKPOINT_DIR) / stage / f"{name}.pkl"
+        if not path.is_file():
+            return None
+        outputs[name] = pd.read_pickle(path)
+    print(f"[CHECKPOINT] Salida de {stage} cargada desde {Path(CHECKPOINT_DIR) / stage}")
+    return outputs
@@ -2,20 +2,35 @@
 Configuracion centralizada para MongoDB, Redis y rutas del dataset de Flipkart.
 """
 
-from pymongo import MongoClient
-import redis
+# pymongo y redis se importan dentro de las funciones de conexion para que
+# importar solo las constantes de configuracion sea instantaneo (CLI, cron).
 
 # ===== CONFIGURACION MONGODB =====
 # Aca se guardan los datos de productos ya limpios
 MONGO_URI = "mongodb://localhost:27017/"
 MONGO_DB = "amazon_db"
 MONGO_COLLECTION = "amazon_products"
+# Tiempo maximo para encontrar el servidor (healthchecks rapidos)
+MONGO_SERVER_TIMEOUT_MS = 5000
+# Historial de eventos de carrito (colección time-series, opcional)
+MONGO_EVENTS_COLLECTION = "cart_events"
+STORE_CART_EVENT_HISTORY = False
+EVENTS_GRANULARITY = "minutes"
+EVENTS_INSERT_BATCH = 5_000
 
 
 def get_mongo_connection(collection_name: str = MONGO_COLLECTION):
     """Obtiene conexion a MongoDB (coleccion elegible)."""
+    from pymongo import MongoClient
+
+    from src.tracing import mongo_event_listeners
+
     try:
-        client = MongoClient(MONGO_URI)
+        client = MongoClient(
+            MONGO_URI,
+            serverSelectionTimeoutMS=MONGO_SERVER_TIMEOUT_MS,
+            event_listeners=mongo_event_listeners(),
+        )
         db = client[MONGO_DB]
         collection = db[collection_name]
 
@@ -32,10 +47,16 @@ def get_mongo_connection(collection_name: str = MONGO_COLLECTION):
 REDIS_HOST = "localhost"
 REDIS_PORT = 6379
 REDIS_DB = 0
+# Sharding del keyspace cart:* (hashing consistente). Vacío = una sola
+# instancia (REDIS_HOST/REDIS_PORT). Ejemplo: [("localhost", 7001), ("localhost", 7002)]
+REDIS_SHARDS = []
+REDIS_SHARD_VNODES = 160      # Nodos virtuales por shard en el anillo
 
 
 def get_redis_connection():
     """Obtiene conexion a Redis."""
+    import redis
+
     try:
         r = redis.Redis(
             host=REDIS_HOST,
@@ -47,16 +68,70 @@ def get_redis_connection():
         r.ping()  # Probar conexion
         print("Conectado a Redis")
 
-        return r
+        from src.tracing import trace_redis
+
+        return trace_redis(r)
     except Exception as e:
         print(f"Error conectando a Redis: {e}")
         return None
 
 
+# ===== METRICAS POR MINUTO =====
+# Retencion de los buckets por minuto en Redis (segundos)
+METRICS_RETENTION_SECONDS = 7 * 24 * 3600
+
+
+# ===== STREAMING (INTEGRATION CONTINUA) =====
+STREAM_BATCH_SIZE = 200       # Eventos por micro-lote (XREADGROUP COUNT)
+STREAM_BLOCK_MS = 1000        # Espera maxima de XREADGROUP
+STREAM_MAX_IN_FLIGHT = 8      # Micro-lotes en cola antes de aplicar backpressure
+STREAM_MAXLEN = 100_000       # Longitud aproximada maxima del stream
+
+
+# ===== METRICAS PROMETHEUS =====
+METRICS_ENABLED = True                     # Contadores e histogramas en memoria
+METRICS_TEXTFILE = "data/metrics/etl.prom"  # Salida para el textfile collector
+METRICS_PORT = 9108                        # Puerto de `--metrics` (`--metrics-port` lo cambia)
+
+# ===== TRAZAS DE LLAMADAS A LAS BASES =====
+TRACE_DB_CALLS = False        # También se activa con `python main.py --trace`
+TRACE_SLOW_MS = 100           # Llamadas más lentas que esto se reportan
+TRACE_N_PLUS_ONE_MIN = 20     # Repeticiones seguidas de la misma forma que cuentan como N+1
+
+
+# ===== STOCK (WRITE-BEHIND REDIS -> MONGODB) =====
+DEFAULT_STOCK = 100           # Stock inicial de cada producto
+STOCK_FLUSH_INTERVAL = 1.0    # Ventana (segundos) para agrupar descuentos antes del bulk_write
+
+
+# ===== DEDUPLICACION DE PRODUCTOS =====
+# Regla para elegir el registro ganador por product_id:
+# "first", "last", "max_rating_count" o "max_rating" (ver src/dedup.py)
+DEDUP_RULE = "first"
+EXTRACT_CHUNK_SIZE = 50_000   # Filas por bloque al leer en modo streaming
+
+
+# ===== PIPELINE EN STREAMING (`python main.py stream`) =====
+STREAM_QUEUE_DEPTH = 4          # Bloques como máximo en cada cola entre etapas
+STREAM_TRANSFORM_WORKERS = 2    # Hilos de transformación
+STREAM_MONGO_LOADERS = 2        # Hilos que cargan productos en MongoDB
+STREAM_REDIS_LOADERS = 2        # Hilos que cargan carritos en Redis (cada uno dueño de una partición de cart_id)
+
+
 # ===== RUTAS DE ARCHIVOS =====
 AMAZON_CSV = "data/raw/amazon.csv"
 REDIS_CART_CSV = "data/raw/redis_cart_sim.csv"
 PROCESSED_CSV = "data/processed/amazon_processed.csv"
+CHECKPOINT_DIR = "data/checkpoints"
+QUARANTINE_DIR = "data/quarantine"
+# Ingesta incremental: archivos de eventos de carrito y offsets ya procesados
+CART_EVENTS_GLOB = "data/raw/*cart*.csv"
+INGEST_STATE_FILE = "data/state/ingest_offsets.json"
+INGEST_CHUNK_SIZE = 50_000                 # Filas nuevas por lote (cada lote guarda su offset)
+INGEST_BATCH_RETENTION = 7 * 24 * 3600     # Segundos que se recuerda un lote aplicado (reintentos)
+# Carga de productos a MongoDB por lotes numerados (se reanuda desde el último confirmado)
+MONGO_LOAD_BATCH_SIZE = 1_000
+MONGO_LOAD_PROGRESS_FILE = "data/state/mongo_load_progress.json"
 
 if __name__ == "__main__":
     print("Probando configuracion...")
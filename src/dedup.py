@@ -0,0 +1,97 @@
+"""
+Deduplicación de productos por product_id.
+
+El dataset de Amazon trae una fila por reseña, así que un mismo product_id se
+repite muchas veces. Las claves se reducen a un hash de 64 bits
+(pd.util.hash_pandas_object) y la deduplicación es vectorizada, tanto sobre
+un DataFrame completo como por bloques (streaming) con un conjunto de hashes
+vistos compacto (np.ndarray ordenado de uint64, 8 bytes por producto).
+"""
+
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.config import DEDUP_RULE
+
+KEY_COLUMN = "product_id"
+
+# Regla -> (columna de orden, ascendente). None = orden de llegada.
+DEDUP_RULES = {
+    "first": None,  # primera aparición
+    "last": None,  # última aparición
+    "max_rating_count": ("rating_count", False),  # registro con más reseñas
+    "max_rating": ("rating", False),  # registro con mejor rating
+}
+
+
+def _key_hashes(df: pd.DataFrame) -> np.ndarray:
+    """Hash uint64 de product_id para cada fila."""
+    return pd.util.hash_pandas_object(df[KEY_COLUMN].astype(str), index=False).to_numpy()
+
+
+def _pick_winners(df: pd.DataFrame, hashes: np.ndarray, rule: str) -> pd.DataFrame:
+    """Deja una fila por hash según la regla (vectorizado, conserva el orden original)."""
+    if rule not in DEDUP_RULES:
+        raise ValueError(f"Regla de deduplicación desconocida: {rule} (opciones: {list(DEDUP_RULES)})")
+
+    keys = pd.Series(hashes, index=df.index)
+    if rule == "first":
+        return df[~keys.duplicated(keep="first")]
+    if rule == "last":
+        return df[~keys.duplicated(keep="last")]
+
+    column, ascending = DEDUP_RULES[rule]
+    order = df[column].sort_values(ascending=ascending, kind="stable").index
+    winners = ~keys.loc[order].duplicated(keep="first")
+    return df.loc[order[winners.to_numpy()]].sort_index()
+
+
+def deduplicate_products(df: Optional[pd.DataFrame], rule: str = DEDUP_RULE) -> Optional[pd.DataFrame]:
+    """Colapsa las filas repetidas por product_id en un DataFrame completo."""
+    if df is None or df.empty:
+        return df
+
+    deduped = _pick_winners(df, _key_hashes(df), rule)
+    removed = len(df) - len(deduped)
+    print(f"[TRANSFORM] Deduplicación ({rule}): {removed} filas repetidas eliminadas, {len(deduped)} productos únicos")
+    return deduped
+
+
+def deduplicate_product_chunks(chunks: Iterable[pd.DataFrame], rule: str = DEDUP_RULE) -> Iterator[pd.DataFrame]:
+    """
+    Deduplica un flujo de bloques. Con la regla "first" cada bloque se emite
+    apenas llega, filtrado contra el conjunto de hashes ya vistos. Las demás
+    reglas necesitan ver todos los bloques: se conserva solo el ganador
+    actual de cada producto (memoria proporcional a productos únicos, no a
+    filas) y se emite al final.
+    """
+    seen = set()  # hashes ya emitidos: inserción y búsqueda O(1), sin reordenar en cada bloque
+    winners = None
+    total_in = 0
+    total_out = 0
+
+    for chunk in chunks:
+        if chunk is None or chunk.empty:
+            continue
+        total_in += len(chunk)
+
+        if rule == "first":
+            hashes = _key_hashes(chunk)
+            unseen = np.fromiter((h not in seen for h in hashes.tolist()), dtype=bool, count=len(hashes))
+            fresh = ~pd.Series(hashes).duplicated().to_numpy() & unseen
+            seen.update(hashes[fresh].tolist())
+            out = chunk[fresh]
+            total_out += len(out)
+            if not out.empty:
+                yield out
+        else:
+            combined = chunk if winners is None else pd.concat([winners, chunk], ignore_index=True)
+            winners = _pick_winners(combined, _key_hashes(combined), rule).reset_index(drop=True)
+
+    if winners is not None:
+        total_out = len(winners)
+        yield winners
+
+    print(f"[TRANSFORM] Deduplicación por bloques ({rule}): {total_in} filas -> {total_out} productos únicos")
@@ -0,0 +1,220 @@
+"""
+Historial de eventos de carrito en una colección time-series de MongoDB.
+
+Redis guarda los eventos como JSON dentro de cada hash cart:<id> y se vacía
+en cada carga completa. Esta colección conserva el historial: event_time es
+el campo de tiempo y {cart_id, product_id} la metadata, así MongoDB agrupa
+los eventos en buckets comprimidos y los rangos de fechas se resuelven sin
+tocar Redis.
+
+Los eventos se insertan en lotes (insert_many sin orden). Las consultas de
+ventanas usan $dateTrunc (MongoDB >= 5.0).
+"""
+
+from datetime import datetime
+from typing import Optional
+
+import pandas as pd
+
+from src.config import (
+    EVENTS_GRANULARITY,
+    EVENTS_INSERT_BATCH,
+    MONGO_EVENTS_COLLECTION,
+    get_mongo_connection,
+)
+from src.metrics import record_roundtrip
+
+
+def ensure_events_collection(db):
+    """Crea la colección time-series (y su índice por producto) si no existe."""
+    if MONGO_EVENTS_COLLECTION not in db.list_collection_names():
+        db.create_collection(
+            MONGO_EVENTS_COLLECTION,
+            timeseries={"timeField": "event_time", "metaField": "meta", "granularity": EVENTS_GRANULARITY},
+        )
+        print(f"[HISTORY] Colección time-series '{MONGO_EVENTS_COLLECTION}' creada")
+    collection = db[MONGO_EVENTS_COLLECTION]
+    collection.create_index([("meta.product_id", 1), ("event_time", 1)])
+    return collection
+
+
+def _event_documents(df: pd.DataFrame) -> list:
+    """Convierte los eventos transformados en documentos (vectorizado por columna)."""
+    docs = pd.DataFrame({
+        "event_time": pd.to_datetime(df["event_time"]),
+        "cart_id": df["cart_id"].astype(str),
+        "product_id": df["product_id"].astype(str),
+        "customer_id": df["customer_id"].astype(str),
+        "event_type": df["event_type"].astype(str),
+        "quantity": df["quantity"].astype(int),
+        "revenue": df["revenue"].astype(float),
+        "lost_revenue": df["lost_revenue"].astype(float),
+    })
+    docs = docs[docs["event_time"].notna()]
+    return [
+        {
+            "event_time": record["event_time"].to_pydatetime(),
+            "meta": {"cart_id": record["cart_id"], "product_id": record["product_id"]},
+            "customer_id": record["customer_id"],
+            "event_type": record["event_type"],
+            "quantity": record["quantity"],
+            "revenue": record["revenue"],
+            "lost_revenue": record["lost_revenue"],
+        }
+        for record in docs.to_dict("records")
+    ]
+
+
+def load_cart_events_to_mongodb(df: pd.DataFrame, replace_carts: bool = True, batch_size: int = EVENTS_INSERT_BATCH) -> bool:
+    """
+    Inserta los eventos de carrito en la colección time-series.
+
+    Con replace_carts=True primero se borran los eventos de los carritos
+    incluidos en df (recargar el mismo archivo no duplica el historial, el de
+    otros días se conserva). La ingesta incremental usa replace_carts=False
+    porque solo trae eventos nuevos.
+    """
+    if df is None or df.empty:
+        print("[HISTORY] No hay eventos para el historial")
+        return True
+
+    try:
+        client, db, _ = get_mongo_connection()
+        if db is None:
+            return False
+
+        collection = ensure_events_collection(db)
+        if replace_carts:
+            cart_ids = df["cart_id"].astype(str).unique().tolist()
+            deleted = collection.delete_many({"meta.cart_id": {"$in": cart_ids}}).deleted_count
+            if deleted:
+                print(f"[HISTORY] {deleted} eventos previos de {len(cart_ids)} carritos reemplazados")
+
+        docs = _event_documents(df)
+        inserted = 0
+        for start in range(0, len(docs), batch_size):
+            result = collection.insert_many(docs[start:start + batch_size], ordered=False)
+            record_roundtrip("mongo", "insert_many", batch_size=len(result.inserted_ids))
+            inserted += len(result.inserted_ids)
+
+        print(f"[HISTORY] {inserted} eventos guardados en '{MONGO_EVENTS_COLLECTION}' (lotes de {batch_size})")
+        client.close()
+        return True
+
+    except Exception as e:
+        print(f"[HISTORY] Error guardando el historial de eventos: {e}")
+        return False
+
+
+# ===== CONSULTAS POR VENTANAS =====
+
+def _time_match(start, end) -> dict:
+    """Filtro de rango sobre event_time (usa los buckets de la colección)."""
+    return {"event_time": {"$gte": pd.Timestamp(start).to_pydatetime(), "$lt": pd.Timestamp(end).to_pydatetime()}}
+
+
+def build_window_pipeline(start, end, unit: str = "hour", bin_size: int = 1) -> list:
+    """Eventos, ingresos y conversión por ventana de tiempo y tipo de evento."""
+    return [
+        {"$match": _time_match(start, end)},
+        {"$group": {
+            "_id": {
+                "window": {"$dateTrunc": {"date": "$event_time", "unit": unit, "binSize": bin_size}},
+                "event_type": "$event_type",
+            },
+            "events": {"$sum": 1},
+            "revenue": {"$sum": "$revenue"},
+            "lost_revenue": {"$sum": "$lost_revenue"},
+        }},
+        {"$group": {
+            "_id": "$_id.window",
+            "by_type": {"$push": {"k": "$_id.event_type", "v": "$events"}},
+            "events": {"$sum": "$events"},
+            "revenue": {"$sum": "$revenue"},
+            "lost_revenue": {"$sum": "$lost_revenue"},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+def build_product_window_pipeline(start, end, top_n: int = 10) -> list:
+    """Productos con más actividad en el rango (agrupado por la metadata)."""
+    return [
+        {"$match": _time_match(start, end)},
+        {"$group": {
+            "_id": "$meta.product_id",
+            "events": {"$sum": 1},
+            "checkouts": {"$sum": {"$cond": [{"$eq": ["$event_type", "checkout"]}, 1, 0]}},
+            "abandons": {"$sum": {"$cond": [{"$eq": ["$event_type", "abandon"]}, 1, 0]}},
+            "revenue": {"$sum": "$revenue"},
+            "lost_revenue": {"$sum": "$lost_revenue"},
+        }},
+        {"$sort": {"events": -1}},
+        {"$limit": top_n},
+    ]
+
+
+def get_event_windows(start, end, unit: str = "hour", bin_size: int = 1, collection=None) -> Optional[pd.DataFrame]:
+    """Serie por ventana: una fila por ventana con conteos por tipo de evento e ingresos."""
+    client = None
+    try:
+        if collection is None:
+            client, db, _ = get_mongo_connection()
+            if db is None:
+                return None
+            collection = db[MONGO_EVENTS_COLLECTION]
+
+        rows = []
+        for window in collection.aggregate(build_window_pipeline(start, end, unit, bin_size)):
+            row = {
+                "window": window["_id"],
+                "events": window["events"],
+                "revenue": round(window["revenue"], 2),
+                "lost_revenue": round(window["lost_revenue"], 2),
+            }
+            row.update({item["k"]: item["v"] for item in window["by_type"]})
+            rows.append(row)
+
+        series = pd.DataFrame(rows)
+        if not series.empty:
+            for event_type in ("add", "checkout", "abandon"):
+                if event_type not in series:
+                    series[event_type] = 0
+            series = series.fillna(0)
+            series["conversion_rate"] = (series["checkout"] / series["add"].where(series["add"] > 0)).fillna(0).round(4)
+        return series
+
+    except Exception as e:
+        print(f"[HISTORY] Error consultando ventanas de eventos: {e}")
+        return None
+    finally:
+        if client is not None:
+            client.close()
+
+
+def get_top_products_in_range(start, end, top_n: int = 10, collection=None) -> list:
+    """Top de productos por actividad en un rango de fechas."""
+    client = None
+    try:
+        if collection is None:
+            client, db, _ = get_mongo_connection()
+            if db is None:
+                return []
+            collection = db[MONGO_EVENTS_COLLECTION]
+        return list(collection.aggregate(build_product_window_pipeline(start, end, top_n)))
+
+    except Exception as e:
+        print(f"[HISTORY] Error consultando productos por rango: {e}")
+        return []
+    finally:
+        if client is not None:
+            client.close()
+
+
+if __name__ == "__main__":
+    from src.extract import load_redis_cart_simulation
+    from src.transform import transform_redis_carts
+
+    events = transform_redis_carts(load_redis_cart_simulation())
+    if load_cart_events_to_mongodb(events):
+        print(get_event_windows(events["event_time"].min(), datetime.utcnow()))
@@ -4,10 +4,11 @@ Para ETL con MongoDB (catálogo) y Redis (carritos en tiempo real).
 """
 
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Iterator, Optional, Tuple
 import pandas as pd
 
-from src.config import AMAZON_CSV, REDIS_CART_CSV
+from src.config import AMAZON_CSV, EXTRACT_CHUNK_SIZE, REDIS_CART_CSV
+from src.metrics import record_rows, timed
 
 
 def _load_csv(path_str: str) -> Optional[pd.DataFrame]:
@@ -17,7 +18,9 @@ def _load_csv(path_str: str) -> Optional[pd.DataFrame]:
         print(f"[EXTRACT] No se encontró el archivo: {path}")
         return None
 
-    df = pd.read_csv(path)
+    with timed("read_csv"):
+        df = pd.read_csv(path)
+    record_rows(len(df), stage="extract")
     print(f"[EXTRACT] Leído {len(df)} filas de {path}")
     return df
 
@@ -32,6 +35,17 @@ def load_redis_cart_simulation() -> Optional[pd.DataFrame]:
     return _load_csv(REDIS_CART_CSV)
 
 
+def iter_csv_chunks(path_str: str, chunksize: int = EXTRACT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Lee un CSV por bloques (modo streaming para datasets grandes)."""
+    path = Path(path_str)
+    if not path.is_file():
+        print(f"[EXTRACT] No se encontró el archivo: {path}")
+        return
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        record_rows(len(chunk), stage="extract")
+        yield chunk
+
+
 def extract_all() -> Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]:
     """Ejecuta la etapa EXTRACT leyendo ambos datasets."""
     print("\n[EXTRACT] Iniciando extracción de datos...\n")
@@ -0,0 +1,171 @@
+"""
+Embudo de conversión y abandono sobre los eventos de carrito transformados.
+
+La unidad del embudo es el carrito (no el evento): un carrito entra al
+embudo con su primer "add" y sale por checkout, abandon o stock_out. Así la
+tasa de conversión (carritos con checkout / carritos con add) nunca supera el
+100%, a diferencia de contar eventos de checkout sobre carritos.
+
+Todo se calcula con groupby/pivot vectorizados (sin recorrer filas):
+    1. primer instante de cada tipo de evento por (carrito, categoría)
+    2. flags de etapa alcanzada y tiempo hasta la conversión
+    3. agregación por categoría y por ventana de tiempo del primer add
+
+Ingresos en riesgo: en carritos sin checkout, el valor de lo agregado (precio
+del catálogo × cantidad) o los ingresos perdidos registrados si son mayores;
+en carritos con checkout, solo los ingresos perdidos registrados.
+"""
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+FUNNEL_STAGES = ["checkout", "abandon", "stock_out"]
+
+
+def _catalog_lookup(products: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """product_id -> (category, discounted_price), un registro por producto."""
+    if products is None or products.empty:
+        return pd.DataFrame(columns=["category", "discounted_price"]).rename_axis("product_id")
+    catalog = products[["product_id", "category", "discounted_price"]].copy()
+    catalog["product_id"] = catalog["product_id"].astype(str)
+    catalog["category"] = catalog["category"].astype(str)
+    return catalog.drop_duplicates("product_id").set_index("product_id")
+
+
+def _cart_category_facts(events: pd.DataFrame, catalog: pd.DataFrame) -> pd.DataFrame:
+    """
+    Una fila por (carrito, categoría) con el primer instante de cada etapa y
+    los montos. Las claves de texto se factorizan una sola vez y el resto del
+    cálculo agrupa por un entero (carrito * n_categorías + categoría).
+    """
+    cart_codes, _ = pd.factorize(events["cart_id"])
+    product_codes, product_labels = pd.factorize(events["product_id"])
+
+    # El catálogo se resuelve sobre los productos distintos, no sobre los eventos
+    product_labels = pd.Index(product_labels).astype(str)
+    category_of_product = catalog["category"].reindex(product_labels).fillna("Unknown")
+    price_of_product = catalog["discounted_price"].reindex(product_labels).fillna(0).astype(float).to_numpy()
+    category_codes_of_product, category_labels = pd.factorize(category_of_product)
+    n_categories = len(category_labels)
+
+    category_codes = category_codes_of_product[product_codes]
+    key = cart_codes.astype(np.int64) * n_categories + category_codes
+
+    event_type = events["event_type"]
+    event_time = pd.to_datetime(events["event_time"])
+    is_add = (event_type == "add").to_numpy()
+    frame = pd.DataFrame({
+        "key": key,
+        "revenue": events["revenue"].astype(float).to_numpy(),
+        "lost_revenue": events["lost_revenue"].astype(float).to_numpy(),
+        "added_value": np.where(is_add, price_of_product[product_codes] * events["quantity"].to_numpy(), 0.0),
+    })
+    for stage in ["add"] + FUNNEL_STAGES:
+        frame[stage] = event_time.where((event_type == stage).to_numpy()).to_numpy()
+
+    aggregations = {stage: "min" for stage in ["add"] + FUNNEL_STAGES}
+    aggregations.update({"revenue": "sum", "lost_revenue": "sum", "added_value": "sum"})
+    facts = frame.groupby("key", sort=False).agg(aggregations)
+
+    keys = facts.index.to_numpy()
+    facts["cart"] = keys // n_categories
+    facts["category"] = np.asarray(category_labels)[keys % n_categories]
+
+    facts["added"] = facts["add"].notna()
+    for stage in FUNNEL_STAGES:
+        # Solo cuenta la transición si el carrito pasó antes por add
+        facts[f"to_{stage}"] = facts["added"] & facts[stage].notna()
+    facts["time_to_checkout_s"] = (facts["checkout"] - facts["add"]).dt.total_seconds().where(facts["to_checkout"])
+    # Sin checkout se pierde lo agregado; el lost_revenue del quiebre ya lo incluye, no se suma dos veces
+    facts["revenue_at_risk"] = facts["lost_revenue"].where(
+        facts["to_checkout"], np.maximum(facts["lost_revenue"], facts["added_value"])
+    )
+    return facts.reset_index(drop=True)
+
+
+def _summarize(facts: pd.DataFrame, by) -> pd.DataFrame:
+    """Agrega los hechos (una fila por carrito o por carrito y categoría) en métricas del embudo."""
+    funnel = facts[facts["added"]].groupby(by, sort=True).agg(
+        carts_added=("added", "size"),
+        carts_checkout=("to_checkout", "sum"),
+        carts_abandon=("to_abandon", "sum"),
+        carts_stock_out=("to_stock_out", "sum"),
+        median_time_to_checkout_s=("time_to_checkout_s", "median"),
+        mean_time_to_checkout_s=("time_to_checkout_s", "mean"),
+        revenue=("revenue", "sum"),
+        revenue_at_risk=("revenue_at_risk", "sum"),
+    )
+    for stage in FUNNEL_STAGES:
+        funnel[f"{stage}_rate"] = (funnel[f"carts_{stage}"] / funnel["carts_added"]).round(4)
+    return funnel
+
+
+def build_funnel(events: pd.DataFrame, products: Optional[pd.DataFrame] = None, window: str = "1h") -> dict:
+    """
+    Calcula el embudo global, por categoría y por ventana de tiempo.
+    Devuelve {"overall": dict, "by_category": DataFrame, "by_window": DataFrame}.
+    """
+    if events is None or events.empty:
+        return {"overall": {}, "by_category": pd.DataFrame(), "by_window": pd.DataFrame()}
+
+    facts = _cart_category_facts(events, _catalog_lookup(products))
+
+    # Global: un carrito cuenta una vez aunque toque varias categorías
+    per_cart = facts.groupby("cart", sort=False).agg(
+        add=("add", "min"),
+        checkout=("checkout", "min"),
+        added=("added", "any"),
+        to_checkout=("to_checkout", "any"),
+        to_abandon=("to_abandon", "any"),
+        to_stock_out=("to_stock_out", "any"),
+        revenue=("revenue", "sum"),
+        revenue_at_risk=("revenue_at_risk", "sum"),
+    )
+    per_cart["time_to_checkout_s"] = (
+        (per_cart["checkout"] - per_cart["add"]).dt.total_seconds().where(per_cart["to_checkout"])
+    )
+    per_cart["window"] = per_cart["add"].dt.floor(window)
+
+    overall = {}
+    if per_cart["added"].any():
+        overall = _summarize(per_cart.assign(scope="all"), "scope").iloc[0].to_dict()
+    return {
+        "overall": overall,
+        "by_category": _summarize(facts, "category").sort_values("carts_added", ascending=False),
+        "by_window": _summarize(per_cart.dropna(subset=["window"]), "window"),
+    }
+
+
+def fetch_catalog_for_funnel() -> Optional[pd.DataFrame]:
+    """Catálogo mínimo (product_id, category, discounted_price) desde MongoDB en una consulta."""
+    from src.config import get_mongo_connection
+
+    client, _, collection = get_mongo_connection()
+    if collection is None:
+        return None
+    projection = {"_id": 0, "product_id": 1, "category": 1, "discounted_price": 1}
+    catalog = pd.DataFrame(list(collection.find({}, projection)))
+    client.close()
+    return catalog if not catalog.empty else None
+
+
+def print_funnel(funnel: dict, top_n: int = 10):
+    """Muestra el resumen del embudo."""
+    overall = funnel.get("overall")
+    if not overall:
+        print("[FUNNEL] No hay carritos con eventos add")
+        return
+
+    print(f"[FUNNEL] Carritos con add: {int(overall['carts_added'])}")
+    for stage in FUNNEL_STAGES:
+        print(f"[FUNNEL]   -> {stage}: {int(overall[f'carts_{stage}'])} ({overall[f'{stage}_rate']:.2%})")
+    if pd.notna(overall["median_time_to_checkout_s"]):
+        print(f"[FUNNEL] Tiempo mediano hasta checkout: {overall['median_time_to_checkout_s']:.0f}s")
+    print(f"[FUNNEL] Ingresos en riesgo: ${overall['revenue_at_risk']:.2f}")
+
+    columns = ["carts_added", "checkout_rate", "abandon_rate", "stock_out_rate", "revenue_at_risk"]
+    print(f"\n[FUNNEL] Top {top_n} categorías:")
+    print(funnel["by_category"][columns].head(top_n).to_string())
+    print()
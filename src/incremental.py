@@ -0,0 +1,250 @@
+"""
+Ingesta incremental de eventos de carrito.
+
+Para cada archivo de eventos en data/raw/ se recuerda el offset en bytes y la
+cantidad de filas ya procesadas (data/state/ingest_offsets.json). En cada
+ejecución solo se leen, transforman y cargan las filas agregadas desde la
+última vez, y se fusionan en los hashes de carrito existentes sin flushdb.
+
+Las filas nuevas se leen en lotes de INGEST_CHUNK_SIZE y el offset se guarda
+después de cada lote confirmado, así la memoria no depende de cuánto se
+acumuló desde la última ejecución.
+
+Solo se consumen líneas completas: una última línea sin salto de línea (el
+productor todavía está escribiendo) queda para la próxima ejecución. Junto
+con el offset se guardan el inode y un hash de los primeros bytes: si el
+archivo es más chico que el offset, cambió de inode o empieza distinto (fue
+rotado o truncado) se vuelve a leer desde el inicio.
+"""
+
+import hashlib
+import io
+import json
+import os
+import time
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import pandas as pd
+
+from src.config import (
+    CART_EVENTS_GLOB,
+    INGEST_BATCH_RETENTION,
+    INGEST_CHUNK_SIZE,
+    INGEST_STATE_FILE,
+    REDIS_CART_CSV,
+    STORE_CART_EVENT_HISTORY,
+)
+
+HEAD_BYTES = 4096  # Bytes iniciales que identifican el archivo (encabezado y primeras filas)
+
+
+def load_offsets() -> dict:
+    """Lee los offsets guardados por archivo."""
+    try:
+        with open(INGEST_STATE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_offsets(offsets: dict):
+    """Guarda los offsets de forma atómica."""
+    Path(INGEST_STATE_FILE).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{INGEST_STATE_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(offsets, f, indent=2)
+    os.replace(tmp_path, INGEST_STATE_FILE)
+
+
+def _head_digest(path: Path, length: int) -> str:
+    with open(path, "rb") as f:
+        return hashlib.md5(f.read(length)).hexdigest()
+
+
+def _file_state(path: Path, offset: int, rows: int) -> dict:
+    """Estado del archivo consumido hasta offset: incluye inode y hash inicial para detectar rotaciones."""
+    stat = path.stat()
+    head_bytes = min(offset, HEAD_BYTES)
+    return {
+        "offset": offset,
+        "rows": rows,
+        "size": stat.st_size,
+        "inode": stat.st_ino,
+        "head_bytes": head_bytes,
+        "head": _head_digest(path, head_bytes),
+        "updated_at": datetime.utcnow().isoformat(),
+    }
+
+
+def start_state(path: Path, state: dict) -> dict:
+    """
+    Estado desde donde seguir leyendo el archivo. Si fue rotado o truncado
+    (más chico que el offset, otro inode o distinto contenido inicial) vuelve
+    al comienzo de los datos, justo después del encabezado.
+    """
+    stat = path.stat()
+    offset = state.get("offset", 0)
+    reason = None
+    if stat.st_size < offset:
+        reason = "es más chico que el offset guardado"
+    elif state.get("inode") not in (None, stat.st_ino):
+        reason = "cambió de inode"
+    elif "head" in state and _head_digest(path, state["head_bytes"]) != state["head"]:
+        reason = "cambió su contenido inicial"
+    if reason:
+        print(f"[INCREMENTAL] {path} {reason} (rotado o truncado), se relee desde el inicio")
+        offset = 0
+
+    with open(path, "rb") as f:
+        header_end = len(f.readline())
+    if reason or offset < header_end:
+        return _file_state(path, header_end, 0)
+    return state
+
+
+def read_new_rows(path: Path, state: dict, chunksize: int = INGEST_CHUNK_SIZE) -> Iterator[Tuple[pd.DataFrame, dict]]:
+    """
+    Genera (DataFrame, nuevo estado del archivo) por cada bloque de hasta
+    chunksize filas completas después de state["offset"] (ver start_state).
+    """
+    offset, rows = state["offset"], state.get("rows", 0)
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(offset)
+        while True:
+            lines = list(islice(f, chunksize))
+            if lines and not lines[-1].endswith(b"\n"):
+                lines.pop()  # El productor todavía está escribiendo esta línea
+            if not lines:
+                return
+            df = pd.read_csv(io.BytesIO(header + b"".join(lines)))
+            offset += sum(map(len, lines))
+            rows += len(df)
+            yield df, _file_state(path, offset, rows)
+
+
+def reset_offsets_after_full_load(path_str: str = REDIS_CART_CSV):
+    """
+    Después de una carga completa (flushdb + archivo entero) el archivo base
+    queda consumido hasta su última línea completa y se olvidan los demás:
+    sus eventos se borraron de Redis y la próxima ingesta los vuelve a cargar.
+    """
+    path = Path(path_str)
+    if not path.is_file():
+        return
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = data.rfind(b"\n") + 1
+    save_offsets({str(path): _file_state(path, offset, max(data.count(b"\n", 0, offset) - 1, 0))})
+
+
+HISTORY_BATCHES_KEY = "ingest:history_batches:z"
+
+
+def batch_id_for(path_key: str, offset: int, df: pd.DataFrame) -> str:
+    """Id estable de un lote: archivo, offset de inicio y hash del contenido (igual en cada reintento)."""
+    digest = hashlib.md5(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()[:16]
+    return f"{path_key}@{offset}:{digest}"
+
+
+def batch_applied(redis_client, key: str, batch_id: str) -> bool:
+    return redis_client.zscore(key, batch_id) is not None
+
+
+def mark_batch_applied(pipe, key: str, batch_id: str):
+    """
+    Registra el lote con la hora en que se aplicó y olvida los de más de
+    INGEST_BATCH_RETENTION segundos: solo hacen falta para reconocer un
+    reintento, que ocurre en la ejecución siguiente.
+    """
+    now = time.time()
+    pipe.zadd(key, {batch_id: now})
+    pipe.zremrangebyscore(key, "-inf", now - INGEST_BATCH_RETENTION)
+
+
+def ingest_incremental(store_history: bool = STORE_CART_EVENT_HISTORY) -> Optional[int]:
+    """
+    Procesa las filas nuevas de todos los archivos de eventos. Devuelve cuántas
+    se cargaron, o None si algún lote falló (queda para la próxima ejecución).
+    Cada lote lleva un id estable: si una ejecución se corta antes de guardar
+    el offset, el reintento no vuelve a sumar lo que ya se aplicó.
+    """
+    from src.event_history import load_cart_events_to_mongodb
+    from src.load import merge_carts_to_redis
+    from src.stock_sync import sync_stock_to_mongodb
+    from src.transform import transform_redis_carts
+
+    print("\n[INCREMENTAL] Buscando eventos de carrito nuevos...\n")
+    offsets = load_offsets()
+    total = 0
+    failed = []
+
+    for path in sorted(Path().glob(CART_EVENTS_GLOB)):
+        key = str(path)
+        state = offsets[key] = start_state(path, offsets.get(key, {}))
+        loaded = 0
+
+        for df, new_state in read_new_rows(path, state):
+            batch_id = batch_id_for(key, state["offset"], df)
+            print(f"[INCREMENTAL] {key}: {len(df)} filas nuevas (desde byte {state['offset']})")
+            transformed = transform_redis_carts(df, memory_report=False)
+            if not merge_carts_to_redis(transformed, batch_id=batch_id):
+                # El offset no avanza: las filas se reintentan en la próxima ejecución
+                print(f"[INCREMENTAL] {key}: carga fallida, el offset no se actualiza")
+                failed.append(key)
+                break
+
+            if store_history and _mark_history_pending(batch_id):
+                # Solo eventos nuevos: se agregan al historial sin reemplazar los del carrito
+                if not load_cart_events_to_mongodb(transformed, replace_carts=False):
+                    print(f"[INCREMENTAL] {key}: historial no guardado, el offset no se actualiza")
+                    failed.append(key)
+                    break
+                _mark_history_done(batch_id)
+
+            state = offsets[key] = new_state
+            save_offsets(offsets)
+            loaded += len(df)
+
+        if not loaded and key not in failed:
+            print(f"[INCREMENTAL] {key}: sin filas nuevas")
+        total += loaded
+
+    save_offsets(offsets)
+    if total:
+        # Los checkouts nuevos quedaron en stock:pending; se vuelcan a MongoDB ahora
+        sync_stock_to_mongodb()
+    print(f"\n[INCREMENTAL] {total} filas nuevas procesadas\n")
+    if failed:
+        print(f"[INCREMENTAL] Lotes pendientes en: {', '.join(failed)}")
+        return None
+    return total
+
+
+def _mark_history_pending(batch_id: str) -> bool:
+    """True si el lote todavía no está en el historial de MongoDB."""
+    from src.config import get_redis_connection
+
+    redis_client = get_redis_connection()
+    if redis_client is None:
+        return True
+    try:
+        return not batch_applied(redis_client, HISTORY_BATCHES_KEY, batch_id)
+    finally:
+        redis_client.close()
+
+
+def _mark_history_done(batch_id: str):
+    from src.config import get_redis_connection
+
+    redis_client = get_redis_connection()
+    if redis_client is not None:
+        mark_batch_applied(redis_client, HISTORY_BATCHES_KEY, batch_id)
+        redis_client.close()
+
+
+if __name__ == "__main__":
+    ingest_incremental()
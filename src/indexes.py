@@ -0,0 +1,136 @@
+"""
+Gestion de indices de MongoDB para la coleccion de productos.
+Los indices se crean despues de la carga masiva (mas rapido que mantenerlos
+durante insert_many) y se validan las consultas frecuentes con explain().
+"""
+
+import time
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+# ===== INDICES DECLARADOS =====
+# Cada entrada: (nombre, claves, opciones)
+PRODUCT_INDEXES = [
+    ("product_id_unique", [("product_id", ASCENDING)], {"unique": True}),
+    ("category_price", [("category", ASCENDING), ("discounted_price", ASCENDING)], {}),
+    ("category_rating", [("category", ASCENDING), ("rating", DESCENDING)], {}),
+    ("discounted_price", [("discounted_price", ASCENDING)], {}),
+]
+
+# Consultas frecuentes del pipeline (enriquecimiento, reportes y ejemplos).
+# Son plantillas: explain_hot_queries las completa con valores reales de la
+# coleccion cargada, asi el plan refleja tambien la selectividad.
+HOT_QUERIES = {
+    "lookup_product_id": {"product_id": "P-1001"},
+    "lookup_product_ids": {"product_id": {"$in": ["P-1001", "P-1007"]}},
+    "category_price_range": {"category": "Electronics", "discounted_price": {"$gte": 500, "$lt": 1000}},
+    "price_range": {"discounted_price": {"$gte": 1000, "$lt": 5000}},
+}
+
+
+def hot_queries_for(collection) -> dict:
+    """
+    HOT_QUERIES con product_id, categoria y precios tomados de la coleccion.
+    Con la coleccion vacia se usan las plantillas (solo se valida la forma del plan).
+    """
+    projection = {"_id": 0, "product_id": 1, "category": 1, "discounted_price": 1}
+    samples = list(collection.find({}, projection).limit(2))
+    if not samples:
+        return HOT_QUERIES
+
+    first = samples[0]
+    price = float(first.get("discounted_price") or 0)
+    return {
+        "lookup_product_id": {"product_id": first.get("product_id")},
+        "lookup_product_ids": {"product_id": {"$in": [doc.get("product_id") for doc in samples]}},
+        "category_price_range": {
+            "category": first.get("category"),
+            "discounted_price": {"$gte": price * 0.5, "$lt": price * 1.5 + 1},
+        },
+        "price_range": {"discounted_price": {"$gte": price, "$lt": price * 2 + 1}},
+    }
+
+
+def create_product_indexes(collection) -> dict:
+    """Crea los indices declarados y devuelve el tiempo de construccion de cada uno."""
+    build_times = {}
+
+    for name, keys, options in PRODUCT_INDEXES:
+        start = time.perf_counter()
+        try:
+            collection.create_index(keys, name=name, **options)
+        except OperationFailure as e:
+            # Con product_id duplicados el indice unico falla: se crea sin unicidad
+            if not options.get("unique"):
+                raise
+            print(f"[INDEX] {name} no pudo ser unico ({e.code}), se crea sin unicidad")
+            name = name.replace("_unique", "")
+            collection.create_index(keys, name=name)
+        elapsed = time.perf_counter() - start
+        build_times[name] = elapsed
+        print(f"[INDEX] Indice {name} creado en {elapsed * 1000:.1f} ms")
+
+    total = sum(build_times.values())
+    print(f"[INDEX] {len(build_times)} indices creados en {total * 1000:.1f} ms")
+    return build_times
+
+
+def create_product_key_index(collection):
+    """Indice unico sobre product_id: las cargas por upsert lo necesitan desde el primer lote."""
+    name, keys, options = PRODUCT_INDEXES[0]
+    try:
+        collection.create_index(keys, name=name, **options)
+    except OperationFailure as e:
+        # Coleccion previa con product_id duplicados: igual se indexa, sin unicidad
+        print(f"[INDEX] {name} no pudo ser unico ({e.code}), se crea sin unicidad")
+        collection.create_index(keys, name=name.replace("_unique", ""))
+
+
+def drop_product_indexes(collection):
+    """Elimina los indices secundarios (se conserva _id) antes de una carga masiva."""
+    collection.drop_indexes()
+    print("[INDEX] Indices secundarios eliminados antes de la carga")
+
+
+def _plan_stages(plan: dict) -> list:
+    """Recorre un plan de ejecucion y devuelve la lista de etapas."""
+    stages = [plan.get("stage")]
+    if "inputStage" in plan:
+        stages.extend(_plan_stages(plan["inputStage"]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return [s for s in stages if s]
+
+
+def explain_hot_queries(collection) -> dict:
+    """Ejecuta explain() sobre las consultas frecuentes (con valores reales) y verifica que usen indices."""
+    results = {}
+
+    for name, query in hot_queries_for(collection).items():
+        try:
+            plan = collection.find(query).explain()
+            winning = plan.get("queryPlanner", {}).get("winningPlan", {})
+            # En versiones recientes el plan viene envuelto en queryPlan
+            winning = winning.get("queryPlan", winning)
+            stages = _plan_stages(winning)
+            uses_index = "IXSCAN" in stages or "EXPRESS_IXSCAN" in stages
+            results[name] = {"stages": stages, "uses_index": uses_index}
+
+            status = "OK" if uses_index else "COLLSCAN"
+            print(f"[INDEX] {name}: {' <- '.join(stages)} [{status}]")
+        except Exception as e:
+            print(f"[INDEX] Error en explain de {name}: {e}")
+            results[name] = {"stages": [], "uses_index": False}
+
+    return results
+
+
+if __name__ == "__main__":
+    from src.config import get_mongo_connection
+
+    client, _, collection = get_mongo_connection()
+    if collection is not None:
+        create_product_indexes(collection)
+        explain_hot_queries(collection)
+        client.close()
@@ -3,39 +3,100 @@ INTEGRATION: Cruces de datos entre MongoDB (catálogo) y Redis (carritos en tiem
 Análisis y métricas para simular un Cyberday.
 """
 
-import json
 from datetime import datetime
+import numpy as np
 import pandas as pd
-from src.config import get_mongo_connection, get_redis_connection
+from src.config import get_mongo_connection
+from src.joins import enrich_cart_events
+from src.metrics import record_roundtrip, record_rows, timed
+from src.sessions import parse_session_fields
+from src.sharding import close_cart_clients, get_cart_clients, run_sharded_pipelines, scan_sharded
+
+
+# Rangos de precio usados por el reporte (mismos que en examples.py)
+PRICE_RANGE_BOUNDARIES = [0, 500, 1000, 5000]
+
+
+def build_product_report_pipeline(top_n: int = 15) -> list:
+    """Construye la agregación $facet que devuelve todas las secciones del reporte."""
+    return [
+        {
+            "$facet": {
+                # Métricas por categoría (brand se elimina en TRANSFORM)
+                "by_category": [
+                    {
+                        "$group": {
+                            "_id": "$category",
+                            "count": {"$sum": 1},
+                            "avg_price": {"$avg": "$discounted_price"},
+                            "avg_rating": {"$avg": "$rating"},
+                            "avg_discount": {"$avg": "$discount_percentage"},
+                        }
+                    },
+                    {"$sort": {"count": -1}},
+                    {"$limit": top_n},
+                ],
+                "category_count": [
+                    {"$group": {"_id": "$category"}},
+                    {"$count": "total"},
+                ],
+                "totals": [
+                    {
+                        "$group": {
+                            "_id": None,
+                            "total_products": {"$sum": 1},
+                            "avg_price": {"$avg": "$discounted_price"},
+                            "min_price": {"$min": "$discounted_price"},
+                            "max_price": {"$max": "$discounted_price"},
+                            "avg_rating": {"$avg": "$rating"},
+                            "avg_discount": {"$avg": "$discount_percentage"},
+                        }
+                    },
+                ],
+                "price_ranges": [
+                    {
+                        "$bucket": {
+                            "groupBy": "$discounted_price",
+                            "boundaries": PRICE_RANGE_BOUNDARIES,
+                            "default": "5000+",
+                            "output": {"count": {"$sum": 1}},
+                        }
+                    },
+                ],
+            }
+        }
+    ]
 
 
-def get_product_performance_mongodb() -> dict:
-    """Obtiene métricas de productos desde MongoDB."""
+def get_product_performance_mongodb(top_n: int = 15, collection=None) -> dict:
+    """Obtiene métricas de productos desde MongoDB en un solo round trip ($facet)."""
+    client = None
     try:
-        _, _, collection = get_mongo_connection()
         if collection is None:
-            return {}
+            client, _, collection = get_mongo_connection()
+            if collection is None:
+                return {}
 
-        # Agregación: productos por marca y categoría
-        pipeline = [
-            {
-                "$group": {
-                    "_id": "$brand",
-                    "count": {"$sum": 1},
-                    "avg_price": {"$avg": "$discounted_price"},
-                    "avg_rating": {"$avg": "$rating"},
-                    "avg_discount": {"$avg": "$discount_percentage"},
-                }
-            },
-            {"$sort": {"count": -1}},
-            {"$limit": 10},
-        ]
-
-        results = list(collection.aggregate(pipeline))
+        with timed("mongo_product_report"):
+            facets = next(collection.aggregate(build_product_report_pipeline(top_n)), {})
+        record_roundtrip("mongo", "aggregate")
+
+        totals = facets.get("totals") or [{}]
+        totals = totals[0]
+        category_count = facets.get("category_count") or [{}]
+        by_category = facets.get("by_category", [])
 
         metrics = {
-            "top_brands": results,
-            "total_products": collection.count_documents({}),
+            "top_categories": by_category[:10],
+            "category_distribution": by_category,
+            "total_categories": category_count[0].get("total", 0),
+            "total_products": totals.get("total_products", 0),
+            "avg_price": totals.get("avg_price") or 0,
+            "min_price": totals.get("min_price") or 0,
+            "max_price": totals.get("max_price") or 0,
+            "avg_rating": totals.get("avg_rating") or 0,
+            "avg_discount": totals.get("avg_discount") or 0,
+            "price_ranges": facets.get("price_ranges", []),
             "timestamp": datetime.utcnow().isoformat(),
         }
 
@@ -44,102 +105,122 @@ def get_product_performance_mongodb() -> dict:
     except Exception as e:
         print(f"[INTEGRATION] Error en MongoDB: {e}")
         return {}
+    finally:
+        if client is not None:
+            client.close()
+
+
+def get_field_histogram(field: str, bins: int = 50, match: dict = None, collection=None) -> dict:
+    """
+    Histograma de un campo numérico calculado en MongoDB ($bucket con bins de
+    igual ancho). Solo viajan los bordes y conteos (~bins números) sin importar
+    el tamaño del catálogo. Sirve para precios, rating o descuento.
+    """
+    client = None
+    try:
+        if collection is None:
+            client, _, collection = get_mongo_connection()
+            if collection is None:
+                return {}
+
+        match = match or {}
+        bounds = next(collection.aggregate([
+            {"$match": match},
+            {"$group": {"_id": None, "min": {"$min": f"${field}"}, "max": {"$max": f"${field}"}}},
+        ]), None)
+        record_roundtrip("mongo", "aggregate")
+
+        histogram = {"field": field, "edges": [], "counts": []}
+        if bounds is None or bounds["min"] is None:
+            return histogram
+
+        low, high = float(bounds["min"]), float(bounds["max"])
+        width = (high - low) / bins if high > low else 1.0
+        edges = [low + i * width for i in range(bins + 1)]
+        # El borde superior de $bucket es exclusivo: se desplaza para incluir el máximo
+        edges[-1] = float(np.nextafter(max(edges[-1], high), np.inf))
+
+        results = collection.aggregate([
+            {"$match": match},
+            {"$bucket": {"groupBy": f"${field}", "boundaries": edges, "output": {"count": {"$sum": 1}}}},
+        ])
+        counts_by_edge = {float(r["_id"]): r["count"] for r in results}
+        record_roundtrip("mongo", "aggregate")
+
+        histogram["edges"] = edges
+        histogram["counts"] = [counts_by_edge.get(edge, 0) for edge in edges[:-1]]
+        return histogram
+
+    except Exception as e:
+        print(f"[INTEGRATION] Error calculando histograma de {field}: {e}")
+        return {}
+    finally:
+        # También si la agregación falla: la conexión la abrió esta función
+        if client is not None:
+            client.close()
 
 
 def get_cart_analytics_redis() -> dict:
-    """Obtiene métricas de carritos desde Redis."""
+    """Obtiene métricas de carritos desde Redis (lee el resumen por carrito, no los eventos)."""
+    fields = ["customer_id", "total_revenue", "lost_revenue", "n_checkout", "n_abandon"]
+    cart_clients = None
     try:
-        redis_client = get_redis_connection()
-        if redis_client is None:
+        cart_clients = get_cart_clients()
+        if cart_clients is None:
             return {}
 
-        # Obtener todas las claves de carrito
-        cart_keys = redis_client.keys("cart:CART-*")
-        
+        # SCAN en paralelo por shard + HMGET del resumen en pipeline
+        cart_keys = scan_sharded(cart_clients, "cart:CART-*")
+        replies = run_sharded_pipelines(cart_clients, cart_keys, lambda pipe, key: pipe.hmget(key, *fields))
+
         metrics = {
             "total_carts": 0,
             "total_revenue": 0,
             "lost_revenue": 0,
             "checkout_events": 0,
+            "abandon_events": 0,
+            "checkout_carts": 0,
             "abandoned_carts": 0,
             "carts": [],
         }
 
         for key in cart_keys:
-            cart_data = redis_client.hgetall(key)
-            if not cart_data:
-                continue
-
+            cart = parse_session_fields(replies[key][0], fields)
             metrics["total_carts"] += 1
-            metrics["total_revenue"] += float(cart_data.get("total_revenue", 0))
-            metrics["lost_revenue"] += float(cart_data.get("lost_revenue", 0))
-
-            # Contar eventos
-            try:
-                events = json.loads(cart_data.get("events", "[]"))
-                for event in events:
-                    if event["event_type"] == "checkout":
-                        metrics["checkout_events"] += 1
-                    elif event["event_type"] == "abandon":
-                        metrics["abandoned_carts"] += 1
-            except:
-                pass
-
+            metrics["total_revenue"] += cart["total_revenue"]
+            metrics["lost_revenue"] += cart["lost_revenue"]
+            metrics["checkout_events"] += cart["n_checkout"]
+            metrics["abandon_events"] += cart["n_abandon"]
+            # Tasas por carrito: un carrito con varios checkouts cuenta una vez
+            metrics["checkout_carts"] += int(cart["n_checkout"] > 0)
+            metrics["abandoned_carts"] += int(cart["n_abandon"] > 0)
             metrics["carts"].append({
                 "cart_id": key.replace("cart:", ""),
-                "customer_id": cart_data.get("customer_id", "Unknown"),
-                "total_revenue": float(cart_data.get("total_revenue", 0)),
+                "customer_id": cart["customer_id"] or "Unknown",
+                "total_revenue": cart["total_revenue"],
             })
 
+        record_rows(metrics["total_carts"], stage="integration", dataset="carts")
         metrics["timestamp"] = datetime.utcnow().isoformat()
         return metrics
 
     except Exception as e:
         print(f"[INTEGRATION] Error en Redis: {e}")
         return {}
+    finally:
+        close_cart_clients(cart_clients)
 
 
-def enrich_carts_with_product_info():
-    """Enriquece los datos de carritos con información de productos."""
+def enrich_carts_with_product_info(events: pd.DataFrame = None) -> bool:
+    """
+    Enriquece los eventos de carrito con nombre, precio y categoría del
+    producto (hash join columnar, ver src/joins.py) y los guarda en bloque.
+    """
     try:
-        _, _, mongo_col = get_mongo_connection()
-        redis_client = get_redis_connection()
-
-        if mongo_col is None or redis_client is None:
+        enriched, _ = enrich_cart_events(events)
+        if enriched is None:
             return False
-
-        # Obtener todos los productos como diccionario
-        products = {}
-        for doc in mongo_col.find({}, {"product_id": 1, "product_name": 1, "discounted_price": 1}):
-            products[doc["product_id"]] = {
-                "name": doc.get("product_name", "Unknown"),
-                "price": doc.get("discounted_price", 0),
-            }
-
-        # Enriquecer carritos
-        cart_keys = redis_client.keys("cart:CART-*")
-        enriched_count = 0
-
-        for key in cart_keys:
-            cart_data = redis_client.hgetall(key)
-            try:
-                events = json.loads(cart_data.get("events", "[]"))
-                
-                for event in events:
-                    product_id = event.get("product_id")
-                    if product_id in products:
-                        event["product_name"] = products[product_id]["name"]
-                        event["product_price"] = products[product_id]["price"]
-
-                # Guardar eventos enriquecidos
-                redis_client.hset(key, "events_enriched", json.dumps(events))
-                enriched_count += 1
-
-            except Exception as e:
-                print(f"  Error enriqueciendo {key}: {e}")
-
-        print(f"[INTEGRATION] {enriched_count} carritos enriquecidos")
-        redis_client.close()
+        print(f"[INTEGRATION] {enriched['cart_id'].nunique()} carritos enriquecidos")
         return True
 
     except Exception as e:
@@ -147,13 +228,14 @@ def enrich_carts_with_product_info():
         return False
 
 
-def generate_cyberday_report() -> pd.DataFrame:
-    """Genera reporte completo del Cyberday."""
+def generate_cyberday_report(cart_metrics: dict = None) -> pd.DataFrame:
+    """Genera reporte completo del Cyberday (cart_metrics permite usar métricas en streaming)."""
     print("\n[INTEGRATION] Generando reporte del Cyberday...\n")
 
     # Obtener métricas
     product_metrics = get_product_performance_mongodb()
-    cart_metrics = get_cart_analytics_redis()
+    if cart_metrics is None:
+        cart_metrics = get_cart_analytics_redis()
 
     # Crear reporte
     report = {
@@ -165,12 +247,21 @@ def generate_cyberday_report() -> pd.DataFrame:
     report["Métrica"].append("Total de Productos")
     report["Valor"].append(product_metrics.get("total_products", 0))
 
+    report["Métrica"].append("Total de Categorías")
+    report["Valor"].append(product_metrics.get("total_categories", 0))
+
+    report["Métrica"].append("Precio Promedio")
+    report["Valor"].append(f"${product_metrics.get('avg_price', 0):.2f}")
+
+    report["Métrica"].append("Rating Promedio")
+    report["Valor"].append(f"{product_metrics.get('avg_rating', 0):.2f}")
+
     # Carritos
     report["Métrica"].append("Total de Carritos")
     report["Valor"].append(cart_metrics.get("total_carts", 0))
 
     report["Métrica"].append("Carritos Completados")
-    report["Valor"].append(cart_metrics.get("checkout_events", 0))
+    report["Valor"].append(cart_metrics.get("checkout_carts", 0))
 
     report["Métrica"].append("Carritos Abandonados")
     report["Valor"].append(cart_metrics.get("abandoned_carts", 0))
@@ -182,9 +273,9 @@ def generate_cyberday_report() -> pd.DataFrame:
     report["Métrica"].append("Ingresos Perdidos")
     report["Valor"].append(f"${cart_metrics.get('lost_revenue', 0):.2f}")
 
-    # Tasas
+    # Tasas (carritos con checkout / carritos, no eventos: nunca supera el 100%)
     total_carts = cart_metrics.get("total_carts", 1)
-    checkout_rate = (cart_metrics.get("checkout_events", 0) / total_carts * 100) if total_carts > 0 else 0
+    checkout_rate = (cart_metrics.get("checkout_carts", 0) / total_carts * 100) if total_carts > 0 else 0
     abandon_rate = (cart_metrics.get("abandoned_carts", 0) / total_carts * 100) if total_carts > 0 else 0
 
     report["Métrica"].append("Tasa de Conversión (%)")
@@ -201,13 +292,23 @@ def generate_cyberday_report() -> pd.DataFrame:
     return df_report
 
 
-def integration_all():
-    """Ejecuta la etapa INTEGRATION completa."""
+def integration_all(cart_df: pd.DataFrame = None, products_df: pd.DataFrame = None):
+    """
+    Ejecuta la etapa INTEGRATION completa. Si se pasan los eventos de carrito
+    transformados también calcula el embudo de conversión por categoría.
+    """
     print("\n[INTEGRATION] Iniciando análisis cruzado...\n")
 
-    enrich_carts_with_product_info()
+    enrich_carts_with_product_info(cart_df)
     report = generate_cyberday_report()
 
+    if cart_df is not None:
+        from src.funnel import build_funnel, fetch_catalog_for_funnel, print_funnel
+
+        if products_df is None:
+            products_df = fetch_catalog_for_funnel()
+        print_funnel(build_funnel(cart_df, products_df))
+
     return report
 
 
@@ -0,0 +1,169 @@
+"""
+Join columnar de eventos de carrito × catálogo de productos.
+
+En lugar de buscar cada product_id en un dict dentro de loops anidados, el
+catálogo proyectado (una sola consulta a MongoDB) y los eventos (una pasada
+SCAN + HMGET en pipeline, o el DataFrame transformado) se cargan como
+DataFrames y se unen con un hash join vectorizado sobre product_id. En la
+misma pasada se obtienen los eventos enriquecidos y los totales por
+categoría; el resultado se escribe en bloque: un pipeline por shard de Redis
+(events_enriched de cada carrito) y/o Parquet (CSV si no hay pyarrow).
+"""
+
+import importlib.util
+import json
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+import pandas as pd
+
+from src.config import get_mongo_connection
+from src.metrics import record_bytes
+from src.sharding import get_cart_clients, run_sharded_pipelines, scan_sharded
+
+CATALOG_COLUMNS = ["product_id", "product_name", "discounted_price", "category"]
+ENRICHED_DIR = "data/processed"
+_HAS_PARQUET = importlib.util.find_spec("pyarrow") is not None
+
+
+def fetch_catalog_frame(collection=None) -> Optional[pd.DataFrame]:
+    """Catálogo proyectado a las columnas del join (una consulta)."""
+    client = None
+    if collection is None:
+        client, _, collection = get_mongo_connection()
+        if collection is None:
+            return None
+
+    projection = {"_id": 0, **{column: 1 for column in CATALOG_COLUMNS}}
+    catalog = pd.DataFrame(list(collection.find({}, projection)), columns=CATALOG_COLUMNS)
+    if client is not None:
+        client.close()
+
+    catalog["product_id"] = catalog["product_id"].astype(str)
+    return catalog.drop_duplicates("product_id")
+
+
+def fetch_cart_events_frame(cart_clients: list) -> pd.DataFrame:
+    """Eventos de todos los carritos en un DataFrame (SCAN por shard + HMGET en pipeline)."""
+    keys = scan_sharded(cart_clients, "cart:CART-*")
+    replies = run_sharded_pipelines(cart_clients, keys, lambda pipe, key: pipe.hmget(key, "customer_id", "events"))
+
+    rows = []
+    for key in keys:
+        customer_id, events = replies[key][0]
+        cart_id = key[len("cart:"):]
+        try:
+            rows.extend({**event, "cart_id": cart_id, "customer_id": customer_id} for event in json.loads(events or "[]"))
+        except ValueError:
+            print(f"[JOIN] Eventos ilegibles en {key}")
+    return pd.DataFrame(rows)
+
+
+def join_events_with_catalog(events: pd.DataFrame, catalog: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Hash join (left) de eventos con el catálogo sobre product_id. Devuelve
+    (eventos enriquecidos, totales por categoría).
+    """
+    events = events.assign(product_id=events["product_id"].astype(str))
+    enriched = events.merge(
+        catalog.rename(columns={"discounted_price": "product_price"}),
+        on="product_id",
+        how="left",
+        validate="many_to_one",
+    )
+    enriched["product_name"] = enriched["product_name"].fillna("Unknown")
+    enriched["category"] = enriched["category"].fillna("Unknown")
+    enriched["product_price"] = enriched["product_price"].fillna(0.0)
+
+    is_checkout = enriched["event_type"].astype(str) == "checkout"
+    rollup = (
+        enriched.assign(
+            checkouts=is_checkout.astype(int),
+            units_sold=enriched["quantity"].astype(int).where(is_checkout, 0),
+        )
+        .groupby("category")
+        .agg(
+            events=("product_id", "size"),
+            checkouts=("checkouts", "sum"),
+            units_sold=("units_sold", "sum"),
+            revenue=("revenue", "sum"),
+            lost_revenue=("lost_revenue", "sum"),
+            products=("product_id", "nunique"),
+            carts=("cart_id", "nunique"),
+        )
+        .sort_values("revenue", ascending=False)
+    )
+    return enriched, rollup
+
+
+def write_enriched_to_redis(enriched: pd.DataFrame, cart_clients: list) -> int:
+    """Guarda events_enriched en cada carrito: un pipeline por shard, no un HSET por carrito."""
+    payload = enriched.drop(columns=["cart_id", "customer_id"], errors="ignore").copy()
+    payload["event_time"] = payload["event_time"].astype(str)
+
+    events_by_cart = {}
+    for cart_id, event in zip(enriched["cart_id"].astype(str), payload.to_dict("records")):
+        events_by_cart.setdefault(f"cart:{cart_id}", []).append(event)
+
+    run_sharded_pipelines(
+        cart_clients,
+        events_by_cart,
+        lambda pipe, key: pipe.hset(key, "events_enriched", json.dumps(events_by_cart[key])),
+    )
+    return len(events_by_cart)
+
+
+def write_enriched_to_files(enriched: pd.DataFrame, rollup: pd.DataFrame) -> list:
+    """Guarda eventos enriquecidos y totales por categoría (Parquet, CSV sin pyarrow)."""
+    Path(ENRICHED_DIR).mkdir(parents=True, exist_ok=True)
+    extension = "parquet" if _HAS_PARQUET else "csv"
+    paths = []
+    for name, frame, index in (("cart_events_enriched", enriched, False), ("category_rollup", rollup, True)):
+        path = f"{ENRICHED_DIR}/{name}.{extension}"
+        tmp_path = f"{path}.tmp"
+        frame = frame.astype({"event_time": str}) if "event_time" in frame else frame
+        if _HAS_PARQUET:
+            frame.to_parquet(tmp_path, index=index)
+        else:
+            frame.to_csv(tmp_path, index=index)
+        os.replace(tmp_path, path)
+        record_bytes("enriched", path)
+        paths.append(path)
+    return paths
+
+
+def enrich_cart_events(events: pd.DataFrame = None, to_redis: bool = True, to_files: bool = False):
+    """
+    Ejecuta el join completo. Sin `events` los lee de Redis en una pasada.
+    Devuelve (enriquecidos, totales por categoría) o (None, None) si falla.
+    """
+    cart_clients = get_cart_clients() if (events is None or to_redis) else []
+    if cart_clients is None:
+        return None, None
+
+    try:
+        catalog = fetch_catalog_frame()
+        if catalog is None:
+            return None, None
+        if events is None:
+            events = fetch_cart_events_frame(cart_clients)
+        if events.empty:
+            print("[JOIN] No hay eventos de carrito para enriquecer")
+            return None, None
+
+        enriched, rollup = join_events_with_catalog(events, catalog)
+        matched = int((enriched["product_name"] != "Unknown").sum())
+        print(f"[JOIN] {len(enriched)} eventos × {len(catalog)} productos ({matched} con producto en el catálogo)")
+
+        if to_redis:
+            carts = write_enriched_to_redis(enriched, cart_clients)
+            print(f"[JOIN] events_enriched guardado en {carts} carritos")
+        if to_files:
+            for path in write_enriched_to_files(enriched, rollup):
+                print(f"[JOIN] Guardado: {path}")
+        return enriched, rollup
+
+    finally:
+        for client in cart_clients:
+            client.close()
@@ -0,0 +1,141 @@
+"""
+Rankings de productos en tiempo real con sorted sets de Redis.
+
+La carga (por lotes) y la simulación en tiempo real mantienen con ZINCRBY un
+sorted set por métrica: ingresos por checkout, unidades vendidas, ingresos
+perdidos y quiebres de stock por producto. Un top-N es un ZREVRANGE
+(O(log n + N)) y los nombres se agregan con una sola búsqueda por lote: HMGET
+sobre un caché en Redis y un único $in a MongoDB para los que falten.
+"""
+
+import pandas as pd
+
+from src.config import get_mongo_connection, get_redis_connection
+from src.metrics import record_cache, record_roundtrip
+
+LEADERBOARD_KEYS = {
+    "revenue": "leaderboard:revenue",
+    "units": "leaderboard:units",
+    "lost_revenue": "leaderboard:lost_revenue",
+    "stock_outs": "leaderboard:stock_outs",
+}
+PRODUCT_NAMES_KEY = "leaderboard:product_names"
+
+
+def _event_scores(df: pd.DataFrame) -> pd.DataFrame:
+    """Puntajes por producto y métrica de un lote de eventos (vectorizado)."""
+    event_type = df["event_type"].astype(str)
+    scores = pd.DataFrame({
+        "product_id": df["product_id"].astype(str),
+        "revenue": df["revenue"].astype(float).where(event_type == "checkout", 0.0),
+        "units": df["quantity"].astype(int).where(event_type == "checkout", 0),
+        "lost_revenue": df["lost_revenue"].astype(float),
+        "stock_outs": (event_type == "stock_out").astype(int),
+    })
+    return scores.groupby("product_id")[list(LEADERBOARD_KEYS)].sum()
+
+
+def record_leaderboards(redis_client, df: pd.DataFrame, pipe=None) -> int:
+    """
+    Actualiza los rankings con un lote de eventos (un pipeline de ZINCRBY).
+    Con `pipe` solo encola los comandos (el llamador ejecuta).
+    """
+    if df is None or df.empty:
+        return 0
+
+    scores = _event_scores(df)
+    own_pipe = pipe is None
+    if own_pipe:
+        pipe = redis_client.pipeline(transaction=False)
+    updates = 0
+    for metric, key in LEADERBOARD_KEYS.items():
+        for product_id, score in scores[metric][scores[metric] != 0].items():
+            pipe.zincrby(key, float(score), product_id)
+            updates += 1
+    if not own_pipe:
+        return updates
+    pipe.execute()
+    record_roundtrip("redis", "leaderboard_zincrby", batch_size=updates)
+
+    print(f"[LEADERBOARD] {len(scores)} productos actualizados ({updates} ZINCRBY)")
+    return updates
+
+
+def record_leaderboard_event(redis_client, event_type: str, product_id: str, quantity: int = 0,
+                             revenue: float = 0, lost_revenue: float = 0):
+    """Registra un evento individual (ruta de tiempo real)."""
+    pipe = redis_client.pipeline(transaction=False)
+    if event_type == "checkout":
+        if revenue:
+            pipe.zincrby(LEADERBOARD_KEYS["revenue"], float(revenue), product_id)
+        if quantity:
+            pipe.zincrby(LEADERBOARD_KEYS["units"], int(quantity), product_id)
+    if lost_revenue:
+        pipe.zincrby(LEADERBOARD_KEYS["lost_revenue"], float(lost_revenue), product_id)
+    if event_type == "stock_out":
+        pipe.zincrby(LEADERBOARD_KEYS["stock_outs"], 1, product_id)
+    if len(pipe):
+        pipe.execute()
+
+
+def _product_names(redis_client, product_ids: list) -> dict:
+    """Nombres por lote: caché en Redis y un solo $in a MongoDB para los faltantes."""
+    if not product_ids:
+        return {}
+    names = dict(zip(product_ids, redis_client.hmget(PRODUCT_NAMES_KEY, product_ids)))
+    missing = [product_id for product_id, name in names.items() if name is None]
+    record_cache("product_names", len(names) - len(missing), len(missing))
+
+    if missing:
+        client, _, collection = get_mongo_connection()
+        if collection is not None:
+            found = {
+                doc["product_id"]: doc.get("product_name", "Unknown")
+                for doc in collection.find({"product_id": {"$in": missing}}, {"_id": 0, "product_id": 1, "product_name": 1})
+            }
+            client.close()
+            record_roundtrip("mongo", "find_names", batch_size=len(missing))
+            if found:
+                redis_client.hset(PRODUCT_NAMES_KEY, mapping=found)
+            names.update(found)
+
+    return {product_id: name or "Unknown" for product_id, name in names.items()}
+
+
+def get_top_products(metric: str = "revenue", n: int = 10, redis_client=None) -> list:
+    """Top-N de productos para una métrica, con el nombre de cada producto."""
+    if metric not in LEADERBOARD_KEYS:
+        raise ValueError(f"Métrica desconocida: {metric} (opciones: {list(LEADERBOARD_KEYS)})")
+
+    own_client = redis_client is None
+    try:
+        if own_client:
+            redis_client = get_redis_connection()
+            if redis_client is None:
+                return []
+
+        top = redis_client.zrevrange(LEADERBOARD_KEYS[metric], 0, n - 1, withscores=True)
+        names = _product_names(redis_client, [product_id for product_id, _ in top])
+        return [
+            {"rank": rank, "product_id": product_id, "product_name": names.get(product_id, "Unknown"), metric: score}
+            for rank, (product_id, score) in enumerate(top, start=1)
+        ]
+
+    except Exception as e:
+        print(f"[LEADERBOARD] Error consultando el ranking {metric}: {e}")
+        return []
+    finally:
+        if own_client and redis_client is not None:
+            redis_client.close()
+
+
+def get_all_leaderboards(n: int = 10, redis_client=None) -> dict:
+    """Top-N de todas las métricas (un ranking por métrica)."""
+    return {metric: get_top_products(metric, n, redis_client) for metric in LEADERBOARD_KEYS}
+
+
+if __name__ == "__main__":
+    for metric_name, rows in get_all_leaderboards(5).items():
+        print(f"\n[LEADERBOARD] Top 5 {metric_name}")
+        for entry in rows:
+            print(f"  {entry['rank']}. {entry['product_name'][:50]} ({entry['product_id']}): {entry[metric_name]:.2f}")
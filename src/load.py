@@ -1,19 +1,107 @@
 """
 Etapa LOAD: inserta datos procesados de Amazon en MongoDB y eventos de carrito en Redis.
+
+Los productos se cargan en lotes numerados de upserts por product_id
+(idempotentes). Después de cada lote confirmado se guarda el progreso en
+MONGO_LOAD_PROGRESS_FILE; si la carga se interrumpe, la siguiente ejecución
+con los mismos productos retoma desde el primer lote sin confirmar, sin
+volver a vaciar la colección.
 """
 
+import hashlib
 import json
+import os
 import time
 from datetime import datetime
 from pathlib import Path
 
 import pandas as pd
-
-from src.config import get_mongo_connection, get_redis_connection
+from pymongo import UpdateOne
+
+from src.config import (
+    DEFAULT_STOCK,
+    MONGO_LOAD_BATCH_SIZE,
+    MONGO_LOAD_PROGRESS_FILE,
+    STORE_CART_EVENT_HISTORY,
+    get_mongo_connection,
+    get_redis_connection,
+)
+from src.event_history import load_cart_events_to_mongodb
+from src.indexes import create_product_indexes, create_product_key_index, drop_product_indexes, explain_hot_queries
+from src.incremental import batch_applied, mark_batch_applied, reset_offsets_after_full_load
+from src.leaderboards import record_leaderboard_event, record_leaderboards
+from src.metrics import record_roundtrip, record_rows, timed
+from src.sessions import build_cart_sessions, session_mappings
+from src.sharding import close_cart_clients, flush_shards, get_cart_clients, ring_for_clients, run_sharded_pipelines
+from src.stock_sync import apply_checkout, queue_checkouts, start_stock_sync, stop_stock_sync, sync_stock_to_mongodb
+from src.streaming import publish_cart_event
+from src.timeseries import record_event, record_events_by_minute
 from src.transform import transform_all
 
-def load_products_to_mongodb(df: pd.DataFrame, recreate: bool = True) -> bool:
-    """Carga productos de Amazon (ya limpios) a MongoDB."""
+def _product_upsert(row: dict, loaded_at: datetime) -> UpdateOne:
+    """Upsert idempotente de un producto: stock y ventas solo se inicializan al insertarlo."""
+    fields = {
+        "product_name": row.get("product_name"),
+        "category": row.get("category"),
+        "actual_price": float(row.get("actual_price", 0)) if pd.notna(row.get("actual_price")) else 0,
+        "discounted_price": float(row.get("discounted_price", 0)) if pd.notna(row.get("discounted_price")) else 0,
+        "discount_percentage": float(row.get("discount_percentage", 0)) if pd.notna(row.get("discount_percentage")) else 0,
+        "rating": float(row.get("rating", 0)) if pd.notna(row.get("rating")) else 0,
+        "rating_count": int(row.get("rating_count", 0)) if pd.notna(row.get("rating_count")) else 0,
+        "about_product": row.get("about_product", ""),
+        # Campos de reseñas e imágenes eliminados (ver JUSTIFICACION_ETL.md)
+    }
+    return UpdateOne(
+        {"product_id": row.get("product_id")},
+        {
+            "$set": fields,
+            "$setOnInsert": {"stock": DEFAULT_STOCK, "total_sales": 0, "created_at": loaded_at},
+        },
+        upsert=True,
+    )
+
+
+def upsert_product_batch(collection, rows: list, loaded_at: datetime):
+    """Envía un lote de upserts en un solo bulk_write (idempotente: se puede repetir)."""
+    with timed("mongo_bulk_upsert"):
+        result = collection.bulk_write([_product_upsert(row, loaded_at) for row in rows], ordered=False)
+    record_roundtrip("mongo", "bulk_upsert", batch_size=len(rows))
+    record_rows(len(rows), stage="load", dataset="products")
+    return result
+
+
+def _products_fingerprint(df: pd.DataFrame, batch_size: int) -> str:
+    """Identifica el conjunto de productos y el tamaño de lote de una carga."""
+    digest = hashlib.md5(f"{len(df)}:{batch_size}".encode())
+    digest.update(pd.util.hash_pandas_object(df["product_id"].astype(str), index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _load_progress() -> dict:
+    try:
+        with open(MONGO_LOAD_PROGRESS_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_progress(progress: dict):
+    """Guarda el progreso de forma atómica (un corte nunca deja el archivo a medias)."""
+    Path(MONGO_LOAD_PROGRESS_FILE).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{MONGO_LOAD_PROGRESS_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(progress, f, indent=2)
+    os.replace(tmp_path, MONGO_LOAD_PROGRESS_FILE)
+
+
+def load_products_to_mongodb(df: pd.DataFrame, recreate: bool = True, create_indexes: bool = True,
+                             batch_size: int = MONGO_LOAD_BATCH_SIZE, resume: bool = True) -> bool:
+    """
+    Carga productos de Amazon (ya limpios) a MongoDB en lotes numerados de
+    upserts y crea los indices secundarios al final. Con resume=True una
+    carga interrumpida de los mismos productos sigue desde el último lote
+    confirmado (sin vaciar la colección otra vez).
+    """
     if df is None or df.empty:
         print("[LOAD] No hay datos para cargar a MongoDB")
         return False
@@ -23,31 +111,48 @@ def load_products_to_mongodb(df: pd.DataFrame, recreate: bool = True) -> bool:
         if collection is None:
             return False
 
-        if recreate:
-            collection.delete_many({})
-            print("[LOAD] Coleccion limpiada")
-
-        products = []
-        for _, row in df.iterrows():
-            doc = {
-                "product_id": row.get("product_id"),
-                "product_name": row.get("product_name"),
-                "category": row.get("category"),
-                "actual_price": float(row.get("actual_price", 0)) if pd.notna(row.get("actual_price")) else 0,
-                "discounted_price": float(row.get("discounted_price", 0)) if pd.notna(row.get("discounted_price")) else 0,
-                "discount_percentage": float(row.get("discount_percentage", 0)) if pd.notna(row.get("discount_percentage")) else 0,
-                "rating": float(row.get("rating", 0)) if pd.notna(row.get("rating")) else 0,
-                "rating_count": int(row.get("rating_count", 0)) if pd.notna(row.get("rating_count")) else 0,
-                "about_product": row.get("about_product", ""),
-                # Campos de reseñas e imágenes eliminados (ver JUSTIFICACION_ETL.md)
-                "stock": 100,
-                "total_sales": 0,
-                "created_at": datetime.utcnow(),
-            }
-            products.append(doc)
-
-        result = collection.insert_many(products, ordered=False)
-        print(f"[LOAD] {len(result.inserted_ids)} productos cargados a MongoDB")
+        fingerprint = _products_fingerprint(df, batch_size)
+        total_batches = -(-len(df) // batch_size)
+        progress = _load_progress() if resume else {}
+        if progress.get("fingerprint") == fingerprint:
+            print(f"[LOAD] Reanudando carga de productos: {progress['completed_batches']}/{total_batches} lotes ya confirmados")
+        else:
+            progress = {"fingerprint": fingerprint, "batch_size": batch_size, "total_batches": total_batches,
+                        "completed_batches": 0, "started_at": datetime.utcnow().isoformat()}
+            if recreate:
+                collection.delete_many({})
+                print("[LOAD] Coleccion limpiada")
+                if create_indexes:
+                    # Los indices secundarios se reconstruyen despues de la carga (mas rapida)
+                    drop_product_indexes(collection)
+        # Los upserts buscan por product_id: sin este indice cada lote recorreria la coleccion
+        create_product_key_index(collection)
+        _save_progress(progress)
+
+        loaded_at = datetime.utcnow()
+        first_batch = progress["completed_batches"]
+        loaded = upserted = modified = 0
+        for batch in range(first_batch, total_batches):
+            rows = df.iloc[batch * batch_size:(batch + 1) * batch_size].to_dict("records")
+            result = upsert_product_batch(collection, rows, loaded_at)
+            loaded += len(rows)
+            upserted += result.upserted_count
+            modified += result.modified_count
+
+            # El lote quedo confirmado por el servidor: recien ahora avanza el progreso
+            progress["completed_batches"] = batch + 1
+            progress["updated_at"] = datetime.utcnow().isoformat()
+            _save_progress(progress)
+
+        print(f"[LOAD] {loaded} productos cargados a MongoDB en {total_batches - first_batch} lotes "
+              f"({upserted} nuevos, {modified} actualizados)")
+
+        if create_indexes:
+            create_product_indexes(collection)
+            explain_hot_queries(collection)
+
+        # Carga completa: la proxima ejecucion empieza de cero
+        os.remove(MONGO_LOAD_PROGRESS_FILE)
         client.close()
         return True
 
@@ -62,63 +167,186 @@ def load_carts_to_redis(df: pd.DataFrame, simulate_realtime: bool = False) -> bo
         print("[LOAD] No hay datos para cargar a Redis")
         return False
 
+    redis_client = cart_clients = None
     try:
         redis_client = get_redis_connection()
         if redis_client is None:
             return False
 
         redis_client.flushdb()
+        cart_clients = get_cart_clients(redis_client)
+        if cart_clients is None:
+            return False
+        if cart_clients[0] is not redis_client:
+            flush_shards(cart_clients)
         print("[LOAD] Redis limpiado")
 
+        # Resumen por carrito (una sola vez) + eventos en JSON agrupados por carrito
+        sessions = build_cart_sessions(df)
+        summaries = session_mappings(sessions)
         carts = {}
-        for _, row in df.iterrows():
-            cart_id = row["cart_id"]
-            if cart_id not in carts:
-                carts[cart_id] = {
-                    "customer_id": row["customer_id"],
-                    "events": [],
-                    "total_revenue": 0,
-                    "lost_revenue": 0,
-                }
-
-            event = {
-                "event_time": str(row["event_time"]),
-                "event_type": row["event_type"],
-                "product_id": row["product_id"],
-                "quantity": int(row["quantity"]),
-                "stock_before": int(row["stock_before"]),
-                "stock_after": int(row["stock_after"]),
-                "revenue": float(row["revenue"]),
-                "lost_revenue": float(row["lost_revenue"]),
+        for event in _event_records(df):
+            carts.setdefault(event.pop("cart_id"), []).append(event)
+
+        # Un pipeline por shard (con una sola instancia, un único pipeline)
+        loaded_at = datetime.utcnow().isoformat()
+        mappings = {
+            f"cart:{cart_id}": {
+                "customer_id": sessions.at[cart_id, "customer_id"],
+                "events": json.dumps(events),
+                **summaries[cart_id],
+                "loaded_at": loaded_at,
             }
-            carts[cart_id]["events"].append(event)
-            carts[cart_id]["total_revenue"] += float(row["revenue"])
-            carts[cart_id]["lost_revenue"] += float(row["lost_revenue"])
-
-        for cart_id, cart_data in carts.items():
-            redis_client.hset(
-                f"cart:{cart_id}",
-                mapping={
-                    "customer_id": cart_data["customer_id"],
-                    "events": json.dumps(cart_data["events"]),
-                    "total_revenue": cart_data["total_revenue"],
-                    "lost_revenue": cart_data["lost_revenue"],
-                    "loaded_at": datetime.utcnow().isoformat(),
-                },
-            )
+            for cart_id, events in carts.items()
+        }
+        run_sharded_pipelines(cart_clients, mappings, lambda pipe, key: pipe.hset(key, mapping=mappings[key]))
 
+        record_rows(len(df), stage="load", dataset="carts")
         print(f"[LOAD] {len(carts)} carritos cargados a Redis")
 
+        # Métricas por minuto y stock (en modo tiempo real los registra la simulación)
+        if not simulate_realtime:
+            record_events_by_minute(redis_client, df)
+            queue_checkouts(redis_client, df)
+            record_leaderboards(redis_client, df)
+
         if simulate_realtime:
             print("[LOAD] Simulando carritos en tiempo real...")
-            _simulate_realtime_carts(redis_client, df)
-
-        redis_client.close()
+            sync_thread, sync_stop = start_stock_sync(redis_client)
+            try:
+                _simulate_realtime_carts(redis_client, df)
+            finally:
+                stop_stock_sync(sync_thread, sync_stop)
         return True
 
     except Exception as e:
         print(f"[LOAD] Error cargando a Redis: {e}")
         return False
+    finally:
+        close_cart_clients(cart_clients, redis_client)
+
+
+def _event_records(df: pd.DataFrame) -> list:
+    """Convierte eventos transformados al formato JSON guardado en cart:<id>.events."""
+    events = pd.DataFrame({
+        "cart_id": df["cart_id"].astype(str),
+        "event_time": df["event_time"].astype(str),
+        "event_type": df["event_type"].astype(str),
+        "product_id": df["product_id"].astype(str),
+        "quantity": df["quantity"].astype(int),
+        "stock_before": df["stock_before"].astype(int),
+        "stock_after": df["stock_after"].astype(int),
+        "revenue": df["revenue"].astype(float),
+        "lost_revenue": df["lost_revenue"].astype(float),
+    })
+    return events.to_dict("records")
+
+
+APPLIED_BATCHES_KEY = "ingest:applied_batches:z"  # ZSET lote -> hora (antes un SET sin límite)
+
+
+def merge_carts_to_redis(df: pd.DataFrame, batch_id: str = None, redis_client=None, cart_clients: list = None) -> bool:
+    """
+    Carga incremental: agrega eventos nuevos a los carritos existentes sin
+    flushdb. Los eventos se anexan a cart:<id>.events y el resumen de la
+    sesión (totales, conteos, resultado) se recalcula para cada carrito tocado.
+
+    Con batch_id la fusión es idempotente. Las métricas por minuto, el stock
+    y los rankings del lote se aplican en una sola transacción junto con la
+    marca del lote (APPLIED_BATCHES_KEY, que olvida los lotes pasados
+    INGEST_BATCH_RETENTION segundos). Cada carrito guarda los lotes ya
+    incorporados en el mismo HSET que sus eventos. Reintentar un lote que
+    falló a mitad de camino solo completa lo que faltaba.
+
+    redis_client y cart_clients permiten reutilizar conexiones abiertas entre
+    lotes (las cierra quien las abrió).
+    """
+    if df is None or df.empty:
+        print("[LOAD] No hay eventos nuevos para Redis")
+        return True
+
+    own_primary = redis_client is None
+    own_shards = cart_clients is None
+    try:
+        if own_primary:
+            redis_client = get_redis_connection()
+            if redis_client is None:
+                return False
+
+        new_events = {}
+        for event in _event_records(df):
+            new_events.setdefault(event.pop("cart_id"), []).append(event)
+        customers = df.groupby(df["cart_id"].astype(str))["customer_id"].first().astype(str)
+
+        if own_shards:
+            cart_clients = get_cart_clients(redis_client)
+            if cart_clients is None:
+                return False
+        ring = ring_for_clients(cart_clients)
+
+        # Métricas, stock y rankings del lote: todo o nada, junto con la marca del lote
+        if batch_id is not None and batch_applied(redis_client, APPLIED_BATCHES_KEY, batch_id):
+            print(f"[LOAD] Lote {batch_id}: métricas, stock y rankings ya aplicados")
+        else:
+            pipe = redis_client.pipeline(transaction=True)
+            record_events_by_minute(redis_client, df, pipe)
+            queue_checkouts(redis_client, df, pipe)
+            record_leaderboards(redis_client, df, pipe)
+            if batch_id is not None:
+                mark_batch_applied(pipe, APPLIED_BATCHES_KEY, batch_id)
+            commands = len(pipe)
+            pipe.execute()
+            record_roundtrip("redis", "merge_side_effects", batch_size=commands)
+
+        keys = [f"cart:{cart_id}" for cart_id in new_events]
+        replies = run_sharded_pipelines(
+            cart_clients, keys, lambda pipe, key: pipe.hmget(key, "events", "customer_id", "batches"), ring
+        )
+
+        # El resumen de cada carrito tocado se recalcula con todos sus eventos
+        merged_events = {}
+        merged_batches = {}
+        merged_rows = []
+        new_carts = 0
+        for cart_id, key in zip(new_events, keys):
+            current, customer_id, batches = replies[key][0]
+            batches = json.loads(batches) if batches else []
+            if batch_id is not None and batch_id in batches:
+                continue  # Este carrito ya incorporó el lote en un intento anterior
+            new_carts += not current
+            events = json.loads(current) if current else []
+            events.extend(new_events[cart_id])
+            merged_events[key] = events
+            merged_batches[key] = batches + [batch_id] if batch_id is not None else batches
+            customer_id = customer_id or customers[cart_id]
+            merged_rows.extend({**event, "cart_id": cart_id, "customer_id": customer_id} for event in events)
+        summaries = session_mappings(build_cart_sessions(pd.DataFrame(merged_rows))) if merged_rows else {}
+
+        def queue_merge(pipe, key):
+            cart_id = key[len("cart:"):]
+            pipe.hsetnx(key, "customer_id", customers[cart_id])
+            # Eventos, resumen y lotes aplicados en un solo HSET (atómico por carrito)
+            pipe.hset(key, mapping={
+                "events": json.dumps(merged_events[key]),
+                "batches": json.dumps(merged_batches[key]),
+                **summaries[cart_id],
+                "loaded_at": datetime.utcnow().isoformat(),
+            })
+
+        if merged_events:
+            run_sharded_pipelines(cart_clients, list(merged_events), queue_merge, ring)
+
+        print(f"[LOAD] {len(df)} eventos nuevos en {len(merged_events)} carritos ({new_carts} nuevos)")
+        return True
+
+    except Exception as e:
+        print(f"[LOAD] Error en carga incremental a Redis: {e}")
+        return False
+    finally:
+        close_cart_clients(
+            [c for c in cart_clients or [] if c is not redis_client] if own_shards else None,
+            redis_client if own_primary else None,
+        )
 
 
 def _simulate_realtime_carts(redis_client, df: pd.DataFrame):
@@ -147,6 +375,24 @@ def _simulate_realtime_carts(redis_client, df: pd.DataFrame):
                 }
 
                 redis_client.lpush(event_key, json.dumps(event_data))
+                publish_cart_event(redis_client, row.to_dict())
+                if row["event_type"] == "checkout":
+                    apply_checkout(redis_client, row["product_id"], int(row["quantity"]))
+                record_event(
+                    redis_client,
+                    row["event_time"],
+                    row["event_type"],
+                    float(row["revenue"]),
+                    float(row["lost_revenue"]),
+                )
+                record_leaderboard_event(
+                    redis_client,
+                    row["event_type"],
+                    row["product_id"],
+                    int(row["quantity"]),
+                    float(row["revenue"]),
+                    float(row["lost_revenue"]),
+                )
                 print(f"  [REALTIME] {cart_id}: {row['event_type']} - {row['product_id']}")
 
             time.sleep(delay)
@@ -157,8 +403,17 @@ def _simulate_realtime_carts(redis_client, df: pd.DataFrame):
         print(f"[LOAD] Error en simulacion: {e}")
 
 
-def load_all(amazon_df: pd.DataFrame = None, cart_df: pd.DataFrame = None, simulate_realtime: bool = False) -> bool:
-    """Ejecuta la etapa LOAD completa (carga datos transformados a MongoDB y Redis)."""
+def load_all(
+    amazon_df: pd.DataFrame = None,
+    cart_df: pd.DataFrame = None,
+    simulate_realtime: bool = False,
+    store_history: bool = STORE_CART_EVENT_HISTORY,
+) -> bool:
+    """
+    Ejecuta la etapa LOAD completa (carga datos transformados a MongoDB y Redis).
+    Con store_history los eventos de carrito también se guardan en la colección
+    time-series de MongoDB (historial que sobrevive al flushdb).
+    """
     print("\n[LOAD] Iniciando carga de datos...\n")
 
     # Si no se pasan dataframes, transformar internamente
@@ -183,6 +438,17 @@ def load_all(amazon_df: pd.DataFrame = None, cart_df: pd.DataFrame = None, simul
     mongo_ok = load_products_to_mongodb(amazon_df)
     redis_ok = load_carts_to_redis(cart_df, simulate_realtime=simulate_realtime)
 
+    if store_history:
+        load_cart_events_to_mongodb(cart_df)
+
+    if redis_ok:
+        # La ingesta incremental sigue desde el final del archivo recién cargado
+        reset_offsets_after_full_load()
+
+    # Volcar a MongoDB el stock descontado en Redis por los checkouts
+    if mongo_ok and redis_ok:
+        sync_stock_to_mongodb()
+
     return mongo_ok and redis_ok
 
 
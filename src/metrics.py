@@ -0,0 +1,200 @@
+"""
+Métricas del pipeline en formato de texto de Prometheus.
+
+Contadores e histogramas en memoria (un dict por tipo, protegido por un
+lock) para filas procesadas por etapa, round trips a MongoDB/Redis, tamaños
+de lote, bytes escritos, aciertos de caché y latencia por operación. Registrar
+una muestra es una suma bajo un lock (~1 µs), así que se puede dejar activo
+en los loops calientes; con METRICS_ENABLED = False cada llamada retorna de
+inmediato.
+
+Exposición:
+    - start_metrics_server(port): endpoint HTTP local /metrics
+    - write_textfile(path): archivo .prom para el textfile collector de
+      node_exporter (escritura atómica)
+"""
+
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from src.config import METRICS_ENABLED, METRICS_TEXTFILE
+
+_SIZE_BUCKETS = (1, 10, 100, 500, 1_000, 5_000, 10_000, 50_000, 100_000)
+_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# nombre -> (tipo, ayuda, buckets)
+METRICS = {
+    "etl_rows_processed_total": ("counter", "Filas procesadas por etapa", None),
+    "etl_db_roundtrips_total": ("counter", "Round trips a MongoDB y Redis", None),
+    "etl_bytes_written_total": ("counter", "Bytes escritos en archivos", None),
+    "etl_cache_requests_total": ("counter", "Consultas a cachés (result=hit|miss)", None),
+    "etl_batch_size": ("histogram", "Tamaño de los lotes enviados a las bases de datos", _SIZE_BUCKETS),
+    "etl_operation_duration_seconds": ("histogram", "Latencia por operación", _LATENCY_BUCKETS),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_stage = "none"
+
+
+def set_stage(stage: str):
+    """Etapa actual del pipeline (etiqueta por defecto de las muestras)."""
+    global _stage
+    _stage = stage
+
+
+def current_stage() -> str:
+    return _stage
+
+
+def _key(name: str, labels: dict) -> tuple:
+    labels.setdefault("stage", _stage)
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, amount: float = 1, **labels):
+    """Suma a un contador."""
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name: str, value: float, **labels):
+    """Registra una muestra en un histograma."""
+    if not METRICS_ENABLED:
+        return
+    buckets = METRICS[name][2]
+    key = _key(name, labels)
+    index = bisect.bisect_left(buckets, value)
+    with _lock:
+        entry = _histograms.get(key)
+        if entry is None:
+            entry = _histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+        entry[0][index] += 1
+        entry[1] += value
+        entry[2] += 1
+
+
+@contextmanager
+def timed(operation: str, **labels):
+    """Mide la duración de un bloque en etl_operation_duration_seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("etl_operation_duration_seconds", time.perf_counter() - start, operation=operation, **labels)
+
+
+# ===== ATAJOS PARA LOS PUNTOS DE INSTRUMENTACIÓN =====
+
+def record_rows(count: int, **labels):
+    inc("etl_rows_processed_total", count, **labels)
+
+
+def record_roundtrip(db: str, operation: str, batch_size: int = None, **labels):
+    """Un round trip a la base (y el tamaño del lote si corresponde)."""
+    inc("etl_db_roundtrips_total", 1, db=db, operation=operation, **labels)
+    if batch_size is not None:
+        observe("etl_batch_size", batch_size, db=db, operation=operation, **labels)
+
+
+def record_bytes(target: str, path) -> None:
+    """Bytes del archivo recién escrito."""
+    if not METRICS_ENABLED:
+        return
+    try:
+        inc("etl_bytes_written_total", os.path.getsize(path), target=target)
+    except OSError:
+        pass
+
+
+def record_cache(cache: str, hits: int, misses: int):
+    if hits:
+        inc("etl_cache_requests_total", hits, cache=cache, result="hit")
+    if misses:
+        inc("etl_cache_requests_total", misses, cache=cache, result="miss")
+
+
+# ===== EXPOSICIÓN =====
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in items)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    """Valor de una muestra sin perder precisión (los contadores pasan de 1e6 en cargas grandes)."""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_prometheus() -> str:
+    """Todas las métricas en el formato de texto de Prometheus (0.0.4)."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: [list(entry[0]), entry[1], entry[2]] for key, entry in _histograms.items()}
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        else:
+            for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(labels, (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str = METRICS_TEXTFILE) -> str:
+    """Escribe las métricas para el textfile collector (atómico: node_exporter nunca lee un archivo a medias)."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+    print(f"[METRICS] Métricas escritas en {path}")
+    return path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Sirve /metrics en un hilo de fondo (daemon) mientras corre el proceso."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"[METRICS] Endpoint Prometheus en http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,192 @@
+"""
+Motor de calidad de datos para la etapa TRANSFORM.
+
+Las reglas son declarativas: cada una tiene un código, una severidad y una
+expresión vectorizada que devuelve la máscara de filas que la violan. Todas se
+evalúan en una sola pasada (una máscara por regla). Las filas que violan una
+regla "reject" se envían a cuarentena (Parquet) con sus códigos de motivo; las
+reglas "warn" solo se cuentan. Los conteos por regla quedan en el perfil de la
+ejecución (data/quarantine/quality_profile.json y df.attrs["quality"]).
+"""
+
+import importlib.util
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.config import QUARANTINE_DIR
+from src.metrics import record_bytes
+
+REJECT = "reject"
+WARN = "warn"
+PROFILE_FILE = f"{QUARANTINE_DIR}/quality_profile.json"
+_HAS_PARQUET = importlib.util.find_spec("pyarrow") is not None
+# El modo streaming evalúa bloques en paralelo: el perfil se actualiza de a uno
+_profile_lock = threading.Lock()
+
+
+def _blank(series: pd.Series) -> pd.Series:
+    """Nulo, string vacío o solo espacios."""
+    return series.isna() | (series.astype(str).str.strip() == "")
+
+
+def _unparseable(raw: pd.Series, parsed: pd.Series) -> pd.Series:
+    """Tenía valor pero no se pudo convertir a número (read_csv ya deja las celdas vacías como NaN)."""
+    return raw.notna() & parsed.isna()
+
+
+# ===== REGLAS =====
+# (código, severidad, descripción, expresión sobre (df_crudo, df_parseado))
+PRODUCT_RULES = [
+    ("MISSING_PRODUCT_ID", REJECT, "product_id vacío",
+     lambda raw, df: _blank(raw["product_id"])),
+    ("MISSING_PRODUCT_NAME", REJECT, "product_name vacío",
+     lambda raw, df: _blank(raw["product_name"])),
+    ("UNPARSEABLE_DISCOUNTED_PRICE", REJECT, "discounted_price no numérico",
+     lambda raw, df: _unparseable(raw["discounted_price"], df["discounted_price"])),
+    ("UNPARSEABLE_RATING_COUNT", REJECT, "rating_count no numérico (p. ej. texto en lugar de un conteo)",
+     lambda raw, df: _unparseable(raw["rating_count"], df["rating_count"])),
+    ("UNPARSEABLE_ACTUAL_PRICE", WARN, "actual_price no numérico (se usa 0)",
+     lambda raw, df: _unparseable(raw["actual_price"], df["actual_price"])),
+    ("MISSING_CATEGORY", WARN, "category vacía (se usa Uncategorized)",
+     lambda raw, df: raw["category"].isna()),
+    ("RATING_OUT_OF_RANGE", WARN, "rating fuera de [0, 5] (se recorta)",
+     lambda raw, df: (df["rating"] < 0) | (df["rating"] > 5)),
+    ("DISCOUNT_OUT_OF_RANGE", WARN, "discount_percentage fuera de [0, 100] (se recorta)",
+     lambda raw, df: (df["discount_percentage"] < 0) | (df["discount_percentage"] > 100)),
+    ("DISCOUNTED_ABOVE_ACTUAL", WARN, "discounted_price mayor que actual_price",
+     lambda raw, df: df["discounted_price"] > df["actual_price"]),
+]
+
+CART_RULES = [
+    ("MISSING_CART_ID", REJECT, "cart_id vacío",
+     lambda raw, df: _blank(raw["cart_id"])),
+    ("INVALID_EVENT_TIME", REJECT, "event_time no es una fecha",
+     lambda raw, df: df["event_time"].isna()),
+    ("MISSING_EVENT_TYPE", REJECT, "event_type vacío",
+     lambda raw, df: _blank(raw["event_type"])),
+    ("QUANTITY_OUT_OF_RANGE", WARN, "quantity fuera de [1, 100] (se recorta)",
+     lambda raw, df: (df["quantity"] < 1) | (df["quantity"] > 100)),
+]
+
+
+def evaluate_rules(raw: pd.DataFrame, parsed: pd.DataFrame, rules: list) -> pd.DataFrame:
+    """Evalúa todas las reglas y devuelve un DataFrame booleano con una máscara por regla."""
+    masks = {}
+    for code, _, _, check in rules:
+        try:
+            masks[code] = check(raw, parsed).fillna(False).astype(bool).to_numpy()
+        except KeyError:
+            # La columna no existe en este dataset: la regla no aplica
+            masks[code] = np.zeros(len(raw), dtype=bool)
+    return pd.DataFrame(masks, index=raw.index)
+
+
+def _reason_codes(masks: pd.DataFrame) -> pd.Series:
+    """Concatena los códigos violados por fila (vectorizado por regla, no por fila)."""
+    reasons = pd.Series("", index=masks.index, dtype=object)
+    for code in masks.columns:
+        reasons = reasons + np.where(masks[code].to_numpy(), f"{code};", "")
+    return reasons.str.rstrip(";")
+
+
+def _write_quarantine(rejected: pd.DataFrame, dataset: str, run_id: str = None, chunk: int = None) -> str:
+    """
+    Escribe las filas rechazadas en Parquet (CSV si no hay pyarrow). El nombre
+    lleva la fecha y un id único de la escritura (o el run_id y el número de
+    bloque en el modo streaming), así dos cuarentenas del mismo dataset en el
+    mismo segundo (p. ej. varios archivos *cart*.csv) no se pisan.
+    """
+    Path(QUARANTINE_DIR).mkdir(parents=True, exist_ok=True)
+    # Valores crudos como texto: las filas rechazadas suelen tener tipos mezclados
+    rejected = rejected.astype(str)
+    extension = "parquet" if _HAS_PARQUET else "csv"
+    run_stamp = run_id or f"{datetime.utcnow():%Y%m%dT%H%M%S}_{uuid.uuid4().hex[:8]}"
+    suffix = f"_{chunk:05d}" if chunk is not None else ""
+    path = f"{QUARANTINE_DIR}/{dataset}_quarantine_{run_stamp}{suffix}.{extension}"
+    tmp_path = f"{path}.tmp"
+    if _HAS_PARQUET:
+        rejected.to_parquet(tmp_path, index=False)
+    else:
+        rejected.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    record_bytes("quarantine", path)
+    return path
+
+
+def _update_profile(dataset: str, counts: dict, total: int, rejected: int, run_id: str = None):
+    """
+    Agrega los conteos por regla al perfil de la ejecución. Con run_id, los
+    bloques de una misma ejecución se suman en la entrada del dataset.
+    """
+    with _profile_lock:
+        try:
+            with open(PROFILE_FILE, encoding="utf-8") as f:
+                profile = json.load(f)
+        except (OSError, ValueError):
+            profile = {}
+
+        previous = profile.get(dataset)
+        if run_id is not None and previous and previous.get("run_id") == run_id:
+            total += previous["rows"]
+            rejected += previous["rejected"]
+            counts = {
+                code: {**info, "rows": info["rows"] + previous["rules"].get(code, {}).get("rows", 0)}
+                for code, info in counts.items()
+            }
+
+        profile[dataset] = {
+            "evaluated_at": datetime.utcnow().isoformat(),
+            "rows": total,
+            "rejected": rejected,
+            "rules": counts,
+        }
+        if run_id is not None:
+            profile[dataset]["run_id"] = run_id
+        Path(PROFILE_FILE).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{PROFILE_FILE}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(profile, f, indent=2)
+        os.replace(tmp_path, PROFILE_FILE)
+
+
+def apply_quality_rules(
+    raw: pd.DataFrame, parsed: pd.DataFrame, rules: list, dataset: str, run_id: str = None, chunk: int = None
+) -> Tuple[pd.DataFrame, dict]:
+    """
+    Aplica las reglas sobre `parsed` (mismas filas que `raw`). Devuelve el
+    DataFrame sin las filas rechazadas y los conteos por regla. En el modo
+    streaming run_id y chunk identifican el bloque: el perfil suma todos los
+    bloques de la ejecución en una sola entrada por dataset.
+    """
+    masks = evaluate_rules(raw, parsed, rules)
+    reject_codes = [code for code, severity, _, _ in rules if severity == REJECT]
+    rejected_mask = masks[reject_codes].any(axis=1)
+
+    counts = {
+        code: {"severity": severity, "description": description, "rows": int(masks[code].sum())}
+        for code, severity, description, _ in rules
+    }
+
+    n_rejected = int(rejected_mask.sum())
+    if n_rejected:
+        quarantine = raw[rejected_mask].copy()
+        quarantine["reason_codes"] = _reason_codes(masks[rejected_mask])
+        quarantine["quarantined_at"] = datetime.utcnow().isoformat()
+        path = _write_quarantine(quarantine, dataset, run_id, chunk)
+        print(f"[QUALITY] {n_rejected} filas de {dataset} enviadas a cuarentena: {path}")
+
+    for code, info in counts.items():
+        if info["rows"]:
+            print(f"[QUALITY] {dataset} {code} ({info['severity']}): {info['rows']} filas")
+
+    _update_profile(dataset, counts, len(raw), n_rejected, run_id)
+    # Copia explícita: los llamadores asignan columnas sobre el resultado
+    return parsed.loc[~rejected_mask].copy(), counts
@@ -0,0 +1,99 @@
+"""
+Resumen por carrito (sesión), calculado una sola vez después de TRANSFORM.
+
+build_cart_sessions agrupa los eventos de forma vectorizada y devuelve una
+fila por carrito con conteos por tipo de evento, ítems, resultado, duración,
+ingresos, ingresos perdidos y productos distintos. Los campos se guardan en
+el mismo hash cart:<id> al cargar Redis, así los reportes y gráficos leen el
+resumen con HMGET y nunca vuelven a decodificar el JSON de eventos.
+"""
+
+import numpy as np
+import pandas as pd
+
+EVENT_TYPES = ["add", "checkout", "abandon", "stock_out"]
+
+# Campos del resumen guardados en cada hash cart:<id>
+SESSION_FIELDS = [
+    "n_events",
+    "n_add",
+    "n_checkout",
+    "n_abandon",
+    "n_stock_out",
+    "items_added",
+    "items_checked_out",
+    "distinct_products",
+    "outcome",
+    "first_event",
+    "last_event",
+    "duration_s",
+    "total_revenue",
+    "lost_revenue",
+]
+INT_FIELDS = [
+    "n_events", "n_add", "n_checkout", "n_abandon", "n_stock_out",
+    "items_added", "items_checked_out", "distinct_products",
+]
+FLOAT_FIELDS = ["duration_s", "total_revenue", "lost_revenue"]
+
+
+def build_cart_sessions(df: pd.DataFrame) -> pd.DataFrame:
+    """Una fila por cart_id con el resumen de la sesión (sin iterar filas)."""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=["customer_id"] + SESSION_FIELDS)
+
+    events = df.assign(
+        cart_id=df["cart_id"].astype(str),
+        event_type=df["event_type"].astype(str),
+        event_time=pd.to_datetime(df["event_time"]),
+    )
+    grouped = events.groupby("cart_id", sort=False)
+
+    sessions = grouped.agg(
+        customer_id=("customer_id", "first"),
+        n_events=("event_type", "size"),
+        distinct_products=("product_id", "nunique"),
+        first_event=("event_time", "min"),
+        last_event=("event_time", "max"),
+        total_revenue=("revenue", "sum"),
+        lost_revenue=("lost_revenue", "sum"),
+    )
+
+    by_type = events.groupby(["cart_id", "event_type"], sort=False).size().unstack(fill_value=0)
+    for event_type in EVENT_TYPES:
+        sessions[f"n_{event_type}"] = by_type[event_type] if event_type in by_type else 0
+
+    quantity = events["quantity"].astype(int)
+    sessions["items_added"] = quantity.where(events["event_type"] == "add", 0).groupby(events["cart_id"]).sum()
+    sessions["items_checked_out"] = quantity.where(events["event_type"] == "checkout", 0).groupby(events["cart_id"]).sum()
+
+    sessions["duration_s"] = (sessions["last_event"] - sessions["first_event"]).dt.total_seconds()
+    sessions["outcome"] = np.select(
+        [sessions["n_checkout"] > 0, sessions["n_abandon"] > 0, sessions["n_stock_out"] > 0],
+        ["checkout", "abandon", "stock_out"],
+        default="open",
+    )
+    sessions[INT_FIELDS] = sessions[INT_FIELDS].fillna(0).astype(int)
+    sessions["customer_id"] = sessions["customer_id"].astype(str)
+    return sessions[["customer_id"] + SESSION_FIELDS]
+
+
+def session_mappings(sessions: pd.DataFrame) -> dict:
+    """Campos listos para HSET por cart_id (las fechas como texto ISO)."""
+    table = sessions[SESSION_FIELDS].copy()
+    table["first_event"] = table["first_event"].astype(str)
+    table["last_event"] = table["last_event"].astype(str)
+    return table.to_dict("index")
+
+
+def parse_session_fields(values: list, fields: list) -> dict:
+    """Convierte la respuesta de HMGET(fields) a tipos de Python (faltantes = 0)."""
+    parsed = {}
+    for field, value in zip(fields, values):
+        if field in INT_FIELDS:
+            parsed[field] = int(value or 0)
+        elif field in FLOAT_FIELDS:
+            parsed[field] = float(value or 0)
+        else:
+            parsed[field] = value
+    return parsed
@@ -0,0 +1,243 @@
+"""
+Sharding del keyspace de carritos (cart:*) entre varias instancias de Redis.
+
+Cada clave se asigna a un shard con hashing consistente: cada instancia
+aporta REDIS_SHARD_VNODES puntos a un anillo de 64 bits y la clave va al
+primer punto que sigue a su hash. Al agregar o quitar un shard solo se mueve
+~1/N de las claves.
+
+Las escrituras se agrupan por shard y se envían como un pipeline por shard,
+todos en paralelo; los recorridos (SCAN) y agregados corren en paralelo en
+cada shard y después se combinan. Sin REDIS_SHARDS todo va a la instancia
+única de siempre.
+
+Benchmark (con varias instancias locales):
+    for p in 7001 7002 7003 7004; do redis-server --port $p --save "" --daemonize yes; done
+    python -m src.sharding --benchmark --shards 7001 7002 7003 7004
+"""
+
+import bisect
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from src.config import REDIS_DB, REDIS_SHARD_VNODES, REDIS_SHARDS
+from src.metrics import observe, record_roundtrip
+from src.sessions import EVENT_TYPES
+from src.tracing import trace_redis
+
+
+def _hash64(value: str) -> int:
+    """Hash estable de 64 bits (no depende de PYTHONHASHSEED)."""
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+def shard_name(host: str, port: int) -> str:
+    """Identidad del shard en el anillo (no su posición en la lista)."""
+    return f"{host}:{port}"
+
+
+def build_hash_ring(names: List[str], vnodes: int = REDIS_SHARD_VNODES) -> dict:
+    """Construye el anillo: puntos ordenados y el índice de shard dueño de cada uno."""
+    points = sorted(
+        (_hash64(f"{name}#{i}"), index)
+        for index, name in enumerate(names)
+        for i in range(vnodes)
+    )
+    return {
+        "points": [point for point, _ in points],
+        "owners": [owner for _, owner in points],
+        "size": len(names),
+    }
+
+
+def shard_for_key(ring: dict, key: str) -> int:
+    """Índice del shard dueño de una clave."""
+    if ring["size"] == 1:
+        return 0
+    position = bisect.bisect(ring["points"], _hash64(key))
+    return ring["owners"][position % len(ring["points"])]
+
+
+def group_keys_by_shard(ring: dict, keys) -> dict:
+    """Agrupa claves por shard: {índice: [claves]}."""
+    groups = {}
+    for key in keys:
+        groups.setdefault(shard_for_key(ring, key), []).append(key)
+    return groups
+
+
+def get_cart_clients(primary=None, shards: Optional[list] = None) -> Optional[list]:
+    """
+    Conexiones a los shards de carritos. Sin shards configurados devuelve
+    [primary] (o una conexión nueva a la instancia única).
+    """
+    import redis
+
+    from src.config import get_redis_connection
+
+    shards = REDIS_SHARDS if shards is None else shards
+    if not shards:
+        client = primary if primary is not None else get_redis_connection()
+        return None if client is None else [client]
+
+    clients = []
+    for host, port in shards:
+        try:
+            client = redis.Redis(host=host, port=port, db=REDIS_DB, decode_responses=True)
+            client.ping()
+            clients.append(trace_redis(client))
+        except Exception as e:
+            print(f"[SHARD] Error conectando a {shard_name(host, port)}: {e}")
+            close_cart_clients(clients)
+            return None
+
+    print(f"[SHARD] Conectado a {len(clients)} shards de Redis")
+    return clients
+
+
+def close_cart_clients(clients: Optional[list], primary=None):
+    """Cierra las conexiones a los shards y la principal (clients puede ser None o incluir a primary)."""
+    for client in clients or []:
+        if client is not primary:
+            client.close()
+    if primary is not None:
+        primary.close()
+
+
+def ring_for_clients(clients: list) -> dict:
+    """Anillo que corresponde a una lista de conexiones."""
+    names = [
+        shard_name(c.connection_pool.connection_kwargs.get("host", "localhost"),
+                   c.connection_pool.connection_kwargs.get("port", 6379))
+        for c in clients
+    ]
+    if len(set(names)) < len(names):
+        # Conexiones sin host/puerto distinguibles (p. ej. clientes en memoria)
+        names = [f"shard-{i}" for i in range(len(clients))]
+    return build_hash_ring(names)
+
+
+def map_shards(clients: list, fn: Callable) -> list:
+    """Ejecuta fn(cliente) en todos los shards en paralelo; resultados en el orden de clients."""
+    if len(clients) == 1:
+        return [fn(clients[0])]
+    with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+        return list(pool.map(fn, clients))
+
+
+def run_sharded_pipelines(clients: list, keys, queue: Callable, ring: dict = None) -> dict:
+    """
+    Encola queue(pipe, key) para cada clave en el pipeline de su shard,
+    ejecuta un pipeline por shard en paralelo y devuelve {clave: [resultados]}.
+    """
+    ring = ring or ring_for_clients(clients)
+    groups = group_keys_by_shard(ring, keys)
+
+    def execute(index):
+        pipe = clients[index].pipeline(transaction=False)
+        spans = []
+        for key in groups[index]:
+            start = len(pipe)
+            queue(pipe, key)
+            spans.append((key, start, len(pipe)))
+        started = time.perf_counter()
+        replies = pipe.execute()
+        observe("etl_operation_duration_seconds", time.perf_counter() - started, operation="redis_pipeline")
+        record_roundtrip("redis", "pipeline", batch_size=len(spans))
+        return {key: replies[start:end] for key, start, end in spans}
+
+    results = {}
+    if len(groups) == 1:
+        results.update(execute(next(iter(groups))))
+        return results
+    with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+        for partial in pool.map(execute, list(groups)):
+            results.update(partial)
+    return results
+
+
+def scan_sharded(clients: list, pattern: str, count: int = 500) -> list:
+    """SCAN en paralelo en todos los shards; devuelve todas las claves encontradas."""
+    per_shard = map_shards(clients, lambda c: list(c.scan_iter(pattern, count=count)))
+    return [key for keys in per_shard for key in keys]
+
+
+def flush_shards(clients: list):
+    """Vacía todos los shards (carga completa)."""
+    map_shards(clients, lambda c: c.flushdb())
+
+
+# ===== BENCHMARK =====
+
+def _benchmark_mapping(i: int) -> dict:
+    """Carrito sintético con el mismo resumen que escribe la carga (un evento add)."""
+    return {
+        "customer_id": f"CUST-{i % 997:03d}",
+        "events": '[{"event_type": "add", "quantity": 1, "revenue": 0.0}]',
+        **{f"n_{event_type}": int(event_type == "add") for event_type in EVENT_TYPES},
+        "total_revenue": i % 500,
+        "lost_revenue": 0,
+        "loaded_at": datetime.utcnow().isoformat(),
+    }
+
+
+def benchmark_sharding(clients: list, n_carts: int = 100_000, batch_size: int = 5_000) -> list:
+    """
+    Mide escrituras (HSET en pipelines por shard) y un recorrido completo
+    (SCAN + HMGET) usando 1..N shards. Devuelve una fila por configuración.
+    """
+    from src.visualizations import _fetch_cart_aggregates, merge_cart_aggregates
+
+    keys = [f"cart:CART-BENCH-{i:07d}" for i in range(n_carts)]
+    mappings = {key: _benchmark_mapping(i) for i, key in enumerate(keys)}
+    rows = []
+
+    for n in range(1, len(clients) + 1):
+        shards = clients[:n]
+        ring = ring_for_clients(shards)
+        flush_shards(shards)
+
+        start = time.perf_counter()
+        for offset in range(0, n_carts, batch_size):
+            batch = keys[offset:offset + batch_size]
+            run_sharded_pipelines(shards, batch, lambda pipe, key: pipe.hset(key, mapping=mappings[key]), ring)
+        write_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        aggregates = merge_cart_aggregates(map_shards(shards, _fetch_cart_aggregates))
+        scan_s = time.perf_counter() - start
+
+        per_shard = [len(v) for v in group_keys_by_shard(ring, keys).values()]
+        rows.append({
+            "shards": n,
+            "write_s": round(write_s, 3),
+            "writes_per_s": round(n_carts / write_s),
+            "scan_s": round(scan_s, 3),
+            "carts_scanned": aggregates["carts"],
+            "max_shard_share": round(max(per_shard) / n_carts, 3),
+        })
+        print(
+            f"[SHARD] {n} shard(s): {rows[-1]['writes_per_s']:>9} escrituras/s, "
+            f"scan {scan_s:.2f}s, shard más cargado {rows[-1]['max_shard_share']:.1%}"
+        )
+
+    flush_shards(clients)
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sharding de carritos en Redis")
+    parser.add_argument("--benchmark", action="store_true", help="Mide el throughput con 1..N shards")
+    parser.add_argument("--shards", nargs="*", type=int, help="Puertos de instancias locales (default: REDIS_SHARDS)")
+    parser.add_argument("--carts", type=int, default=100_000, help="Carritos a escribir por configuración")
+    args = parser.parse_args()
+
+    shard_list = [("localhost", port) for port in args.shards] if args.shards else None
+    cart_clients = get_cart_clients(shards=shard_list)
+    if cart_clients and args.benchmark:
+        benchmark_sharding(cart_clients, n_carts=args.carts)
@@ -0,0 +1,106 @@
+"""
+Foto (snapshot) columnar del keyspace de carritos para consultas analíticas.
+
+take_cart_snapshot recorre cart:* una sola vez (SCAN por shard + HMGET en
+pipeline por lotes) y deja un DataFrame con una fila por carrito: cliente,
+totales y el resumen de la sesión (src/sessions.py). Todas las consultas de
+examples.py, y las que quieran escribir los analistas, se responden desde
+ese DataFrame sin volver a Redis ni decodificar los eventos.
+
+Uso:
+    from src.snapshot import take_cart_snapshot, revenue_totals, conversion_rates
+    snap = take_cart_snapshot()
+    revenue_totals(snap), conversion_rates(snap)
+"""
+
+from typing import Optional
+
+import pandas as pd
+
+from src.sessions import EVENT_TYPES, FLOAT_FIELDS, INT_FIELDS, SESSION_FIELDS
+from src.sharding import get_cart_clients, ring_for_clients, run_sharded_pipelines, scan_sharded
+
+SNAPSHOT_FIELDS = ["customer_id"] + SESSION_FIELDS + ["loaded_at"]
+SNAPSHOT_BATCH_SIZE = 1_000
+
+
+def take_cart_snapshot(cart_clients: list = None, batch_size: int = SNAPSHOT_BATCH_SIZE) -> Optional[pd.DataFrame]:
+    """Lee todos los carritos una vez y devuelve un DataFrame indexado por cart_id."""
+    own_clients = cart_clients is None
+    if own_clients:
+        cart_clients = get_cart_clients()
+        if cart_clients is None:
+            return None
+
+    try:
+        ring = ring_for_clients(cart_clients)
+        keys = scan_sharded(cart_clients, "cart:CART-*")
+        rows = []
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            replies = run_sharded_pipelines(
+                cart_clients, batch, lambda pipe, key: pipe.hmget(key, *SNAPSHOT_FIELDS), ring
+            )
+            rows.extend([key[len("cart:"):]] + replies[key][0] for key in batch)
+    finally:
+        if own_clients:
+            for client in cart_clients:
+                client.close()
+
+    snapshot = pd.DataFrame(rows, columns=["cart_id"] + SNAPSHOT_FIELDS).set_index("cart_id").sort_index()
+    snapshot[INT_FIELDS] = snapshot[INT_FIELDS].apply(pd.to_numeric, errors="coerce").fillna(0).astype(int)
+    snapshot[FLOAT_FIELDS] = snapshot[FLOAT_FIELDS].apply(pd.to_numeric, errors="coerce").fillna(0.0)
+    snapshot["customer_id"] = snapshot["customer_id"].fillna("Unknown")
+    snapshot["outcome"] = snapshot["outcome"].fillna("open").astype("category")
+    print(f"[SNAPSHOT] {len(snapshot)} carritos leídos en una pasada")
+    return snapshot
+
+
+# ===== CONSULTAS SOBRE LA FOTO =====
+
+def top_carts(snapshot: pd.DataFrame, n: int = 3, by: str = "total_revenue") -> pd.DataFrame:
+    """Los n carritos con mayor valor en una columna."""
+    return snapshot.nlargest(n, by)[["customer_id", "total_revenue", "lost_revenue", "outcome"]]
+
+
+def revenue_totals(snapshot: pd.DataFrame) -> dict:
+    """Ingresos totales y perdidos."""
+    return {
+        "total_revenue": float(snapshot["total_revenue"].sum()),
+        "lost_revenue": float(snapshot["lost_revenue"].sum()),
+    }
+
+
+def event_counts(snapshot: pd.DataFrame) -> pd.Series:
+    """Eventos por tipo (ordenados de mayor a menor)."""
+    counts = snapshot[[f"n_{t}" for t in EVENT_TYPES]].sum()
+    counts.index = EVENT_TYPES
+    return counts.sort_values(ascending=False)
+
+
+def unique_customers(snapshot: pd.DataFrame) -> list:
+    """Clientes distintos con al menos un carrito."""
+    return sorted(snapshot.loc[snapshot["customer_id"] != "Unknown", "customer_id"].unique())
+
+
+def conversion_rates(snapshot: pd.DataFrame) -> dict:
+    """Carritos completados y abandonados sobre el total de carritos (por carrito, no por evento)."""
+    total = len(snapshot)
+    checkout_carts = int((snapshot["n_checkout"] > 0).sum())
+    abandoned_carts = int((snapshot["n_abandon"] > 0).sum())
+    return {
+        "total_carts": total,
+        "checkout_carts": checkout_carts,
+        "abandoned_carts": abandoned_carts,
+        "checkout_rate": checkout_carts / total if total else 0.0,
+        "abandon_rate": abandoned_carts / total if total else 0.0,
+    }
+
+
+def carts_by_customer(snapshot: pd.DataFrame) -> pd.DataFrame:
+    """Carritos, ingresos y conversiones por cliente."""
+    return snapshot.groupby("customer_id").agg(
+        carts=("n_events", "size"),
+        total_revenue=("total_revenue", "sum"),
+        checkouts=("n_checkout", "sum"),
+    ).sort_values("total_revenue", ascending=False)
@@ -0,0 +1,220 @@
+"""
+Sincronización de stock Redis → MongoDB con write-behind (ver CRUCES_DE_INFORMACION.md, Cruce 2).
+
+En cada checkout el stock se descuenta de forma atómica en Redis (script Lua)
+y las unidades vendidas se acumulan por producto en un hash pendiente. Cada
+STOCK_FLUSH_INTERVAL segundos el hash se vuelca a MongoDB en un único
+bulk_write con $inc sobre stock y total_sales, de modo que miles de checkouts
+por segundo se convierten en unas pocas escrituras por segundo.
+"""
+
+import threading
+import time
+
+import pandas as pd
+from pymongo import UpdateOne
+from redis.commands.core import Script
+from redis.exceptions import ResponseError
+
+from src.config import DEFAULT_STOCK, STOCK_FLUSH_INTERVAL, get_mongo_connection, get_redis_connection
+from src.metrics import record_roundtrip
+
+STOCK_KEY_PREFIX = "stock:"
+PENDING_KEY = "stock:pending"
+FLUSHING_KEY = "stock:pending:flushing"
+FLUSHING_ID_KEY = "stock:pending:flushing:id"
+
+# Descuenta stock solo si alcanza; inicializa el contador con DEFAULT_STOCK si no existe.
+# Devuelve el stock restante o -1 si no hay stock suficiente (stock_out).
+_CHECKOUT_LUA = """
+local stock = redis.call('GET', KEYS[1])
+if not stock then
+    stock = ARGV[2]
+    redis.call('SET', KEYS[1], stock)
+end
+stock = tonumber(stock)
+local qty = tonumber(ARGV[1])
+if stock < qty then
+    return -1
+end
+redis.call('DECRBY', KEYS[1], qty)
+redis.call('HINCRBY', KEYS[2], ARGV[3], qty)
+return stock - qty
+"""
+# Se registra una sola vez; cada llamada pasa la conexión (o el pipeline) a usar.
+# En bytes, el SHA se calcula sin necesitar un cliente registrado.
+_CHECKOUT_SCRIPT = Script(None, _CHECKOUT_LUA.encode())
+
+
+def apply_checkout(redis_client, product_id: str, quantity: int) -> int:
+    """Descuenta stock en Redis y deja el movimiento pendiente de volcar a MongoDB."""
+    return _CHECKOUT_SCRIPT(
+        keys=[f"{STOCK_KEY_PREFIX}{product_id}", PENDING_KEY],
+        args=[int(quantity), DEFAULT_STOCK, product_id],
+        client=redis_client,
+    )
+
+
+def queue_checkouts(redis_client, df: pd.DataFrame, pipe=None) -> int:
+    """
+    Agrupa los checkouts de un lote por producto y los descuenta en un solo
+    pipeline. Con `pipe` solo encola los scripts (el llamador ejecuta).
+    """
+    if df is None or df.empty:
+        return 0
+
+    checkouts = df[df["event_type"] == "checkout"]
+    units = checkouts.groupby("product_id", observed=True)["quantity"].sum()
+    if units.empty:
+        return 0
+
+    own_pipe = pipe is None
+    if own_pipe:
+        pipe = redis_client.pipeline(transaction=False)
+    for product_id, quantity in units.items():
+        _CHECKOUT_SCRIPT(
+            keys=[f"{STOCK_KEY_PREFIX}{product_id}", PENDING_KEY],
+            args=[int(quantity), DEFAULT_STOCK, product_id],
+            client=pipe,
+        )
+    if not own_pipe:
+        return len(units)
+    results = pipe.execute()
+    record_roundtrip("redis", "checkout_script", batch_size=len(units))
+
+    rejected = sum(1 for r in results if r == -1)
+    print(f"[STOCK] {len(units)} productos con checkout descontados en Redis ({rejected} sin stock)")
+    return len(units)
+
+
+def seed_stock_counters(redis_client, collection) -> int:
+    """Copia el stock de MongoDB a Redis para los productos sin contador (SET NX)."""
+    pipe = redis_client.pipeline(transaction=False)
+    count = 0
+    for doc in collection.find({}, {"product_id": 1, "stock": 1}):
+        pipe.set(f"{STOCK_KEY_PREFIX}{doc['product_id']}", int(doc.get("stock", DEFAULT_STOCK)), nx=True)
+        count += 1
+    pipe.execute()
+    return count
+
+
+def _open_flush_window(redis_client):
+    """
+    Renombra el hash pendiente a la ventana de volcado y le asigna un id
+    creciente (en la misma transacción). Devuelve el id o None si no hay
+    movimientos. El id es temporal (ns) para que siga creciendo aunque una
+    carga completa haga flushdb y los productos conserven el último id.
+    """
+    flush_id = time.time_ns()
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.set(FLUSHING_ID_KEY, flush_id)
+    pipe.rename(PENDING_KEY, FLUSHING_KEY)
+    try:
+        pipe.execute()
+    except ResponseError:
+        return None  # No hay movimientos pendientes
+    return flush_id
+
+
+def flush_pending_stock(redis_client, collection) -> int:
+    """
+    Vuelca a MongoDB los descuentos acumulados con un bulk_write de $inc.
+    El hash pendiente se renombra de forma atómica para que los checkouts que
+    llegan durante el volcado se acumulen en una nueva ventana. Si el volcado
+    falla, la ventana renombrada se reintenta en la siguiente llamada.
+
+    Cada ventana tiene un id (stock_flush_id) que se guarda en el producto en
+    el mismo update: al reintentar una ventana (corte o BulkWriteError
+    parcial) los productos que ya la aplicaron no vuelven a descontarse.
+    """
+    flush_id = redis_client.get(FLUSHING_ID_KEY) if redis_client.exists(FLUSHING_KEY) else None
+    if flush_id is None:
+        flush_id = _open_flush_window(redis_client)
+        if flush_id is None:
+            return 0
+    flush_id = int(flush_id)
+
+    pending = redis_client.hgetall(FLUSHING_KEY)
+    operations = [
+        UpdateOne(
+            {"product_id": product_id, "stock_flush_id": {"$not": {"$gte": flush_id}}},
+            {"$inc": {"stock": -int(units), "total_sales": int(units)}, "$set": {"stock_flush_id": flush_id}},
+        )
+        for product_id, units in pending.items()
+        if int(units)
+    ]
+
+    if operations:
+        result = collection.bulk_write(operations, ordered=False)
+        record_roundtrip("mongo", "bulk_write", batch_size=len(operations))
+        print(f"[STOCK] {result.modified_count} productos actualizados en MongoDB ({len(operations)} $inc)")
+
+    redis_client.delete(FLUSHING_KEY, FLUSHING_ID_KEY)
+    return len(operations)
+
+
+def sync_stock_to_mongodb() -> bool:
+    """Vuelca los descuentos pendientes y siembra los contadores de Redis desde MongoDB."""
+    redis_client = get_redis_connection()
+    client, _, collection = get_mongo_connection()
+    if redis_client is None or collection is None:
+        return False
+
+    try:
+        flush_pending_stock(redis_client, collection)
+        seeded = seed_stock_counters(redis_client, collection)
+        print(f"[STOCK] Contadores de stock sincronizados para {seeded} productos")
+        return True
+    except Exception as e:
+        print(f"[STOCK] Error sincronizando stock: {e}")
+        return False
+    finally:
+        redis_client.close()
+        client.close()
+
+
+def start_stock_sync(redis_client, interval: float = STOCK_FLUSH_INTERVAL):
+    """
+    Inicia el hilo write-behind que vuelca el stock cada `interval` segundos.
+    Devuelve (thread, stop_event); al activar stop_event se hace un último volcado.
+    """
+    stop_event = threading.Event()
+
+    def writer():
+        client, _, collection = get_mongo_connection()
+        if collection is None:
+            return
+        def flush():
+            try:
+                flush_pending_stock(redis_client, collection)
+            except Exception as e:
+                # La ventana queda en FLUSHING_KEY y se reintenta en el siguiente ciclo
+                print(f"[STOCK] Error volcando stock a MongoDB: {e}")
+
+        while not stop_event.wait(interval):
+            flush()
+        flush()
+        client.close()
+
+    thread = threading.Thread(target=writer, name="stock-sync", daemon=True)
+    thread.start()
+    print(f"[STOCK] Sincronización write-behind iniciada (cada {interval}s)")
+    return thread, stop_event
+
+
+def stop_stock_sync(thread: threading.Thread, stop_event: threading.Event):
+    """Detiene el hilo write-behind esperando el volcado final."""
+    stop_event.set()
+    thread.join()
+    print("[STOCK] Sincronización write-behind detenida")
+
+
+if __name__ == "__main__":
+    redis_client = get_redis_connection()
+    if redis_client is not None:
+        thread, stop_event = start_stock_sync(redis_client)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            stop_stock_sync(thread, stop_event)
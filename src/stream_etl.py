@@ -0,0 +1,385 @@
+"""
+Pipeline en streaming: extract, transform y load solapados con colas acotadas.
+
+    lector ─► raw_q ─► transformadores (N) ─┬─► products_q ─► dedup ─► mongo_q ─► cargadores MongoDB (M)
+                                            └─► redis_q[k] (partición por cart_id) ─► cargador Redis k
+
+Mientras un bloque se escribe en MongoDB o Redis el siguiente ya se está
+leyendo y limpiando, así que el rendimiento total se acerca al de la etapa
+más lenta en lugar de la suma de todas. Cada cola admite STREAM_QUEUE_DEPTH
+bloques: si una etapa se atrasa, las anteriores quedan bloqueadas en put()
+(backpressure) y la memoria queda acotada a ~(colas × profundidad + hilos)
+bloques de EXTRACT_CHUNK_SIZE filas, no al dataset completo.
+
+Detalles:
+    - La deduplicación de productos es global y ordenada: un único hilo
+      reordena los bloques transformados por número de secuencia y los pasa
+      por deduplicate_product_chunks (mismo resultado que la carga por lotes).
+    - Los productos se cargan con los mismos upserts por product_id que
+      load_products_to_mongodb; los carritos con merge_carts_to_redis. Cada
+      cargador de Redis es dueño de una partición de cart_id, así dos hilos
+      nunca fusionan el mismo carrito a la vez, y la fusiona en orden de
+      secuencia con una sola conexión.
+    - Ambos CSV se abren y se lee su primer bloque antes de vaciar MongoDB y
+      Redis; una corrida que no carga ningún producto se considera fallida.
+    - Si un hilo falla se detienen todos (ningún put/get queda bloqueado).
+
+Uso:
+    python main.py stream [--workers N] [--queue-depth D] [--chunk-size C]
+"""
+
+import itertools
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import pandas as pd
+
+from src.config import (
+    AMAZON_CSV,
+    DEDUP_RULE,
+    EXTRACT_CHUNK_SIZE,
+    MONGO_LOAD_BATCH_SIZE,
+    REDIS_CART_CSV,
+    STREAM_MONGO_LOADERS,
+    STREAM_QUEUE_DEPTH,
+    STREAM_REDIS_LOADERS,
+    STREAM_TRANSFORM_WORKERS,
+    get_mongo_connection,
+    get_redis_connection,
+)
+from src.dedup import deduplicate_product_chunks
+from src.extract import iter_csv_chunks
+from src.incremental import reset_offsets_after_full_load
+from src.indexes import create_product_indexes, create_product_key_index, drop_product_indexes
+from src.load import merge_carts_to_redis, upsert_product_batch
+from src.metrics import set_stage
+from src.sharding import close_cart_clients, flush_shards, get_cart_clients
+from src.stock_sync import sync_stock_to_mongodb
+from src.transform import print_memory_change, transform_amazon_products, transform_redis_carts
+
+STREAM_STAGES = ["extract", "transform", "dedup", "load_mongo", "load_redis"]
+_POLL_S = 0.2
+
+
+# ===== COLAS CON BACKPRESSURE =====
+
+def _put(q: queue.Queue, item, stop: threading.Event, clock: dict) -> bool:
+    """put() bloqueante que se rinde si el pipeline se detuvo. Acumula la espera en clock."""
+    started = time.perf_counter()
+    try:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_S)
+                return True
+            except queue.Full:
+                continue
+        return False
+    finally:
+        clock["wait_out_s"] += time.perf_counter() - started
+
+
+def _get(q: queue.Queue, stop: threading.Event, clock: dict):
+    """get() bloqueante; None = fin del flujo o pipeline detenido."""
+    started = time.perf_counter()
+    try:
+        while not stop.is_set():
+            try:
+                return q.get(timeout=_POLL_S)
+            except queue.Empty:
+                continue
+        return None
+    finally:
+        clock["wait_in_s"] += time.perf_counter() - started
+
+
+def _in_order(q: queue.Queue, stop: threading.Event, clock: dict):
+    """Reordena (seq, bloque) que llegan de varios hilos y los entrega por número de secuencia."""
+    pending, next_seq = {}, 0
+    while True:
+        item = _get(q, stop, clock)
+        if item is None:
+            return
+        pending[item[0]] = item[1]
+        while next_seq in pending:
+            yield pending.pop(next_seq)
+            next_seq += 1
+
+
+def _new_clock() -> dict:
+    return {"chunks": 0, "rows": 0, "wait_in_s": 0.0, "wait_out_s": 0.0, "started": time.perf_counter()}
+
+
+def _partition_by_cart(df: pd.DataFrame, partitions: int) -> list:
+    """Divide un bloque de eventos en particiones disjuntas de cart_id."""
+    if partitions == 1:
+        return [df]
+    codes = pd.util.hash_pandas_object(df["cart_id"].astype(str), index=False).to_numpy() % partitions
+    return [df[codes == part] for part in range(partitions)]
+
+
+# ===== PIPELINE =====
+
+def _open_sources(chunksize: int) -> Optional[dict]:
+    """
+    Abre ambos CSV y lee su primer bloque antes de tocar las bases: si falta
+    un archivo o está vacío la carga completa no empieza. {dataset: bloques}.
+    """
+    sources = {}
+    for dataset, path in (("products", AMAZON_CSV), ("carts", REDIS_CART_CSV)):
+        chunks = iter_csv_chunks(path, chunksize)
+        try:
+            first = next(chunks, None)
+        except Exception as e:
+            print(f"[PIPELINE] No se pudo leer {path}: {e}")
+            return None
+        if first is None or first.empty:
+            print(f"[PIPELINE] {path} no existe o está vacío: MongoDB y Redis no se modifican")
+            return None
+        sources[dataset] = itertools.chain([first], chunks)
+    return sources
+
+
+def _prepare_targets(collection, redis_client, cart_clients):
+    """Carga completa: vacía la colección y Redis como load_all (índices secundarios al final)."""
+    collection.delete_many({})
+    drop_product_indexes(collection)
+    create_product_key_index(collection)
+    redis_client.flushdb()
+    if cart_clients[0] is not redis_client:
+        flush_shards(cart_clients)
+    print("[PIPELINE] MongoDB y Redis limpiados")
+
+
+def run_streaming_pipeline(
+    chunksize: int = EXTRACT_CHUNK_SIZE,
+    queue_depth: int = STREAM_QUEUE_DEPTH,
+    transform_workers: int = STREAM_TRANSFORM_WORKERS,
+    mongo_loaders: int = STREAM_MONGO_LOADERS,
+    redis_loaders: int = STREAM_REDIS_LOADERS,
+) -> Optional[dict]:
+    """
+    Ejecuta extract → transform → load en streaming. Devuelve las
+    estadísticas por etapa o None si alguna etapa falló.
+    """
+    sources = _open_sources(chunksize)
+    if sources is None:
+        return None
+
+    client, _, collection = get_mongo_connection()
+    redis_client = get_redis_connection()
+    cart_clients = get_cart_clients(redis_client) if redis_client is not None else None
+    if collection is None or cart_clients is None:
+        if client is not None:
+            client.close()
+        close_cart_clients(cart_clients, redis_client)
+        return None
+
+    _prepare_targets(collection, redis_client, cart_clients)
+    set_stage("stream")
+
+    raw_q = queue.Queue(maxsize=queue_depth)
+    products_q = queue.Queue(maxsize=queue_depth)
+    mongo_q = queue.Queue(maxsize=queue_depth)
+    redis_qs = [queue.Queue(maxsize=queue_depth) for _ in range(redis_loaders)]
+    stop = threading.Event()
+    errors = []
+    stats = {stage: [] for stage in STREAM_STAGES}
+    stats_lock = threading.Lock()
+    loaded_at = datetime.utcnow()
+    # Los bloques de la corrida suman sus conteos en una entrada del perfil de calidad por dataset
+    quality_run = loaded_at.strftime("%Y%m%dT%H%M%S")
+
+    def worker(stage: str, body):
+        """Ejecuta el cuerpo de un hilo, registra su reloj y detiene todo si falla."""
+        def run():
+            clock = _new_clock()
+            try:
+                body(clock)
+            except Exception as e:
+                errors.append((threading.current_thread().name, e))
+                print(f"[PIPELINE] Error en {threading.current_thread().name}: {e}")
+                stop.set()
+            finally:
+                clock["elapsed_s"] = time.perf_counter() - clock.pop("started")
+                with stats_lock:
+                    stats[stage].append(clock)
+        return run
+
+    def read(clock):
+        for dataset, chunks in sources.items():
+            for seq, chunk in enumerate(chunks):
+                clock["chunks"] += 1
+                clock["rows"] += len(chunk)
+                if not _put(raw_q, (dataset, seq, chunk), stop, clock):
+                    return
+
+    def transform(clock):
+        while True:
+            item = _get(raw_q, stop, clock)
+            if item is None:
+                return
+            dataset, seq, chunk = item
+            clock["chunks"] += 1
+            # Siempre se envía (aunque quede vacío) para que el reordenamiento avance
+            if dataset == "products":
+                out = transform_amazon_products(chunk, quality_run=quality_run, quality_chunk=seq, memory_report=False)
+                if not _put(products_q, (seq, out), stop, clock):
+                    return
+            else:
+                out = transform_redis_carts(chunk, quality_run=quality_run, quality_chunk=seq, memory_report=False)
+                parts = _partition_by_cart(out, redis_loaders) if out is not None else [None] * redis_loaders
+                for part, part_q in zip(parts, redis_qs):
+                    if not _put(part_q, (seq, part), stop, clock):
+                        return
+            if out is not None:
+                clock["rows"] += len(out)
+                # Memoria antes/después de optimizar tipos: se suma por dataset y se muestra al final
+                memory = clock.setdefault("memory", {}).setdefault(dataset, {"before_bytes": 0, "after_bytes": 0})
+                for field in memory:
+                    memory[field] += out.attrs["memory"][field]
+
+    def dedup(clock):
+        for chunk in deduplicate_product_chunks(_in_order(products_q, stop, clock), DEDUP_RULE):
+            clock["chunks"] += 1
+            clock["rows"] += len(chunk)
+            if not _put(mongo_q, chunk, stop, clock):
+                return
+
+    def load_mongo(clock):
+        while True:
+            chunk = _get(mongo_q, stop, clock)
+            if chunk is None:
+                return
+            rows = chunk.to_dict("records")
+            for start in range(0, len(rows), MONGO_LOAD_BATCH_SIZE):
+                upsert_product_batch(collection, rows[start:start + MONGO_LOAD_BATCH_SIZE], loaded_at)
+            clock["chunks"] += 1
+            clock["rows"] += len(rows)
+
+    def load_redis(part_q):
+        def body(clock):
+            # Una conexión por cargador; los bloques de la partición se fusionan en orden
+            loader_client = get_redis_connection()
+            loader_carts = get_cart_clients(loader_client) if loader_client is not None else None
+            try:
+                if loader_carts is None:
+                    raise RuntimeError("sin conexión a Redis")
+                for chunk in _in_order(part_q, stop, clock):
+                    if chunk is None or chunk.empty:
+                        continue
+                    if not merge_carts_to_redis(chunk, redis_client=loader_client, cart_clients=loader_carts):
+                        raise RuntimeError("merge_carts_to_redis falló")
+                    clock["chunks"] += 1
+                    clock["rows"] += len(chunk)
+            finally:
+                close_cart_clients(loader_carts, loader_client)
+        return body
+
+    def start(stage: str, body, name: str) -> threading.Thread:
+        thread = threading.Thread(target=worker(stage, body), name=name, daemon=True)
+        thread.start()
+        return thread
+
+    started = time.perf_counter()
+    reader = start("extract", read, "reader")
+    transformers = [start("transform", transform, f"transform-{i}") for i in range(transform_workers)]
+    deduper = start("dedup", dedup, "dedup")
+    mongo_threads = [start("load_mongo", load_mongo, f"load-mongo-{i}") for i in range(mongo_loaders)]
+    redis_threads = [start("load_redis", load_redis(q), f"load-redis-{i}") for i, q in enumerate(redis_qs)]
+
+    # Cierre en orden: cada etapa recibe un fin de flujo (None) por hilo cuando terminó la anterior
+    coordinator = {"wait_in_s": 0.0, "wait_out_s": 0.0}
+    reader.join()
+    for _ in transformers:
+        _put(raw_q, None, stop, coordinator)
+    for thread in transformers:
+        thread.join()
+    _put(products_q, None, stop, coordinator)
+    for part_q in redis_qs:
+        _put(part_q, None, stop, coordinator)
+    deduper.join()
+    for _ in mongo_threads:
+        _put(mongo_q, None, stop, coordinator)
+    for thread in mongo_threads + redis_threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    try:
+        if errors:
+            print(f"[PIPELINE] Pipeline detenido: {len(errors)} hilo(s) con error")
+            return None
+        if not sum(clock["rows"] for clock in stats["load_mongo"]):
+            print("[PIPELINE] No se cargó ningún producto en MongoDB: la carga se considera fallida")
+            return None
+
+        create_product_indexes(collection)
+        # La ingesta incremental sigue desde el final del archivo recién cargado
+        reset_offsets_after_full_load()
+        sync_stock_to_mongodb()
+    finally:
+        client.close()
+        close_cart_clients(cart_clients, redis_client)
+
+    summary = summarize_stream_stats(stats, elapsed)
+    print_stream_stats(summary)
+    return summary
+
+
+# ===== ESTADÍSTICAS =====
+
+def summarize_stream_stats(stats: dict, elapsed: float) -> dict:
+    """
+    Por etapa: filas, tiempo ocupado (sin esperas), esperas por entrada vacía
+    y por salida llena (backpressure) y filas/s por hilo ocupado.
+    """
+    stages = {}
+    for stage, clocks in stats.items():
+        if not clocks:
+            continue
+        busy = sum(c["elapsed_s"] - c["wait_in_s"] - c["wait_out_s"] for c in clocks)
+        rows = sum(c["rows"] for c in clocks)
+        stages[stage] = {
+            "threads": len(clocks),
+            "chunks": sum(c["chunks"] for c in clocks),
+            "rows": rows,
+            "busy_s": round(busy, 3),
+            "starved_s": round(sum(c["wait_in_s"] for c in clocks), 3),
+            "blocked_s": round(sum(c["wait_out_s"] for c in clocks), 3),
+            # Tiempo de pared que la etapa necesitaría sola con sus hilos
+            "stage_wall_s": round(busy / len(clocks), 3),
+        }
+    bottleneck = max(stages, key=lambda s: stages[s]["stage_wall_s"]) if stages else None
+    memory = {}
+    for clock in stats.get("transform", []):
+        for dataset, totals in clock.get("memory", {}).items():
+            merged = memory.setdefault(dataset, {"before_bytes": 0, "after_bytes": 0})
+            for field in merged:
+                merged[field] += totals[field]
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "sequential_s": round(sum(s["stage_wall_s"] for s in stages.values()), 3),
+        "bottleneck": bottleneck,
+        "stages": stages,
+        "memory": memory,
+    }
+
+
+def print_stream_stats(summary: dict):
+    """Muestra el resumen por etapa y la etapa cuello de botella."""
+    print(f"\n[PIPELINE] Completado en {summary['elapsed_s']:.2f} s "
+          f"(las etapas una tras otra sumarían ~{summary['sequential_s']:.2f} s)")
+    for stage, info in summary["stages"].items():
+        print(f"[PIPELINE]   {stage:<11} {info['threads']} hilo(s) {info['chunks']:>5} bloques {info['rows']:>9} filas | "
+              f"ocupado {info['busy_s']:.2f} s, sin entrada {info['starved_s']:.2f} s, "
+              f"bloqueado por backpressure {info['blocked_s']:.2f} s")
+    if summary["bottleneck"]:
+        print(f"[PIPELINE] Etapa más lenta: {summary['bottleneck']}")
+    for dataset, totals in summary.get("memory", {}).items():
+        print_memory_change(f"{dataset} (suma de bloques)", totals["before_bytes"], totals["after_bytes"])
+
+
+if __name__ == "__main__":
+    run_streaming_pipeline()
@@ -0,0 +1,274 @@
+"""
+INTEGRATION en streaming: consume eventos de carrito desde un Redis Stream
+(grupo de consumidores), los enriquece en micro-lotes con el catálogo de
+MongoDB y actualiza las métricas de forma incremental.
+
+Flujo:
+    realtime replay --XADD--> stream:cart_events --XREADGROUP--> [lector]
+        --> cola acotada (backpressure) --> [procesador] --> metrics:live
+
+Los buckets por minuto (src/timeseries.py) los registra la simulación en
+tiempo real al publicar, por eso el consumidor no los vuelve a sumar.
+
+Los carritos distintos (totales, con checkout, abandonados) se cuentan con
+sets exactos: el reporte del Cyberday los usa como totales.
+
+Uso:
+    python main.py consume [--consumer NOMBRE] [--max-batches N]
+"""
+
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+from redis.exceptions import ResponseError
+
+from src.config import (
+    STREAM_BATCH_SIZE,
+    STREAM_BLOCK_MS,
+    STREAM_MAX_IN_FLIGHT,
+    STREAM_MAXLEN,
+    get_mongo_connection,
+    get_redis_connection,
+)
+from src.integration import generate_cyberday_report
+from src.metrics import record_cache, record_roundtrip, record_rows
+
+CART_STREAM_KEY = "stream:cart_events"
+CONSUMER_GROUP = "integration"
+LIVE_METRICS_KEY = "metrics:live"
+LIVE_CARTS_KEY = "metrics:live:cart_ids"
+LIVE_CHECKOUT_CARTS_KEY = "metrics:live:cart_ids:checkout"
+LIVE_ABANDON_CARTS_KEY = "metrics:live:cart_ids:abandon"
+ENRICHED_STREAM_KEY = "stream:cart_events:enriched"
+
+
+def publish_cart_event(redis_client, event: dict):
+    """Publica un evento de carrito en el stream (lo usa la simulación en tiempo real)."""
+    fields = {k: str(v) for k, v in event.items()}
+    redis_client.xadd(CART_STREAM_KEY, fields, maxlen=STREAM_MAXLEN, approximate=True)
+
+
+def ensure_consumer_group(redis_client):
+    """Crea el grupo de consumidores si no existe."""
+    try:
+        redis_client.xgroup_create(CART_STREAM_KEY, CONSUMER_GROUP, id="0", mkstream=True)
+        print(f"[STREAM] Grupo {CONSUMER_GROUP} creado en {CART_STREAM_KEY}")
+    except Exception as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def _parse_event(fields: dict) -> dict:
+    """Convierte los campos del stream a tipos numéricos."""
+    return {
+        "cart_id": fields.get("cart_id"),
+        "customer_id": fields.get("customer_id"),
+        "event_time": fields.get("event_time"),
+        "event_type": fields.get("event_type"),
+        "product_id": fields.get("product_id"),
+        "quantity": int(float(fields.get("quantity", 1))),
+        "revenue": float(fields.get("revenue", 0)),
+        "lost_revenue": float(fields.get("lost_revenue", 0)),
+    }
+
+
+def _fetch_products(collection, cache: dict, product_ids: set) -> dict:
+    """Completa el cache del catálogo pidiendo los product_id faltantes en un solo $in."""
+    missing = [pid for pid in product_ids if pid not in cache]
+    record_cache("stream_catalog", len(product_ids) - len(missing), len(missing))
+    if missing and collection is not None:
+        record_roundtrip("mongo", "find_products", batch_size=len(missing))
+        projection = {"product_id": 1, "product_name": 1, "discounted_price": 1, "category": 1}
+        for doc in collection.find({"product_id": {"$in": missing}}, projection):
+            cache[doc["product_id"]] = {
+                "product_name": doc.get("product_name", "Unknown"),
+                "product_price": doc.get("discounted_price", 0),
+                "category": doc.get("category", "Uncategorized"),
+            }
+        # Recordar también los inexistentes para no volver a consultarlos
+        for pid in missing:
+            cache.setdefault(pid, {})
+    return cache
+
+
+def _process_batch(redis_client, collection, cache: dict, entries: list):
+    """Enriquece un micro-lote, actualiza métricas y confirma (XACK) los mensajes."""
+    events = [_parse_event(fields) for _, fields in entries]
+    products = _fetch_products(collection, cache, {e["product_id"] for e in events})
+
+    pipe = redis_client.pipeline(transaction=False)
+    for event in events:
+        event.update(products.get(event["product_id"], {}))
+        pipe.xadd(ENRICHED_STREAM_KEY, {"event": json.dumps(event)}, maxlen=STREAM_MAXLEN, approximate=True)
+        pipe.hincrby(LIVE_METRICS_KEY, f"{event['event_type']}_events", 1)
+        pipe.hincrbyfloat(LIVE_METRICS_KEY, "total_revenue", event["revenue"])
+        pipe.hincrbyfloat(LIVE_METRICS_KEY, "lost_revenue", event["lost_revenue"])
+        pipe.sadd(LIVE_CARTS_KEY, event["cart_id"])
+        if event["event_type"] == "checkout":
+            pipe.sadd(LIVE_CHECKOUT_CARTS_KEY, event["cart_id"])
+        elif event["event_type"] == "abandon":
+            pipe.sadd(LIVE_ABANDON_CARTS_KEY, event["cart_id"])
+    pipe.hincrby(LIVE_METRICS_KEY, "total_events", len(events))
+    pipe.hset(LIVE_METRICS_KEY, "updated_at", datetime.utcnow().isoformat())
+    pipe.xack(CART_STREAM_KEY, CONSUMER_GROUP, *[entry_id for entry_id, _ in entries])
+    pipe.execute()
+    record_roundtrip("redis", "stream_batch", batch_size=len(events))
+    record_rows(len(events), stage="stream")
+
+
+def run_stream_consumer(
+    consumer_name: str = "consumer-1",
+    batch_size: int = STREAM_BATCH_SIZE,
+    max_in_flight: int = STREAM_MAX_IN_FLIGHT,
+    max_batches: int = None,
+    stop_event: threading.Event = None,
+) -> int:
+    """
+    Consumidor de larga duración. Un hilo lector hace XREADGROUP y deja los
+    micro-lotes en una cola acotada; cuando la cola está llena el lector se
+    bloquea (backpressure) y los mensajes esperan en Redis.
+    Si el stream o el grupo desaparecen (p. ej. flushdb de una carga completa)
+    el lector los vuelve a crear; si el lector muere por otro error el
+    consumidor se detiene y lo relanza.
+    Devuelve la cantidad de eventos procesados.
+    """
+    redis_client = get_redis_connection()
+    if redis_client is None:
+        return 0
+    mongo_client, _, collection = get_mongo_connection()
+
+    ensure_consumer_group(redis_client)
+    stop_event = stop_event or threading.Event()
+    batches = queue.Queue(maxsize=max_in_flight)
+    cache = {}
+    reader_errors = []
+
+    def read_entries(last_id: str) -> list:
+        response = redis_client.xreadgroup(
+            CONSUMER_GROUP, consumer_name, {CART_STREAM_KEY: last_id},
+            count=batch_size, block=STREAM_BLOCK_MS,
+        )
+        return response[0][1] if response else []
+
+    def reader():
+        # Primero los pendientes de este consumidor (reintentos), luego los nuevos
+        last_id = "0"
+        recreated = False
+        while not stop_event.is_set():
+            try:
+                entries = read_entries(last_id)
+                recreated = False
+            except ResponseError as e:
+                # NOGROUP: una carga completa hizo flushdb y borró stream y grupo.
+                # Se recrean una vez; si el error sigue no era eso y se propaga.
+                if recreated:
+                    raise
+                print(f"[STREAM] XREADGROUP falló ({e}); se vuelve a crear el grupo de consumidores")
+                ensure_consumer_group(redis_client)
+                recreated = True
+                last_id = "0"
+                continue
+            if not entries:
+                # Sin pendientes: pasar a leer solo mensajes nuevos
+                last_id = ">"
+                continue
+            if last_id != ">":
+                last_id = entries[-1][0]
+            while not stop_event.is_set():
+                try:
+                    batches.put(entries, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+
+    def run_reader():
+        try:
+            reader()
+        except Exception as e:
+            reader_errors.append(e)
+            print(f"[STREAM] Error en el lector: {e}")
+
+    reader_thread = threading.Thread(target=run_reader, name="stream-reader", daemon=True)
+    reader_thread.start()
+    print(f"[STREAM] Consumidor {consumer_name} escuchando {CART_STREAM_KEY} (Ctrl+C para detener)")
+
+    processed = 0
+    batch_count = 0
+    try:
+        while not stop_event.is_set():
+            try:
+                entries = batches.get(timeout=1)
+            except queue.Empty:
+                if not reader_thread.is_alive():
+                    break
+                continue
+
+            start = time.perf_counter()
+            _process_batch(redis_client, collection, cache, entries)
+            processed += len(entries)
+            batch_count += 1
+            print(
+                f"[STREAM] Lote {batch_count}: {len(entries)} eventos en "
+                f"{(time.perf_counter() - start) * 1000:.1f} ms (cola {batches.qsize()}/{max_in_flight})"
+            )
+
+            if max_batches is not None and batch_count >= max_batches:
+                break
+    except KeyboardInterrupt:
+        print("\n[STREAM] Deteniendo consumidor...")
+    finally:
+        stop_event.set()
+        reader_thread.join(timeout=STREAM_BLOCK_MS / 1000 + 1)
+        redis_client.close()
+        if mongo_client is not None:
+            mongo_client.close()
+
+    print(f"[STREAM] {processed} eventos procesados en {batch_count} lotes")
+    if reader_errors:
+        raise RuntimeError(f"el lector del stream se detuvo: {reader_errors[0]}") from reader_errors[0]
+    return processed
+
+
+def get_live_report() -> pd.DataFrame:
+    """Reporte del Cyberday a partir de las métricas incrementales."""
+    return generate_cyberday_report(cart_metrics=get_live_metrics())
+
+
+def get_live_metrics(redis_client=None) -> dict:
+    """Lee las métricas incrementales (siempre actualizadas, sin reescanear carritos)."""
+    close_client = redis_client is None
+    if redis_client is None:
+        redis_client = get_redis_connection()
+        if redis_client is None:
+            return {}
+
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hgetall(LIVE_METRICS_KEY)
+    pipe.scard(LIVE_CARTS_KEY)
+    pipe.scard(LIVE_CHECKOUT_CARTS_KEY)
+    pipe.scard(LIVE_ABANDON_CARTS_KEY)
+    data, total_carts, checkout_carts, abandoned_carts = pipe.execute()
+
+    if close_client:
+        redis_client.close()
+
+    return {
+        "total_carts": total_carts,
+        "total_events": int(data.get("total_events", 0)),
+        "checkout_events": int(data.get("checkout_events", 0)),
+        "abandon_events": int(data.get("abandon_events", 0)),
+        "checkout_carts": checkout_carts,
+        "abandoned_carts": abandoned_carts,
+        "stock_out_events": int(data.get("stock_out_events", 0)),
+        "total_revenue": float(data.get("total_revenue", 0)),
+        "lost_revenue": float(data.get("lost_revenue", 0)),
+        "timestamp": data.get("updated_at", ""),
+    }
+
+
+if __name__ == "__main__":
+    run_stream_consumer()
@@ -0,0 +1,125 @@
+"""
+Métricas por minuto en Redis: conversión, abandono e ingresos del Cyberday.
+Cada minuto es un hash (metrics:minute:<YYYYmmddHHMM>) con TTL de retención y
+un sorted set (metrics:minutes) indexa los minutos por epoch para consultar
+ventanas sin decodificar los eventos crudos de los carritos.
+"""
+
+from typing import Optional
+
+import pandas as pd
+
+from src.config import METRICS_RETENTION_SECONDS, get_redis_connection
+from src.metrics import record_roundtrip
+
+MINUTE_KEY_PREFIX = "metrics:minute:"
+MINUTE_INDEX_KEY = "metrics:minutes"
+EVENT_TYPES = ["add", "checkout", "abandon", "stock_out"]
+SERIES_COLUMNS = EVENT_TYPES + ["revenue", "lost_revenue"]
+
+
+def _minute_id(ts: pd.Timestamp) -> str:
+    """Identificador del bucket de un minuto."""
+    return ts.strftime("%Y%m%d%H%M")
+
+
+def _queue_bucket(pipe, minute: pd.Timestamp, counts: dict, revenue: float, lost_revenue: float):
+    """Encola en un pipeline las actualizaciones de un bucket."""
+    key = f"{MINUTE_KEY_PREFIX}{_minute_id(minute)}"
+    for event_type, count in counts.items():
+        if count:
+            pipe.hincrby(key, event_type, int(count))
+    if revenue:
+        pipe.hincrbyfloat(key, "revenue", float(revenue))
+    if lost_revenue:
+        pipe.hincrbyfloat(key, "lost_revenue", float(lost_revenue))
+    pipe.expire(key, METRICS_RETENTION_SECONDS)
+    pipe.zadd(MINUTE_INDEX_KEY, {_minute_id(minute): int(minute.timestamp())})
+
+
+def record_events_by_minute(redis_client, df: pd.DataFrame, pipe=None) -> int:
+    """
+    Agrega eventos transformados en buckets por minuto (un pipeline por lote).
+    Con `pipe` solo encola los comandos (el llamador ejecuta, p. ej. en MULTI).
+    """
+    if df is None or df.empty:
+        return 0
+
+    events = df.dropna(subset=["event_time"])
+    minute = pd.to_datetime(events["event_time"]).dt.floor("min")
+
+    counts = pd.crosstab(minute, events["event_type"])
+    money = events.groupby(minute)[["revenue", "lost_revenue"]].sum()
+
+    own_pipe = pipe is None
+    if own_pipe:
+        pipe = redis_client.pipeline(transaction=False)
+    for bucket, row in money.iterrows():
+        bucket_counts = {t: counts.at[bucket, t] for t in EVENT_TYPES if t in counts.columns}
+        _queue_bucket(pipe, bucket, bucket_counts, row["revenue"], row["lost_revenue"])
+    if own_pipe:
+        pipe.execute()
+        record_roundtrip("redis", "minute_buckets", batch_size=len(money))
+
+    print(f"[METRICS] {len(money)} buckets por minuto actualizados")
+    return len(money)
+
+
+def record_event(redis_client, event_time, event_type: str, revenue: float = 0, lost_revenue: float = 0):
+    """Registra un evento individual (ruta de tiempo real)."""
+    minute = pd.Timestamp(event_time).floor("min")
+    pipe = redis_client.pipeline(transaction=False)
+    _queue_bucket(pipe, minute, {event_type: 1}, revenue, lost_revenue)
+    pipe.execute()
+
+
+def get_minute_series(start, end, redis_client=None) -> Optional[pd.DataFrame]:
+    """
+    Devuelve la serie por minuto en [start, end] con conteos, ingresos y tasas.
+    Los minutos sin eventos aparecen con ceros.
+    """
+    close_client = redis_client is None
+    if redis_client is None:
+        redis_client = get_redis_connection()
+        if redis_client is None:
+            return None
+
+    start = pd.Timestamp(start).floor("min")
+    end = pd.Timestamp(end).floor("min")
+
+    minute_ids = redis_client.zrangebyscore(MINUTE_INDEX_KEY, int(start.timestamp()), int(end.timestamp()))
+
+    pipe = redis_client.pipeline(transaction=False)
+    for minute_id in minute_ids:
+        pipe.hgetall(f"{MINUTE_KEY_PREFIX}{minute_id}")
+    buckets = pipe.execute() if minute_ids else []
+
+    # Limpiar del índice los minutos cuyo hash ya expiró
+    expired = [minute_id for minute_id, data in zip(minute_ids, buckets) if not data]
+    if expired:
+        redis_client.zrem(MINUTE_INDEX_KEY, *expired)
+
+    rows = {
+        pd.to_datetime(minute_id, format="%Y%m%d%H%M"): {c: float(data.get(c, 0)) for c in SERIES_COLUMNS}
+        for minute_id, data in zip(minute_ids, buckets)
+        if data
+    }
+
+    index = pd.date_range(start, end, freq="min", name="minute")
+    series = pd.DataFrame.from_dict(rows, orient="index", columns=SERIES_COLUMNS)
+    series = series.reindex(index, fill_value=0).fillna(0)
+    series[EVENT_TYPES] = series[EVENT_TYPES].astype(int)
+
+    # Tasas sobre eventos finalizados del minuto (checkout, abandon, stock_out)
+    finished = series["checkout"] + series["abandon"] + series["stock_out"]
+    series["conversion_rate"] = (series["checkout"] / finished.where(finished > 0) * 100).fillna(0)
+    series["abandon_rate"] = (series["abandon"] / finished.where(finished > 0) * 100).fillna(0)
+
+    if close_client:
+        redis_client.close()
+
+    return series
+
+
+if __name__ == "__main__":
+    print(get_minute_series("2025-05-05 10:00", "2025-05-05 11:00"))
@@ -0,0 +1,277 @@
+"""
+Trazas de las llamadas a MongoDB y Redis para encontrar accesos N+1 y lentos.
+
+Con el trazado activo (TRACE_DB_CALLS o `python main.py --trace ...`) cada
+llamada a la base deja un span: etapa del pipeline (src/metrics.py), base,
+comando, patrón de la clave o del filtro, latencia y bytes enviados/recibidos.
+    - MongoDB: un CommandListener de pymongo en los clientes de get_mongo_connection
+    - Redis: las conexiones de get_redis_connection y de los shards se
+      envuelven (execute_command y pipeline().execute)
+
+Los spans se agregan por forma (etapa, base, comando, patrón) en lugar de
+guardarse uno por uno, así que el costo en memoria no crece con la corrida.
+Al final, print_trace_report señala:
+    - N+1: la misma forma repetida TRACE_N_PLUS_ONE_MIN veces seguidas en un
+      hilo (el patrón típico de una consulta por iteración de un loop)
+    - lentas: llamadas por encima de TRACE_SLOW_MS
+"""
+
+import re
+import threading
+import time
+
+from src.config import TRACE_DB_CALLS, TRACE_N_PLUS_ONE_MIN, TRACE_SLOW_MS
+from src.metrics import current_stage
+
+_SLOW_SPANS_KEPT = 20
+_ID_PATTERN = re.compile(r"[0-9a-fA-F]{24}|\d+")
+
+_enabled = TRACE_DB_CALLS
+_lock = threading.Lock()
+_shapes = {}
+_slow_spans = []
+_runs = {}            # hilo -> [forma de la última llamada, repeticiones seguidas]
+_pending_mongo = {}   # (conexión, request_id) -> (patrón, bytes enviados)
+_mongo_listener = None
+
+
+def enable_tracing():
+    """Activa el trazado para las conexiones que se abran desde ahora."""
+    global _enabled
+    _enabled = True
+
+
+def tracing_enabled() -> bool:
+    return _enabled
+
+
+def reset_traces():
+    with _lock:
+        _shapes.clear()
+        _slow_spans.clear()
+        _runs.clear()
+        _pending_mongo.clear()
+
+
+def key_pattern(key) -> str:
+    """cart:CART-00042 -> cart:CART-#  (ids numéricos y ObjectId a #)."""
+    if isinstance(key, bytes):
+        key = key.decode(errors="replace")
+    return _ID_PATTERN.sub("#", str(key))
+
+
+def _payload_size(value) -> int:
+    """Tamaño aproximado en bytes de argumentos o respuestas."""
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, dict):
+        return sum(_payload_size(k) + _payload_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sum(_payload_size(v) for v in value)
+    return len(str(value))
+
+
+def record_span(db: str, command: str, pattern: str, latency_s: float, bytes_sent: int = 0,
+                bytes_received: int = 0, failed: bool = False):
+    """Agrega un span a su forma y actualiza la racha de repeticiones del hilo."""
+    stage = current_stage()
+    shape = (stage, db, command, pattern)
+    thread_id = threading.get_ident()
+    with _lock:
+        entry = _shapes.get(shape)
+        if entry is None:
+            entry = _shapes[shape] = {
+                "calls": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0,
+                "bytes_sent": 0, "bytes_received": 0, "max_run": 0,
+            }
+        entry["calls"] += 1
+        entry["errors"] += int(failed)
+        entry["total_s"] += latency_s
+        entry["max_s"] = max(entry["max_s"], latency_s)
+        entry["bytes_sent"] += bytes_sent
+        entry["bytes_received"] += bytes_received
+
+        run = _runs.get(thread_id)
+        if run is not None and run[0] == shape:
+            run[1] += 1
+        else:
+            run = _runs[thread_id] = [shape, 1]
+        entry["max_run"] = max(entry["max_run"], run[1])
+
+        if latency_s * 1000 >= TRACE_SLOW_MS:
+            _slow_spans.append({
+                "stage": stage, "db": db, "command": command, "pattern": pattern,
+                "latency_ms": latency_s * 1000, "bytes_sent": bytes_sent, "bytes_received": bytes_received,
+            })
+            _slow_spans.sort(key=lambda span: span["latency_ms"], reverse=True)
+            del _slow_spans[_SLOW_SPANS_KEPT:]
+
+
+# ===== REDIS =====
+
+def _redis_pattern(args) -> str:
+    return key_pattern(args[1]) if len(args) > 1 else ""
+
+
+def trace_redis(client):
+    """Envuelve una conexión de Redis (no hace nada si el trazado está apagado)."""
+    if not _enabled or client is None or getattr(client, "_traced", False):
+        return client
+
+    execute_command = client.execute_command
+    make_pipeline = client.pipeline
+
+    def traced_execute_command(*args, **options):
+        started = time.perf_counter()
+        failed = False
+        reply = None
+        try:
+            reply = execute_command(*args, **options)
+            return reply
+        except Exception:
+            failed = True
+            raise
+        finally:
+            record_span("redis", str(args[0]).upper(), _redis_pattern(args), time.perf_counter() - started,
+                        _payload_size(args), _payload_size(reply), failed)
+
+    def traced_pipeline(*args, **kwargs):
+        pipe = make_pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        def traced_execute(*exec_args, **exec_kwargs):
+            commands = [command_args for command_args, _ in pipe.command_stack]
+            # Patrón del pipeline: los comandos distintos que lleva (HSET cart:CART-#, ...)
+            shapes = sorted({f"{str(c[0]).upper()} {_redis_pattern(c)}" for c in commands})
+            started = time.perf_counter()
+            failed = False
+            replies = None
+            try:
+                replies = execute(*exec_args, **exec_kwargs)
+                return replies
+            except Exception:
+                failed = True
+                raise
+            finally:
+                record_span("redis", "PIPELINE",
+                            " | ".join(shapes[:3]) + (" | ..." if len(shapes) > 3 else ""),
+                            time.perf_counter() - started, _payload_size(commands), _payload_size(replies), failed)
+
+        pipe.execute = traced_execute
+        return pipe
+
+    client.execute_command = traced_execute_command
+    client.pipeline = traced_pipeline
+    client._traced = True
+    return client
+
+
+# ===== MONGODB =====
+
+def _filter_shape(value):
+    """Estructura de un filtro/pipeline sin los valores: {"product_id": {"$in": "?"}}."""
+    if isinstance(value, dict):
+        return {k: _filter_shape(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_filter_shape(v) for v in value[:1]] if value and isinstance(value[0], dict) else "?"
+    return "?"
+
+
+def _mongo_pattern(command_name: str, command: dict) -> str:
+    collection = command.get(command_name)
+    for field in ("filter", "pipeline", "q", "updates", "deletes"):
+        if field in command:
+            return f"{collection} {field}={_filter_shape(command[field])}"
+    return str(collection)
+
+
+def _mongo_listener_class():
+    from bson import BSON
+    from pymongo import monitoring
+
+    def bson_size(document) -> int:
+        try:
+            return len(BSON.encode(document))
+        except Exception:
+            return 0
+
+    class _MongoTraceListener(monitoring.CommandListener):
+        def started(self, event):
+            if not _enabled:
+                return
+            key = (event.connection_id, event.request_id)
+            _pending_mongo[key] = (_mongo_pattern(event.command_name, event.command), bson_size(event.command))
+
+        def _finish(self, event, reply, failed):
+            pattern, bytes_sent = _pending_mongo.pop((event.connection_id, event.request_id), ("", 0))
+            if _enabled and event.command_name not in ("hello", "ismaster", "isMaster", "endSessions"):
+                record_span("mongo", event.command_name, pattern, event.duration_micros / 1e6,
+                            bytes_sent, bson_size(reply) if reply else 0, failed)
+
+        def succeeded(self, event):
+            self._finish(event, event.reply, False)
+
+        def failed(self, event):
+            self._finish(event, None, True)
+
+    return _MongoTraceListener
+
+
+def mongo_event_listeners() -> list:
+    """event_listeners para MongoClient: [listener] con el trazado activo, [] si no."""
+    global _mongo_listener
+    if not _enabled:
+        return []
+    if _mongo_listener is None:
+        _mongo_listener = _mongo_listener_class()()
+    return [_mongo_listener]
+
+
+# ===== REPORTE =====
+
+def trace_summary() -> dict:
+    """Formas agregadas y hallazgos: {"shapes": [...], "n_plus_one": [...], "slow": [...]}."""
+    with _lock:
+        shapes = [
+            {"stage": stage, "db": db, "command": command, "pattern": pattern, **entry}
+            for (stage, db, command, pattern), entry in _shapes.items()
+        ]
+        slow = list(_slow_spans)
+    shapes.sort(key=lambda shape: shape["total_s"], reverse=True)
+    n_plus_one = [shape for shape in shapes if shape["max_run"] >= TRACE_N_PLUS_ONE_MIN]
+    n_plus_one.sort(key=lambda shape: shape["max_run"], reverse=True)
+    return {"shapes": shapes, "n_plus_one": n_plus_one, "slow": slow}
+
+
+def print_trace_report(top_n: int = 10):
+    """Resumen de fin de corrida: llamadas por etapa, posibles N+1 y llamadas lentas."""
+    summary = trace_summary()
+    if not summary["shapes"]:
+        print("[TRACE] No se registraron llamadas a MongoDB ni Redis")
+        return summary
+
+    by_stage = {}
+    for shape in summary["shapes"]:
+        calls, total = by_stage.get(shape["stage"], (0, 0.0))
+        by_stage[shape["stage"]] = (calls + shape["calls"], total + shape["total_s"])
+    for stage, (calls, total) in by_stage.items():
+        print(f"[TRACE] {stage}: {calls} llamadas, {total * 1000:.0f} ms en la base")
+
+    print(f"\n[TRACE] Top {top_n} formas por tiempo total:")
+    for shape in summary["shapes"][:top_n]:
+        print(f"  [{shape['stage']}] {shape['db']} {shape['command']} {shape['pattern'][:80]}: "
+              f"{shape['calls']}x, {shape['total_s'] * 1000:.1f} ms, max {shape['max_s'] * 1000:.1f} ms, "
+              f"{shape['bytes_sent'] + shape['bytes_received']} B")
+
+    for shape in summary["n_plus_one"]:
+        print(f"[TRACE] Posible N+1 en {shape['stage']}: {shape['db']} {shape['command']} "
+              f"{shape['pattern'][:80]} repetido {shape['max_run']} veces seguidas "
+              f"({shape['calls']} en total); agrupar en un pipeline o una consulta $in")
+    for span in summary["slow"]:
+        print(f"[TRACE] Lenta en {span['stage']}: {span['db']} {span['command']} {span['pattern'][:80]} "
+              f"{span['latency_ms']:.0f} ms (> {TRACE_SLOW_MS} ms)")
+    return summary
@@ -2,19 +2,104 @@
 Fase TRANSFORM: limpia y transforma datos de productos y carritos.
 """
 
+import importlib.util
+import time
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
 from src.config import PROCESSED_CSV
+from src.dedup import deduplicate_products
+from src.metrics import observe, record_bytes, record_rows
+from src.quality import CART_RULES, PRODUCT_RULES, apply_quality_rules
+
+# Columnas de dinero: se mantienen en float64 porque se suman sobre millones de filas
+MONEY_COLUMNS = {"actual_price", "discounted_price", "revenue", "lost_revenue"}
+# Proporción máxima de valores únicos para convertir un texto en categórico
+CATEGORICAL_MAX_RATIO = 0.5
+# pyarrow es opcional: si no está, los textos únicos quedan como object
+_HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+def _narrow_numeric(series: pd.Series) -> pd.Series:
+    """Reduce una columna numérica al tipo más chico que conserva todos los valores."""
+    if pd.api.types.is_bool_dtype(series) or series.name in MONEY_COLUMNS:
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        return pd.to_numeric(series, downcast="integer")
+    if pd.api.types.is_float_dtype(series) and series.notna().all():
+        # Floats enteros (ej. rating_count) pasan a entero
+        if (series == np.floor(series)).all() and series.abs().max() < 2**31:
+            return pd.to_numeric(series.astype("int64"), downcast="integer")
+        narrowed = series.astype("float32")
+        if (narrowed.astype("float64") == series).all():
+            return narrowed
+    return series
+
+
+def print_memory_change(name: str, before: int, after: int):
+    label = f" {name}" if name else ""
+    print(f"[TRANSFORM] Memoria{label}: {before / 1e6:.2f} MB -> {after / 1e6:.2f} MB "
+          f"({before / max(after, 1):.1f}x)")
+
+
+def optimize_dataframe_memory(
+    df: pd.DataFrame, name: str = "", verbose: bool = True
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Reduce la memoria del DataFrame: textos repetidos a categóricos, textos
+    únicos a strings de Arrow y numéricos al tipo más chico sin pérdida.
+    Devuelve (df optimizado, reporte de memoria por columna en bytes). Los
+    totales quedan en df.attrs["memory"]; con verbose=False no se imprime
+    nada (el modo streaming los suma y muestra una sola línea al final).
+    """
+    before = df.memory_usage(deep=True, index=False)
+    df = df.copy()
 
-
-def transform_amazon_products(df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
-    """Transforma y limpia datos de productos Amazon."""
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                continue
+            if len(series) and series.nunique(dropna=False) / len(series) <= CATEGORICAL_MAX_RATIO:
+                df[col] = series.astype("category")
+            elif _HAS_PYARROW:
+                df[col] = series.astype(pd.StringDtype("pyarrow"))
+        elif pd.api.types.is_numeric_dtype(series):
+            df[col] = _narrow_numeric(series)
+
+    after = df.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({
+        "dtype": df.dtypes.astype(str),
+        "before_bytes": before,
+        "after_bytes": after,
+    })
+    report["ratio"] = (report["before_bytes"] / report["after_bytes"].where(report["after_bytes"] > 0)).round(2)
+
+    df.attrs["memory"] = {"before_bytes": int(before.sum()), "after_bytes": int(after.sum())}
+    if verbose:
+        print_memory_change(name, df.attrs["memory"]["before_bytes"], df.attrs["memory"]["after_bytes"])
+        for col, row in report.iterrows():
+            print(f"  {col:<22} {row['dtype']:<18} {row['before_bytes']:>12,} -> {row['after_bytes']:>12,}")
+
+    return df, report
+
+
+def transform_amazon_products(
+    df: Optional[pd.DataFrame], quality_run: str = None, quality_chunk: int = None, memory_report: bool = True
+) -> Optional[pd.DataFrame]:
+    """
+    Transforma y limpia datos de productos Amazon. quality_run y
+    quality_chunk identifican el bloque en el modo streaming (ver
+    apply_quality_rules); memory_report=False omite el reporte de memoria
+    por columna cuando se transforma por bloques.
+    """
     if df is None or df.empty:
         return None
+    started = time.perf_counter()
 
     df = df.copy()
 
@@ -23,18 +108,6 @@ def transform_amazon_products(df: Optional[pd.DataFrame]) -> Optional[pd.DataFra
         df = df.drop(columns=["brand"])
         
 
-    # ---------------------------------------------------------
-    # NUEVO: FILTRO PARA ELIMINAR SIN NOMBRE Y SIN ID
-    # ---------------------------------------------------------
-    # 1. Eliminar filas donde product_name sea explícitamente NaN/None
-    df = df.dropna(subset=["product_name"])
-    df = df.dropna(subset=["product_id"])
-    
-    # 2. Eliminar filas donde el nombre sea un string vacío ("") o solo espacios ("   ")
-    # Esto es importante porque a veces el csv trae comillas vacías que no cuentan como NaN
-    df = df[df["product_name"].astype(str).str.strip() != ""]
-    df = df[df["product_id"].astype(str).str.strip() != ""]
-
     # ---------------------------------------------------------
     # ELIMINAR CAMPOS INNECESARIOS PARA ETL
     # ---------------------------------------------------------
@@ -44,46 +117,69 @@ def transform_amazon_products(df: Optional[pd.DataFrame]) -> Optional[pd.DataFra
     df = df.drop(columns=[col for col in campos_innecesarios if col in df.columns], errors='ignore')
     print("[TRANSFORM] Campos de reseñas e imágenes eliminados (no necesarios para ETL)")
 
-    # Rellenar faltantes
-    df["category"] = df["category"].fillna("Uncategorized")
-    df["rating"] = pd.to_numeric(df["rating"], errors="coerce").fillna(0)
-    df["rating_count"] = pd.to_numeric(df["rating_count"], errors="coerce").fillna(0)
-    df["about_product"] = df["about_product"].fillna("")
+    raw = df.copy()
 
-    # Limpiar precios (remover simbolos y comas)
-    df["actual_price"] = (
-        df["actual_price"].astype(str).str.replace("₹", "").str.replace(",", "").str.strip()
+    # Limpiar precios (remover simbolos y comas) y convertir a numerico
+    df["actual_price"] = pd.to_numeric(
+        df["actual_price"].astype(str).str.replace("₹", "").str.replace(",", "").str.strip(), errors="coerce"
     )
-    df["discounted_price"] = (
-        df["discounted_price"].astype(str).str.replace("₹", "").str.replace(",", "").str.strip()
+    df["discounted_price"] = pd.to_numeric(
+        df["discounted_price"].astype(str).str.replace("₹", "").str.replace(",", "").str.strip(), errors="coerce"
     )
-    df["discount_percentage"] = df["discount_percentage"].astype(str).str.replace("%", "").str.strip()
+    df["discount_percentage"] = pd.to_numeric(
+        df["discount_percentage"].astype(str).str.replace("%", "").str.strip(), errors="coerce"
+    )
+    df["rating"] = pd.to_numeric(df["rating"], errors="coerce")
+    # "24,269": sin quitar el separador de miles quedaría NaN -> 0 (y la regla max_rating_count no serviría)
+    df["rating_count"] = pd.to_numeric(df["rating_count"].astype(str).str.replace(",", "").str.strip(), errors="coerce")
+
+    # ---------------------------------------------------------
+    # CALIDAD DE DATOS: sin nombre, sin ID o precio ilegible -> cuarentena
+    # ---------------------------------------------------------
+    df, quality = apply_quality_rules(raw, df, PRODUCT_RULES, "products", quality_run, quality_chunk)
 
-    # Convertir a numerico
-    df["actual_price"] = pd.to_numeric(df["actual_price"], errors="coerce").fillna(0)
-    df["discounted_price"] = pd.to_numeric(df["discounted_price"], errors="coerce").fillna(0)
-    df["discount_percentage"] = pd.to_numeric(df["discount_percentage"], errors="coerce").fillna(0)
+    # Rellenar faltantes
+    df["category"] = df["category"].fillna("Uncategorized")
+    df["about_product"] = df["about_product"].fillna("")
+    for col in ["actual_price", "discounted_price", "discount_percentage", "rating", "rating_count"]:
+        df[col] = df[col].fillna(0)
 
     # Validar rangos
     df["discount_percentage"] = df["discount_percentage"].clip(lower=0, upper=100)
     df["rating"] = df["rating"].clip(lower=0, upper=5)
 
+    # Una fila por producto (el dataset trae una fila por reseña)
+    df = deduplicate_products(df)
+
+    df, _ = optimize_dataframe_memory(df, "productos", verbose=memory_report)
+    df.attrs["quality"] = quality
+
+    record_rows(len(df), stage="transform", dataset="products")
+    observe("etl_operation_duration_seconds", time.perf_counter() - started, operation="transform_products")
     print(f"[TRANSFORM] {len(df)} productos Amazon transformados")
     return df
 
 
-def transform_redis_carts(df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
-    """Transforma y limpia datos de carritos."""
+def transform_redis_carts(
+    df: Optional[pd.DataFrame], quality_run: str = None, quality_chunk: int = None, memory_report: bool = True
+) -> Optional[pd.DataFrame]:
+    """Transforma y limpia datos de carritos (ver los parámetros de transform_amazon_products)."""
     if df is None or df.empty:
         return None
+    started = time.perf_counter()
 
+    raw = df
     df = df.copy()
 
     # Convertir timestamps
     df["event_time"] = pd.to_datetime(df["event_time"], errors="coerce")
+    df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce")
+
+    # Calidad de datos: sin carrito, sin tipo o fecha ilegible -> cuarentena
+    df, quality = apply_quality_rules(raw, df, CART_RULES, "carts", quality_run, quality_chunk)
 
     # Validar cantidades
-    df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce").fillna(1).astype(int)
+    df["quantity"] = df["quantity"].fillna(1).astype(int)
     df["quantity"] = df["quantity"].clip(lower=1, upper=100)
 
     # Convertir stocks y revenue
@@ -92,6 +188,11 @@ def transform_redis_carts(df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
     df["revenue"] = pd.to_numeric(df["revenue"], errors="coerce").fillna(0).astype(float)
     df["lost_revenue"] = pd.to_numeric(df["lost_revenue"], errors="coerce").fillna(0).astype(float)
 
+    df, _ = optimize_dataframe_memory(df, "carritos", verbose=memory_report)
+    df.attrs["quality"] = quality
+
+    record_rows(len(df), stage="transform", dataset="carts")
+    observe("etl_operation_duration_seconds", time.perf_counter() - started, operation="transform_carts")
     print(f"[TRANSFORM] {len(df)} eventos de carrito transformados")
     return df
 
@@ -112,18 +213,25 @@ def get_transformation_stats(amazon_df: Optional[pd.DataFrame], cart_df: Optiona
             "total_revenue": cart_df["revenue"].sum() if cart_df is not None else 0,
             "lost_revenue": cart_df["lost_revenue"].sum() if cart_df is not None else 0,
         },
+        "quality": {
+            "products": amazon_df.attrs.get("quality", {}) if amazon_df is not None else {},
+            "carts": cart_df.attrs.get("quality", {}) if cart_df is not None else {},
+        },
         "timestamp": datetime.utcnow().isoformat(),
     }
     return stats
 
 
-def transform_all() -> Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]:
-    """Ejecuta la etapa TRANSFORM completa."""
+def transform_all(
+    amazon_df: Optional[pd.DataFrame] = None, redis_cart_df: Optional[pd.DataFrame] = None
+) -> Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]:
+    """Ejecuta la etapa TRANSFORM completa (extrae los datos si no se pasan)."""
     from src.extract import extract_all
 
     print("\n[TRANSFORM] Iniciando transformacion...\n")
 
-    amazon_df, redis_cart_df = extract_all()
+    if amazon_df is None or redis_cart_df is None:
+        amazon_df, redis_cart_df = extract_all()
 
     amazon_transformed = transform_amazon_products(amazon_df)
     cart_transformed = transform_redis_carts(redis_cart_df)
@@ -143,6 +251,7 @@ def transform_all() -> Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]:
         out_path = Path(PROCESSED_CSV)
         out_path.parent.mkdir(parents=True, exist_ok=True)
         amazon_transformed.to_csv(out_path, index=False)
+        record_bytes("processed_csv", out_path)
         print(f"[TRANSFORM] Dataset procesado guardado en {out_path}")
 
     return amazon_transformed, cart_transformed
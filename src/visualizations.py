@@ -1,197 +1,387 @@
 """
 Visualizaciones para análisis del Cyberday: MongoDB + Redis
+
+generate_all_visualizations obtiene una sola foto de los datos (snapshot) con
+todos los agregados necesarios y renderiza los gráficos en paralelo en un pool
+de procesos con el backend no interactivo Agg.
 """
 
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import hashlib
 import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from src.config import get_mongo_connection, get_redis_connection
+from typing import Optional
 
+import matplotlib
 
-def plot_product_categories_distribution():
-    """Gráfico de distribución de productos por categoría."""
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+
+from src.config import get_mongo_connection
+from src.integration import get_field_histogram, get_product_performance_mongodb
+from src.metrics import record_bytes, record_roundtrip
+from src.sessions import EVENT_TYPES, parse_session_fields
+from src.sharding import close_cart_clients, get_cart_clients, map_shards
+
+IMAGES_DIR = "docs/images"
+SCAN_BATCH_SIZE = 500
+PRICE_BINS = 50
+FINGERPRINTS_FILE = f"{IMAGES_DIR}/.fingerprints.json"
+# Cambiar al modificar el estilo de un gráfico para invalidar el cache de renders
+RENDER_VERSION = "1"
+
+
+# ===== SNAPSHOT DE DATOS =====
+
+def _fetch_price_histogram(collection) -> dict:
+    """Histograma de precios con descuento (> 0) calculado en MongoDB."""
+    return get_field_histogram(
+        "discounted_price", bins=PRICE_BINS, match={"discounted_price": {"$gt": 0}}, collection=collection
+    )
+
+
+def _fetch_cart_aggregates(redis_client) -> dict:
+    """
+    Recorre el keyspace de carritos una sola vez (SCAN + HMGET en pipeline por
+    lotes) y calcula todos los agregados que usan los gráficos de Redis a
+    partir del resumen por carrito (sin decodificar los eventos).
+    """
+    aggregates = {
+        "carts": 0,
+        "events_by_type": {t: 0 for t in EVENT_TYPES},
+        "total_revenue": 0.0,
+        "lost_revenue": 0.0,
+        "revenue_by_cart": [],
+    }
+
+    fields = ["total_revenue", "lost_revenue"] + [f"n_{t}" for t in EVENT_TYPES]
+
+    def consume(keys):
+        pipe = redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hmget(key, *fields)
+        values_batch = pipe.execute()
+        record_roundtrip("redis", "cart_aggregates", batch_size=len(keys))
+        aggregates["carts"] += len(keys)
+        for values in values_batch:
+            cart = parse_session_fields(values, fields)
+            aggregates["total_revenue"] += cart["total_revenue"]
+            aggregates["lost_revenue"] += cart["lost_revenue"]
+            if cart["total_revenue"] > 0:
+                aggregates["revenue_by_cart"].append(cart["total_revenue"])
+            for event_type in EVENT_TYPES:
+                aggregates["events_by_type"][event_type] += cart[f"n_{event_type}"]
+
+    batch = []
+    for key in redis_client.scan_iter("cart:CART-*", count=SCAN_BATCH_SIZE):
+        batch.append(key)
+        if len(batch) >= SCAN_BATCH_SIZE:
+            consume(batch)
+            batch = []
+    if batch:
+        consume(batch)
+
+    return aggregates
+
+
+def merge_cart_aggregates(parts: list) -> dict:
+    """Combina los agregados calculados por separado en cada shard de Redis."""
+    merged = {
+        "carts": 0,
+        "events_by_type": {t: 0 for t in EVENT_TYPES},
+        "total_revenue": 0.0,
+        "lost_revenue": 0.0,
+        "revenue_by_cart": [],
+    }
+    for part in parts:
+        merged["carts"] += part["carts"]
+        for event_type, count in part["events_by_type"].items():
+            merged["events_by_type"][event_type] += count
+        merged["total_revenue"] += part["total_revenue"]
+        merged["lost_revenue"] += part["lost_revenue"]
+        merged["revenue_by_cart"].extend(part["revenue_by_cart"])
+    return merged
+
+
+def fetch_cart_aggregates() -> Optional[dict]:
+    """Agregados de carritos de todos los shards (un recorrido por shard en paralelo)."""
+    cart_clients = get_cart_clients()
+    if cart_clients is None:
+        return None
     try:
-        _, _, collection = get_mongo_connection()
-        if collection is None:
-            return
+        return merge_cart_aggregates(map_shards(cart_clients, _fetch_cart_aggregates))
+    finally:
+        close_cart_clients(cart_clients)
 
-        # Agregación por categoría (Amazon no tiene campo brand)
-        pipeline = [
-            {"$group": {"_id": "$category", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-            {"$limit": 15},
-        ]
 
-        results = list(collection.aggregate(pipeline))
+def fetch_visualization_snapshot() -> dict:
+    """Obtiene en una sola pasada todos los datos que necesitan los gráficos."""
+    snapshot = {"product_metrics": {}, "price_histogram": {}, "carts": None}
 
-        if not results:
-            print("[VIZ] No hay datos de productos")
-            return
+    client, _, collection = get_mongo_connection()
+    if collection is not None:
+        snapshot["product_metrics"] = get_product_performance_mongodb(collection=collection)
+        snapshot["price_histogram"] = _fetch_price_histogram(collection)
+        client.close()
 
-        categories = [r["_id"] for r in results]
-        counts = [r["count"] for r in results]
+    snapshot["carts"] = fetch_cart_aggregates()
+    return snapshot
 
-        # Crear directorio si no existe
-        Path("docs/images").mkdir(parents=True, exist_ok=True)
 
-        plt.figure(figsize=(12, 6))
-        plt.barh(categories, counts, color="steelblue")
-        plt.xlabel("Cantidad de Productos")
-        plt.title("Top 15 Categorías por Cantidad de Productos - Amazon")
-        plt.tight_layout()
-        plt.savefig("docs/images/categories_distribution.png", dpi=100, bbox_inches="tight")
-        print("[VIZ] Gráfico guardado: docs/images/categories_distribution.png")
-        plt.close()
+# ===== RENDERIZADO (funciones puras, ejecutables en otro proceso) =====
 
-    except Exception as e:
-        print(f"[VIZ] Error en gráfico de categorías: {e}")
+def _save(path: str):
+    """Guarda la figura actual de forma atómica (archivo temporal + rename) y la cierra."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    plt.tight_layout()
+    plt.savefig(tmp_path, format="png", dpi=100, bbox_inches="tight")
+    plt.close()
+    os.replace(tmp_path, path)
+    record_bytes("chart", path)
+    print(f"[VIZ] Gráfico guardado: {path}")
 
 
-def plot_price_distribution():
-    """Gráfico de distribución de precios."""
-    try:
-        _, _, collection = get_mongo_connection()
-        if collection is None:
-            return
+def render_categories_distribution(product_metrics: dict, path: str) -> bool:
+    """Gráfico de distribución de productos por categoría."""
+    results = product_metrics.get("category_distribution", [])
+    if not results:
+        print("[VIZ] No hay datos de productos")
+        return False
+
+    categories = [r["_id"] for r in results]
+    counts = [r["count"] for r in results]
+
+    plt.figure(figsize=(12, 6))
+    plt.barh(categories, counts, color="steelblue")
+    plt.xlabel("Cantidad de Productos")
+    plt.title("Top 15 Categorías por Cantidad de Productos - Amazon")
+    _save(path)
+    return True
+
+
+def render_price_distribution(histogram: dict, path: str) -> bool:
+    """Gráfico de distribución de precios (histograma ya agrupado en MongoDB)."""
+    if not histogram or not sum(histogram.get("counts", [])):
+        print("[VIZ] No hay datos de precios")
+        return False
+
+    edges = histogram["edges"]
+    plt.figure(figsize=(12, 6))
+    plt.hist(edges[:-1], bins=edges, weights=histogram["counts"], color="coral", edgecolor="black", alpha=0.7)
+    plt.xlabel("Precio Descuentado (Rupias)")
+    plt.ylabel("Cantidad de Productos")
+    plt.title("Distribución de Precios - Amazon")
+    _save(path)
+    return True
+
+
+def render_cart_events(carts: dict, path: str) -> bool:
+    """Gráfico de eventos de carrito por tipo."""
+    events_by_type = carts["events_by_type"] if carts else {}
+    if sum(events_by_type.values()) == 0:
+        print("[VIZ] No hay eventos de carrito")
+        return False
+
+    plt.figure(figsize=(10, 6))
+    colors = ["#2ecc71", "#3498db", "#e74c3c", "#f39c12"]
+    plt.bar(events_by_type.keys(), events_by_type.values(), color=colors)
+    plt.xlabel("Tipo de Evento")
+    plt.ylabel("Cantidad de Eventos")
+    plt.title("Eventos de Carrito - Cyberday Amazon")
+    _save(path)
+    return True
+
+
+def render_revenue_metrics(carts: dict, path: str) -> bool:
+    """Gráfico de métricas de ingresos."""
+    if not carts or not carts["revenue_by_cart"]:
+        print("[VIZ] No hay datos de ingresos")
+        return False
 
-        # Obtener precios
-        prices = [doc["discounted_price"] for doc in collection.find({}, {"discounted_price": 1}) if doc.get("discounted_price", 0) > 0]
+    total_revenue = carts["total_revenue"]
+    lost_revenue = carts["lost_revenue"]
 
-        if not prices:
-            print("[VIZ] No hay datos de precios")
-            return
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 5))
 
-        # Crear directorio si no existe
-        Path("docs/images").mkdir(parents=True, exist_ok=True)
+    # Gráfico 1: Ingresos vs Perdidos
+    ax1.bar(["Ingresos", "Perdidos"], [total_revenue, lost_revenue], color=["#27ae60", "#e74c3c"])
+    ax1.set_ylabel("Rupias")
+    ax1.set_title("Ingresos Totales vs Perdidos - Amazon")
+    for i, v in enumerate([total_revenue, lost_revenue]):
+        ax1.text(i, v + 100, f"${v:.0f}", ha="center", va="bottom", fontweight="bold")
 
-        plt.figure(figsize=(12, 6))
-        plt.hist(prices, bins=50, color="coral", edgecolor="black", alpha=0.7)
-        plt.xlabel("Precio Descuentado (Rupias)")
-        plt.ylabel("Cantidad de Productos")
-        plt.title("Distribución de Precios - Amazon")
-        plt.tight_layout()
-        plt.savefig("docs/images/price_distribution.png", dpi=100, bbox_inches="tight")
-        print("[VIZ] Gráfico guardado: docs/images/price_distribution.png")
-        plt.close()
+    # Gráfico 2: Distribución de ingresos por carrito
+    ax2.hist(carts["revenue_by_cart"], bins=10, color="steelblue", edgecolor="black", alpha=0.7)
+    ax2.set_xlabel("Ingresos por Carrito")
+    ax2.set_ylabel("Cantidad de Carritos")
+    ax2.set_title("Distribución de Ingresos")
 
-    except Exception as e:
-        print(f"[VIZ] Error en distribución de precios: {e}")
+    _save(path)
+    return True
 
 
-def plot_cart_events_timeline():
-    """Gráfico de eventos de carrito en tiempo."""
+def _render_timed(render, data, path: str) -> tuple:
+    """Ejecuta un renderizador y devuelve (guardado, duración en segundos)."""
+    start = time.perf_counter()
+    saved = False
     try:
-        redis_client = get_redis_connection()
-        if redis_client is None:
-            return
+        saved = render(data, path)
+    except Exception as e:
+        print(f"[VIZ] Error renderizando {path}: {e}")
+    return saved, time.perf_counter() - start
 
-        # Obtener eventos
-        cart_keys = redis_client.keys("cart:CART-*")
-        events_by_type = {"add": 0, "checkout": 0, "abandon": 0, "stock_out": 0}
-
-        for key in cart_keys:
-            cart_data = redis_client.hgetall(key)
-            try:
-                events = json.loads(cart_data.get("events", "[]"))
-                for event in events:
-                    event_type = event.get("event_type", "unknown")
-                    if event_type in events_by_type:
-                        events_by_type[event_type] += 1
-            except:
-                pass
-
-        if sum(events_by_type.values()) == 0:
-            print("[VIZ] No hay eventos de carrito")
-            return
 
-        # Crear directorio si no existe
-        Path("docs/images").mkdir(parents=True, exist_ok=True)
+# ===== CACHE DE RENDERS POR FINGERPRINT =====
 
-        plt.figure(figsize=(10, 6))
-        colors = ["#2ecc71", "#3498db", "#e74c3c", "#f39c12"]
-        plt.bar(events_by_type.keys(), events_by_type.values(), color=colors)
-        plt.xlabel("Tipo de Evento")
-        plt.ylabel("Cantidad de Eventos")
-        plt.title("Eventos de Carrito - Cyberday Amazon")
-        plt.tight_layout()
-        plt.savefig("docs/images/cart_events.png", dpi=100, bbox_inches="tight")
-        print("[VIZ] Gráfico guardado: docs/images/cart_events.png")
-        plt.close()
+def _strip_volatile(data):
+    """Quita campos que cambian en cada ejecución (timestamp) sin cambiar el gráfico."""
+    if isinstance(data, dict):
+        return {k: _strip_volatile(v) for k, v in data.items() if k != "timestamp"}
+    if isinstance(data, list):
+        return [_strip_volatile(v) for v in data]
+    return data
 
-        redis_client.close()
 
-    except Exception as e:
-        print(f"[VIZ] Error en gráfico de eventos: {e}")
+def chart_fingerprint(render, data) -> str:
+    """Huella de los agregados de entrada de un gráfico."""
+    payload = json.dumps(
+        {"render": render.__name__, "version": RENDER_VERSION, "data": _strip_volatile(data)},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 
-def plot_revenue_metrics():
-    """Gráfico de métricas de ingresos."""
+def _load_fingerprints() -> dict:
+    """Lee las huellas guardadas de los gráficos existentes."""
     try:
-        redis_client = get_redis_connection()
-        if redis_client is None:
-            return
+        with open(FINGERPRINTS_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-        cart_keys = redis_client.keys("cart:CART-*")
-        total_revenue = 0
-        lost_revenue = 0
-        revenue_by_cart = []
 
-        for key in cart_keys:
-            cart_data = redis_client.hgetall(key)
-            revenue = float(cart_data.get("total_revenue", 0))
-            lost = float(cart_data.get("lost_revenue", 0))
+def _save_fingerprints(fingerprints: dict):
+    """Guarda las huellas de forma atómica."""
+    Path(FINGERPRINTS_FILE).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{FINGERPRINTS_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(fingerprints, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, FINGERPRINTS_FILE)
 
-            total_revenue += revenue
-            lost_revenue += lost
 
-            if revenue > 0:
-                revenue_by_cart.append(revenue)
+def _chart_tasks(snapshot: dict) -> list:
+    """Lista de (renderizador, datos, ruta) para cada gráfico."""
+    return [
+        (render_categories_distribution, snapshot["product_metrics"], f"{IMAGES_DIR}/categories_distribution.png"),
+        (render_price_distribution, snapshot["price_histogram"], f"{IMAGES_DIR}/price_distribution.png"),
+        (render_cart_events, snapshot["carts"], f"{IMAGES_DIR}/cart_events.png"),
+        (render_revenue_metrics, snapshot["carts"], f"{IMAGES_DIR}/revenue_metrics.png"),
+    ]
 
-        if not revenue_by_cart:
-            print("[VIZ] No hay datos de ingresos")
-            return
 
-        # Crear directorio si no existe
-        Path("docs/images").mkdir(parents=True, exist_ok=True)
+# ===== API POR GRÁFICO =====
+
+def plot_product_categories_distribution(product_metrics: dict = None):
+    """Gráfico de distribución de productos por categoría."""
+    try:
+        # Reutiliza la agregación $facet del reporte (un solo round trip)
+        if product_metrics is None:
+            product_metrics = get_product_performance_mongodb()
+        render_categories_distribution(product_metrics, f"{IMAGES_DIR}/categories_distribution.png")
+    except Exception as e:
+        print(f"[VIZ] Error en gráfico de categorías: {e}")
 
-        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 5))
 
-        # Gráfico 1: Ingresos vs Perdidos
-        ax1.bar(["Ingresos", "Perdidos"], [total_revenue, lost_revenue], color=["#27ae60", "#e74c3c"])
-        ax1.set_ylabel("Rupias")
-        ax1.set_title("Ingresos Totales vs Perdidos - Amazon")
-        for i, v in enumerate([total_revenue, lost_revenue]):
-            ax1.text(i, v + 100, f"${v:.0f}", ha="center", va="bottom", fontweight="bold")
+def plot_price_distribution():
+    """Gráfico de distribución de precios."""
+    try:
+        client, _, collection = get_mongo_connection()
+        if collection is None:
+            return
+        histogram = _fetch_price_histogram(collection)
+        client.close()
+        render_price_distribution(histogram, f"{IMAGES_DIR}/price_distribution.png")
+    except Exception as e:
+        print(f"[VIZ] Error en distribución de precios: {e}")
 
-        # Gráfico 2: Distribución de ingresos por carrito
-        ax2.hist(revenue_by_cart, bins=10, color="steelblue", edgecolor="black", alpha=0.7)
-        ax2.set_xlabel("Ingresos por Carrito")
-        ax2.set_ylabel("Cantidad de Carritos")
-        ax2.set_title("Distribución de Ingresos")
 
-        plt.tight_layout()
-        plt.savefig("docs/images/revenue_metrics.png", dpi=100, bbox_inches="tight")
-        print("[VIZ] Gráfico guardado: docs/images/revenue_metrics.png")
-        plt.close()
+def plot_cart_events_timeline(carts: dict = None):
+    """Gráfico de eventos de carrito en tiempo."""
+    try:
+        if carts is None:
+            carts = fetch_cart_aggregates()
+            if carts is None:
+                return
+        render_cart_events(carts, f"{IMAGES_DIR}/cart_events.png")
+    except Exception as e:
+        print(f"[VIZ] Error en gráfico de eventos: {e}")
 
-        redis_client.close()
 
+def plot_revenue_metrics(carts: dict = None):
+    """Gráfico de métricas de ingresos."""
+    try:
+        if carts is None:
+            carts = fetch_cart_aggregates()
+            if carts is None:
+                return
+        render_revenue_metrics(carts, f"{IMAGES_DIR}/revenue_metrics.png")
     except Exception as e:
         print(f"[VIZ] Error en gráfico de ingresos: {e}")
 
 
-def generate_all_visualizations():
-    """Genera todas las visualizaciones."""
+def generate_all_visualizations(parallel: bool = True, force: bool = False) -> dict:
+    """
+    Genera todas las visualizaciones y devuelve el tiempo de cada gráfico.
+    Los gráficos cuyos datos no cambiaron (misma huella) no se vuelven a
+    renderizar salvo que force=True.
+    """
     print("\n[VIZ] Generando visualizaciones del Cyberday Amazon...\n")
 
-    plot_product_categories_distribution()
-    plot_price_distribution()
-    plot_cart_events_timeline()
-    plot_revenue_metrics()
-
-    print("\n[VIZ] Todas las visualizaciones completadas\n")
+    start = time.perf_counter()
+    snapshot = fetch_visualization_snapshot()
+    print(f"[VIZ] Snapshot de datos obtenido en {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    stored = _load_fingerprints()
+    fingerprints = {}
+    timings = {}
+    pending = []
+
+    for render, data, path in _chart_tasks(snapshot):
+        name = Path(path).stem
+        fingerprints[name] = chart_fingerprint(render, data)
+        if not force and stored.get(name) == fingerprints[name] and Path(path).is_file():
+            print(f"[VIZ] {name}: sin cambios, se reutiliza {path}")
+            timings[name] = 0.0
+        else:
+            pending.append((name, render, data, path))
+
+    results = {}
+    if pending and parallel:
+        with ProcessPoolExecutor(max_workers=len(pending)) as pool:
+            futures = {name: pool.submit(_render_timed, render, data, path) for name, render, data, path in pending}
+            results = {name: future.result() for name, future in futures.items()}
+    elif pending:
+        results = {name: _render_timed(render, data, path) for name, render, data, path in pending}
+
+    for name, (saved, elapsed) in results.items():
+        timings[name] = elapsed
+        if saved:
+            stored[name] = fingerprints[name]
+        else:
+            stored.pop(name, None)
+        print(f"[VIZ] {name}: {elapsed * 1000:.1f} ms")
+
+    if results:
+        _save_fingerprints(stored)
+
+    print(f"\n[VIZ] Visualizaciones completadas en {time.perf_counter() - start:.2f} s "
+          f"({len(results)} renderizadas, {len(timings) - len(results)} en cache)\n")
+    return timings
 
 
 if __name__ == "__main__":
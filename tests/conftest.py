@@ -0,0 +1,108 @@
+"""
+Fixtures compartidos de los tests: data/ aislado en un directorio temporal,
+Redis en memoria (fakeredis) y una colección de MongoDB mínima en memoria.
+
+Ejecutar desde la raíz del repositorio (dependencias en requirements-dev.txt):
+    pip install -r requirements-dev.txt
+    python -m pytest -q
+"""
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+CART_CSV = REPO_ROOT / "data" / "raw" / "redis_cart_sim.csv"
+
+
+class StubCollection:
+    """
+    Lo que usan los upserts de productos: bulk_write de UpdateOne por
+    product_id ($set + $setOnInsert), delete_many y find_one. fail_on_call
+    hace fallar la llamada N de bulk_write (una sola vez) para simular un corte.
+    """
+
+    def __init__(self, fail_on_call: int = None):
+        self.docs = {}
+        self.extra_docs = []  # documentos fuera del índice por product_id (p. ej. duplicados)
+        self.bulk_calls = 0
+        self.fail_on_call = fail_on_call
+
+    def bulk_write(self, requests, ordered=True):
+        self.bulk_calls += 1
+        if self.bulk_calls == self.fail_on_call:
+            self.fail_on_call = None
+            raise ConnectionError("corte simulado")
+        upserted = modified = 0
+        for request in requests:
+            product_id = request._filter["product_id"]
+            update = request._doc
+            if product_id in self.docs:
+                self.docs[product_id].update(update.get("$set", {}))
+                modified += 1
+            else:
+                self.docs[product_id] = {"product_id": product_id, **update.get("$setOnInsert", {}),
+                                         **update.get("$set", {})}
+                upserted += 1
+        return SimpleNamespace(upserted_count=upserted, modified_count=modified)
+
+    def delete_many(self, query):
+        self.docs.clear()
+
+    def find(self, query=None, projection=None):
+        fields = [name for name, keep in (projection or {}).items() if keep and name != "_id"]
+        for doc in list(self.docs.values()) + self.extra_docs:
+            yield {name: doc[name] for name in fields if name in doc} if fields else dict(doc)
+
+    def find_one(self, query):
+        return self.docs.get(query.get("product_id"))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Las rutas relativas de src/config.py (data/state, data/quarantine, ...) quedan en tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def collection():
+    return StubCollection()
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """get_redis_connection devuelve clientes de un mismo servidor fakeredis."""
+    import fakeredis
+    import src.config
+    import src.load
+    import src.stream_etl
+
+    server = fakeredis.FakeServer()
+
+    def connect():
+        return fakeredis.FakeRedis(server=server, decode_responses=True)
+
+    for module in (src.config, src.load, src.stream_etl):
+        monkeypatch.setattr(module, "get_redis_connection", connect)
+    # fakeredis no ejecuta Lua sin lupa: el script de checkout queda fuera de estos tests
+    monkeypatch.setattr(src.load, "queue_checkouts", lambda redis_client, df, pipe=None: 0)
+    return connect
+
+
+def make_products(n_products: int, copies: int = 2, seed: int = 0) -> pd.DataFrame:
+    """Productos crudos como en amazon.csv: una fila por reseña (ids repetidos)."""
+    rng = pd.Series(range(n_products * copies)).sample(frac=1, random_state=seed).to_numpy()
+    return pd.DataFrame({
+        "product_id": [f"P-{i % n_products:04d}" for i in rng],
+        "product_name": [f"Producto {i % n_products}" for i in rng],
+        "category": ["Electronics|Audio" if i % 2 else "Home|Kitchen" for i in rng],
+        "discounted_price": [f"₹{100 + i % 50:,}" for i in rng],
+        "actual_price": [f"₹{200 + i % 50:,}" for i in rng],
+        "discount_percentage": [f"{i % 60}%" for i in rng],
+        "rating": [round(1 + (i * 7 % 40) / 10, 1) for i in rng],
+        "rating_count": [f"{i * 13 % 997:,}" for i in rng],
+        "about_product": ["..." for _ in rng],
+    })
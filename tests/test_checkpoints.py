@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+
+import main
+import src.checkpoints as checkpoints
+from conftest import CART_CSV, make_products
+
+
+def test_open_run_reuses_manifest_until_inputs_change(workdir):
+    first = checkpoints.open_run({"a.csv": "1"})
+    checkpoints.mark_stage(first, "extract", "completed", 0.5)
+
+    resumed = checkpoints.open_run({"a.csv": "1"})
+    assert resumed["run_id"] == first["run_id"]
+    assert checkpoints.first_incomplete_stage(resumed) == "transform"
+
+    changed = checkpoints.open_run({"a.csv": "2"})
+    assert changed["run_id"] != first["run_id"]
+    assert checkpoints.first_incomplete_stage(changed) == "extract"
+
+
+def test_completing_a_stage_resets_later_stages(workdir):
+    manifest = checkpoints.new_manifest({})
+    for stage in checkpoints.STAGES:
+        checkpoints.mark_stage(manifest, stage, "completed")
+    assert checkpoints.first_incomplete_stage(manifest) is None
+
+    checkpoints.mark_stage(manifest, "transform", "completed")
+    assert checkpoints.first_incomplete_stage(manifest) == "load"
+
+
+def test_stage_output_round_trip(workdir):
+    df = pd.DataFrame({"product_id": ["P-1", "P-2"], "price": [1.5, 2.0]})
+    checkpoints.save_stage_output("extract", {"amazon_df": df, "redis_cart_df": None})
+
+    assert checkpoints.load_stage_output("extract", ["amazon_df", "redis_cart_df"]) is None
+    pd.testing.assert_frame_equal(checkpoints.load_stage_output("extract", ["amazon_df"])["amazon_df"], df)
+
+
+@pytest.fixture
+def fake_stages(workdir, monkeypatch):
+    """Pipeline sin bases de datos: extract lee datos de prueba y load falla la primera vez."""
+    calls = []
+    load_attempts = []
+
+    def extract(state):
+        calls.append("extract")
+        state["amazon_df"], state["redis_cart_df"] = make_products(10), pd.read_csv(CART_CSV)
+        return True
+
+    def load(state):
+        calls.append("load")
+        load_attempts.append(1)
+        return len(load_attempts) > 1
+
+    def step(name):
+        return lambda state: calls.append(name) or True
+
+    monkeypatch.setattr(main, "check_connections", lambda: True)
+    monkeypatch.setitem(main.STAGE_RUNNERS, "extract", extract)
+    monkeypatch.setitem(main.STAGE_RUNNERS, "load", load)
+    monkeypatch.setitem(main.STAGE_RUNNERS, "integration", step("integration"))
+    monkeypatch.setitem(main.STAGE_RUNNERS, "visualizations", step("visualizations"))
+    return calls
+
+
+def test_failed_stage_exits_non_zero_and_next_run_resumes(fake_stages, capsys):
+    assert main.cli(["run"]) == 1
+    assert "Pipeline completado exitosamente" not in capsys.readouterr().out
+    assert fake_stages == ["extract", "load", "integration", "visualizations"]
+
+    # La segunda ejecución reanuda en load con la salida de transform guardada
+    fake_stages.clear()
+    assert main.cli(["run"]) == 0
+    assert fake_stages == ["load", "integration", "visualizations"]
+    assert "Pipeline completado exitosamente" in capsys.readouterr().out
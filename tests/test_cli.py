@@ -0,0 +1,31 @@
+import subprocess
+import sys
+
+import pytest
+
+import main
+from conftest import REPO_ROOT
+
+
+@pytest.mark.parametrize("argv", [["--timing", "check"], ["check", "--timing"], ["load", "--incremental", "--timing"]])
+def test_timing_is_accepted_before_and_after_the_subcommand(argv):
+    assert main.build_parser().parse_args(argv).timing is True
+
+
+def test_timing_defaults_to_off():
+    assert main.build_parser().parse_args(["check"]).timing is False
+
+
+def test_run_stage_choices_match_checkpoint_stages():
+    from src.checkpoints import STAGES
+
+    assert list(main.STAGE_TITLES) == STAGES
+
+
+def test_building_the_cli_stays_light():
+    code = (
+        "import sys, main; main.build_parser().parse_args(['check']); "
+        "print(','.join(m for m in ('pandas', 'pymongo', 'redis', 'src.checkpoints', 'http.server') if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from conftest import make_products
+from src.dedup import DEDUP_RULES, deduplicate_product_chunks, deduplicate_products
+from src.transform import transform_amazon_products
+
+
+def chunked(df: pd.DataFrame, size: int) -> list:
+    return [df.iloc[start:start + size] for start in range(0, len(df), size)]
+
+
+@pytest.mark.parametrize("rule", list(DEDUP_RULES))
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_chunks_match_full_dataframe(rule, chunk_size):
+    # Columnas numéricas como las deja transform (rating_count "1,234" -> 1234)
+    df = make_products(50, copies=4)
+    df["rating"] = df["rating"].astype(float)
+    df["rating_count"] = df.index * 37 % 2000
+
+    expected = deduplicate_products(df, rule)
+    streamed = pd.concat(deduplicate_product_chunks(chunked(df, chunk_size), rule), ignore_index=True)
+
+    key = ["product_id"]
+    pd.testing.assert_frame_equal(
+        streamed.sort_values(key).reset_index(drop=True),
+        expected.sort_values(key).reset_index(drop=True),
+    )
+
+
+def test_first_rule_keeps_arrival_order():
+    df = make_products(20, copies=3)
+    streamed = pd.concat(deduplicate_product_chunks(chunked(df, 6), "first"), ignore_index=True)
+    assert list(streamed["product_id"]) == list(df["product_id"].drop_duplicates())
+
+
+def test_empty_chunks_are_skipped():
+    df = make_products(5)
+    chunks = [None, df.iloc[:0], df, df.iloc[:0]]
+    assert len(pd.concat(deduplicate_product_chunks(chunks, "first"))) == 5
+
+
+def test_unknown_rule_is_rejected():
+    with pytest.raises(ValueError):
+        deduplicate_products(make_products(3), "cheapest")
+
+
+def test_transform_parses_thousands_separators_in_rating_count(workdir):
+    raw = make_products(3, copies=1)
+    raw["rating_count"] = ["24,269", "1,234,567", "87"]
+
+    products = transform_amazon_products(raw)
+    assert sorted(products["rating_count"].astype(int)) == [87, 24_269, 1_234_567]
+
+
+def test_max_rating_count_keeps_the_most_reviewed_row(workdir, monkeypatch):
+    import src.transform
+
+    monkeypatch.setattr(src.transform, "deduplicate_products", lambda df: deduplicate_products(df, "max_rating_count"))
+    raw = make_products(1, copies=3)
+    raw["product_name"] = ["pocas reseñas", "más reseñas", "algunas reseñas"]
+    raw["rating_count"] = ["9,999", "24,269", "10,500"]
+
+    # Con los conteos en 0 ganaría la primera fila (empate)
+    assert list(transform_amazon_products(raw)["product_name"]) == ["más reseñas"]
@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from conftest import CART_CSV
+from src.funnel import build_funnel
+from src.transform import transform_redis_carts
+
+CATALOG = pd.DataFrame({
+    "product_id": ["P-1001", "P-1002", "P-1004", "P-1005", "P-1007"],
+    "category": ["Electronics", "Electronics", "Home", "Home", "Home"],
+    "discounted_price": [2999.0, 4999.0, 500.0, 1999.0, 289.0],
+})
+
+
+@pytest.fixture
+def events(workdir):
+    return transform_redis_carts(pd.read_csv(CART_CSV))
+
+
+def test_overall_rates_count_carts_not_events(events):
+    overall = build_funnel(events, CATALOG)["overall"]
+
+    # CART-001 y CART-002 tienen dos eventos de checkout cada uno: siguen contando una vez
+    assert overall["carts_added"] == 5
+    assert (overall["carts_checkout"], overall["carts_abandon"], overall["carts_stock_out"]) == (3, 1, 1)
+    assert overall["checkout_rate"] == 0.6
+    assert overall["median_time_to_checkout_s"] == 300
+
+
+def test_revenue_at_risk_uses_catalog_price_or_lost_revenue(events):
+    overall = build_funnel(events, CATALOG)["overall"]
+    # CART-004: quiebre de 8997 (= 3 x 2999, no se suma dos veces); CART-005: 2 x 500 abandonados
+    assert overall["revenue_at_risk"] == 8997 + 1000
+
+
+def test_breakdown_by_category_and_window(events):
+    funnel = build_funnel(events, CATALOG)
+
+    by_category = funnel["by_category"]
+    assert by_category.loc["Electronics", "carts_added"] == 4
+    assert by_category.loc["Home", "carts_added"] == 3
+    assert by_category.loc["Home", "abandon_rate"] == round(1 / 3, 4)
+
+    by_window = funnel["by_window"]
+    assert list(by_window["carts_added"]) == [2, 3]
+    assert list(by_window["checkout_rate"]) == [1.0, round(1 / 3, 4)]
+
+
+def test_checkout_without_add_is_not_a_conversion(events):
+    orphan = pd.DataFrame([{**events.iloc[2].to_dict(), "cart_id": "CART-999"}])
+    funnel = build_funnel(pd.concat([events.astype(object), orphan], ignore_index=True))
+
+    assert funnel["overall"]["carts_added"] == 5
+    assert funnel["overall"]["checkout_rate"] <= 1
+    assert list(funnel["by_category"].index) == ["Unknown"]
+
+
+def test_empty_events():
+    assert build_funnel(pd.DataFrame())["overall"] == {}
@@ -0,0 +1,131 @@
+import json
+
+import pandas as pd
+import pytest
+
+import src.incremental as incremental
+import src.load as load
+from conftest import CART_CSV
+from src.transform import transform_redis_carts
+
+LINES = CART_CSV.read_bytes().splitlines(keepends=True)
+HEADER, ROWS = LINES[0], LINES[1:]
+
+
+def write(path, rows, mode="wb"):
+    with open(path, mode) as f:
+        f.write(b"".join(rows))
+
+
+def read_all(path, state, chunksize=4):
+    return list(incremental.read_new_rows(path, incremental.start_state(path, state), chunksize))
+
+
+# ===== OFFSETS Y ROTACIÓN =====
+
+def test_new_rows_are_read_in_chunks_up_to_the_last_complete_line(workdir):
+    path = workdir / "carts.csv"
+    write(path, [HEADER] + ROWS[:10] + [ROWS[10].rstrip(b"\n")])
+
+    chunks = read_all(path, {})
+    assert [len(df) for df, _ in chunks] == [4, 4, 2]
+    state = chunks[-1][1]
+    assert state["rows"] == 10
+    assert state["offset"] == len(b"".join([HEADER] + ROWS[:10]))
+
+    # La línea a medio escribir se lee cuando el productor la termina
+    write(path, [b"\n"] + ROWS[11:], mode="ab")
+    chunks = read_all(path, state)
+    assert pd.concat([df for df, _ in chunks]).equals(pd.read_csv(CART_CSV).iloc[10:].reset_index(drop=True))
+    assert chunks[-1][1]["rows"] == len(ROWS)
+
+
+def test_nothing_new_yields_no_chunks(workdir):
+    path = workdir / "carts.csv"
+    write(path, [HEADER] + ROWS)
+    [(_, state)] = read_all(path, {}, chunksize=100)
+    assert read_all(path, state) == []
+
+
+@pytest.mark.parametrize("rotate", ["truncate", "replace", "rewrite"])
+def test_rotated_file_is_read_from_the_start(workdir, rotate):
+    path = workdir / "carts.csv"
+    write(path, [HEADER] + ROWS[:6])
+    [(_, state)] = read_all(path, {}, chunksize=100)
+
+    if rotate == "truncate":
+        # Más chico que el offset guardado
+        write(path, [HEADER] + ROWS[6:8])
+    elif rotate == "replace":
+        # Archivo nuevo (otro inode) que ya creció más allá del offset
+        path.rename(workdir / "carts.csv.1")
+        write(path, [HEADER] + ROWS[6:] + ROWS[:6])
+    else:
+        # Mismo inode y más largo, pero con otro contenido inicial
+        write(path, [HEADER] + ROWS[::-1])
+
+    chunks = read_all(path, state, chunksize=100)
+    assert sum(len(df) for df, _ in chunks) == {"truncate": 2, "replace": len(ROWS), "rewrite": len(ROWS)}[rotate]
+
+
+# ===== INGESTA =====
+
+@pytest.fixture
+def ingest_env(workdir, fake_redis, monkeypatch):
+    (workdir / "data" / "raw").mkdir(parents=True)
+    path = workdir / "data" / "raw" / "redis_cart_sim.csv"
+    write(path, [HEADER] + ROWS[:8])
+    monkeypatch.setattr(incremental, "INGEST_STATE_FILE", str(workdir / "offsets.json"))
+    monkeypatch.setattr("src.stock_sync.sync_stock_to_mongodb", lambda *args, **kwargs: 0)
+    return path
+
+
+def test_failed_batch_keeps_offset_and_reports_failure(ingest_env, monkeypatch):
+    assert incremental.ingest_incremental(store_history=False) == 8
+    offsets = incremental.load_offsets()
+
+    write(ingest_env, ROWS[8:], mode="ab")
+    merge = load.merge_carts_to_redis
+    redis_down = [True]
+    monkeypatch.setattr(load, "merge_carts_to_redis", lambda *args, **kwargs: not redis_down[0] and merge(*args, **kwargs))
+    assert incremental.ingest_incremental(store_history=False) is None
+    assert incremental.load_offsets() == offsets
+
+    redis_down[0] = False
+    assert incremental.ingest_incremental(store_history=False) == len(ROWS) - 8
+    assert incremental.load_offsets()["data/raw/redis_cart_sim.csv"]["rows"] == len(ROWS)
+
+
+def test_applied_batches_are_forgotten_after_retention(fake_redis, monkeypatch):
+    redis_client = fake_redis()
+    incremental.mark_batch_applied(redis_client, "batches", "old")
+    assert incremental.batch_applied(redis_client, "batches", "old")
+
+    now = incremental.time.time()
+    monkeypatch.setattr(incremental.time, "time", lambda: now + incremental.INGEST_BATCH_RETENTION + 1)
+    incremental.mark_batch_applied(redis_client, "batches", "new")
+    assert redis_client.zrange("batches", 0, -1) == ["new"]
+
+
+# ===== CARRITOS: FUSIÓN INCREMENTAL REPETIBLE =====
+
+def cart_state(redis_client) -> dict:
+    return {key: redis_client.dump(key) for key in sorted(redis_client.keys()) if key != load.APPLIED_BATCHES_KEY}
+
+
+def test_replayed_cart_batch_is_a_no_op(workdir, fake_redis):
+    carts = transform_redis_carts(pd.read_csv(CART_CSV))
+    first, second = carts.iloc[:8], carts.iloc[8:]
+    redis_client = fake_redis()
+
+    assert load.merge_carts_to_redis(first, batch_id="carts.csv@0:a")
+    assert load.merge_carts_to_redis(second, batch_id="carts.csv@500:b")
+    applied = cart_state(redis_client)
+
+    # Reintento del segundo lote (p. ej. el proceso murió antes de guardar el offset)
+    assert load.merge_carts_to_redis(second, batch_id="carts.csv@500:b")
+    assert cart_state(redis_client) == applied
+
+    for cart_id, rows in carts.groupby("cart_id"):
+        events = json.loads(redis_client.hget(f"cart:{cart_id}", "events"))
+        assert len(events) == len(rows)
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import pytest
+
+import src.integration as integration
+
+
+class AggregateCollection:
+    """Devuelve las respuestas dadas en orden; una excepción se lanza en esa llamada."""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+
+    def aggregate(self, pipeline):
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return iter(reply)
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    state = SimpleNamespace(closed=0, roundtrips=[], collection=None)
+    client = SimpleNamespace(close=lambda: setattr(state, "closed", state.closed + 1))
+    monkeypatch.setattr(integration, "get_mongo_connection", lambda: (client, None, state.collection))
+    monkeypatch.setattr(integration, "record_roundtrip", lambda db, operation, **kwargs: state.roundtrips.append(db))
+    return state
+
+
+def test_histogram_counts_both_aggregations(mongo):
+    mongo.collection = AggregateCollection(
+        [{"_id": None, "min": 0, "max": 10}],
+        [{"_id": 0.0, "count": 3}, {"_id": 5.0, "count": 2}],
+    )
+    histogram = integration.get_field_histogram("discounted_price", bins=2)
+
+    assert histogram["counts"] == [3, 2]
+    assert mongo.roundtrips == ["mongo", "mongo"]
+    assert mongo.closed == 1
+
+
+def test_histogram_closes_its_client_when_aggregation_fails(mongo):
+    mongo.collection = AggregateCollection([{"_id": None, "min": 0, "max": 10}], RuntimeError("cursor perdido"))
+
+    assert integration.get_field_histogram("discounted_price") == {}
+    assert mongo.closed == 1
+
+
+def test_given_collection_is_not_closed(mongo):
+    collection = AggregateCollection(RuntimeError("sin conexión"))
+
+    assert integration.get_field_histogram("rating", collection=collection) == {}
+    assert integration.get_product_performance_mongodb(collection=AggregateCollection(RuntimeError("x"))) == {}
+    assert mongo.closed == 0
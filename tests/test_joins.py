@@ -0,0 +1,29 @@
+import pandas as pd
+
+from conftest import CART_CSV
+from src.joins import fetch_catalog_frame, join_events_with_catalog
+from src.transform import transform_redis_carts
+
+
+def cart_events() -> pd.DataFrame:
+    return transform_redis_carts(pd.read_csv(CART_CSV))
+
+
+def test_empty_catalog_still_joins(workdir, collection):
+    enriched, rollup = join_events_with_catalog(cart_events(), fetch_catalog_frame(collection))
+    assert (enriched["product_name"] == "Unknown").all()
+    assert list(rollup.index) == ["Unknown"]
+
+
+def test_duplicate_catalog_rows_do_not_break_the_join(workdir, collection):
+    collection.docs["P-1001"] = {"product_id": "P-1001", "product_name": "Mouse", "discounted_price": 10.0,
+                                 "category": "Electronics", "stock": 5}
+    collection.extra_docs.append(dict(collection.docs["P-1001"]))
+
+    catalog = fetch_catalog_frame(collection)
+    assert list(catalog.columns) == ["product_id", "product_name", "discounted_price", "category"]
+    enriched, _ = join_events_with_catalog(cart_events(), catalog)
+
+    events = cart_events()
+    assert len(enriched) == len(events)
+    assert set(enriched.loc[enriched["product_id"] == "P-1001", "product_name"]) == {"Mouse"}
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import src.leaderboards as leaderboards
+from conftest import CART_CSV
+from src.transform import transform_redis_carts
+
+
+@pytest.fixture
+def redis_client(workdir, fake_redis):
+    client = fake_redis()
+    leaderboards.record_leaderboards(client, transform_redis_carts(pd.read_csv(CART_CSV)))
+    return client
+
+
+def test_batch_scores_per_metric(redis_client):
+    def board(metric):
+        return dict(redis_client.zrevrange(leaderboards.LEADERBOARD_KEYS[metric], 0, -1, withscores=True))
+
+    assert board("revenue") == {"P-1002": 4999 + 9998, "P-1001": 2999, "P-1005": 1999, "P-1007": 578}
+    assert board("units") == {"P-1002": 3, "P-1007": 2, "P-1001": 1, "P-1005": 1}
+    assert board("lost_revenue") == {"P-1001": 8997}
+    assert board("stock_outs") == {"P-1001": 1}
+
+
+def boards(client) -> dict:
+    return {key: client.zrange(key, 0, -1, withscores=True) for key in leaderboards.LEADERBOARD_KEYS.values()}
+
+
+def test_realtime_events_match_the_batch_path(redis_client):
+    batch = boards(redis_client)
+    assert leaderboards.record_leaderboards(redis_client, pd.DataFrame()) == 0
+
+    redis_client.flushdb()
+    for event in pd.read_csv(CART_CSV).to_dict("records"):
+        leaderboards.record_leaderboard_event(redis_client, event["event_type"], event["product_id"],
+                                              event["quantity"], event["revenue"], event["lost_revenue"])
+    assert boards(redis_client) == batch
+
+
+def test_top_products_look_up_missing_names_once(redis_client, collection, monkeypatch):
+    collection.docs = {pid: {"product_id": pid, "product_name": f"Producto {pid}"} for pid in ("P-1002", "P-1001")}
+    lookups = []
+
+    def connect():
+        lookups.append(1)
+        return SimpleNamespace(close=lambda: None), None, collection
+
+    monkeypatch.setattr(leaderboards, "get_mongo_connection", connect)
+    redis_client.hset(leaderboards.PRODUCT_NAMES_KEY, "P-1005", "Audífonos")
+
+    top = leaderboards.get_top_products("revenue", n=3, redis_client=redis_client)
+    assert [(row["rank"], row["product_id"], row["product_name"]) for row in top] == [
+        (1, "P-1002", "Producto P-1002"), (2, "P-1001", "Producto P-1001"), (3, "P-1005", "Audífonos"),
+    ]
+    assert top[0]["revenue"] == 14997
+
+    # Los nombres encontrados quedan en el caché de Redis
+    leaderboards.get_top_products("revenue", n=3, redis_client=redis_client)
+    assert len(lookups) == 1
+
+
+def test_unknown_metric_is_rejected():
+    with pytest.raises(ValueError):
+        leaderboards.get_top_products("clicks")
@@ -0,0 +1,93 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import src.load as load
+from conftest import CART_CSV, StubCollection
+from src.config import MONGO_LOAD_PROGRESS_FILE
+from src.transform import transform_redis_carts
+
+
+def products(n: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "product_id": [f"P-{i:04d}" for i in range(n)],
+        "product_name": [f"Producto {i}" for i in range(n)],
+        "category": "Home|Kitchen",
+        "discounted_price": 100.0,
+        "actual_price": 200.0,
+        "discount_percentage": 50.0,
+        "rating": 4.0,
+        "rating_count": 10,
+        "about_product": "",
+    })
+
+
+# ===== PRODUCTOS: HUELLA Y REANUDACIÓN =====
+
+def test_fingerprint_depends_on_ids_and_batch_size():
+    df = products(10)
+    assert load._products_fingerprint(df, 4) == load._products_fingerprint(df.copy(), 4)
+    assert load._products_fingerprint(df, 4) != load._products_fingerprint(df, 5)
+    assert load._products_fingerprint(df, 4) != load._products_fingerprint(df.iloc[::-1], 4)
+    assert load._products_fingerprint(df, 4) != load._products_fingerprint(df.iloc[:9], 4)
+
+    # Solo cuenta el conjunto de productos: cambiar un precio no invalida el progreso
+    repriced = df.assign(discounted_price=1.0)
+    assert load._products_fingerprint(df, 4) == load._products_fingerprint(repriced, 4)
+
+
+@pytest.fixture
+def mongo_stub(workdir, monkeypatch):
+    """load_products_to_mongodb contra una colección stub (sin índices ni explain)."""
+    target = SimpleNamespace(collection=StubCollection())
+    client = SimpleNamespace(close=lambda: None)
+    monkeypatch.setattr(load, "get_mongo_connection", lambda: (client, None, target.collection))
+    for name in ("drop_product_indexes", "create_product_key_index", "create_product_indexes", "explain_hot_queries"):
+        monkeypatch.setattr(load, name, lambda *args, **kwargs: None)
+    return target
+
+
+def test_interrupted_load_resumes_from_last_confirmed_batch(mongo_stub):
+    df = products(10)
+    mongo_stub.collection.fail_on_call = 3
+
+    assert not load.load_products_to_mongodb(df, batch_size=3)
+    with open(MONGO_LOAD_PROGRESS_FILE, encoding="utf-8") as f:
+        assert json.load(f)["completed_batches"] == 2
+    assert len(mongo_stub.collection.docs) == 6
+
+    # El stock que ya cambió en los lotes confirmados no se reinicia al reanudar
+    mongo_stub.collection.docs["P-0000"]["stock"] = 7
+    assert load.load_products_to_mongodb(df, batch_size=3)
+
+    assert mongo_stub.collection.bulk_calls == 5  # 2 confirmados + 1 fallido + 2 restantes
+    assert set(mongo_stub.collection.docs) == set(df["product_id"])
+    assert mongo_stub.collection.docs["P-0000"]["stock"] == 7
+    assert not os.path.exists(MONGO_LOAD_PROGRESS_FILE)
+
+
+def test_progress_of_other_products_is_ignored(mongo_stub):
+    mongo_stub.collection.fail_on_call = 2
+    assert not load.load_products_to_mongodb(products(10), batch_size=3)
+
+    # Otro conjunto de productos empieza de cero (y vacía la colección)
+    assert load.load_products_to_mongodb(products(4), batch_size=3)
+    assert set(mongo_stub.collection.docs) == {f"P-{i:04d}" for i in range(4)}
+
+
+# ===== CARRITOS: CONEXIONES REUTILIZADAS =====
+
+def test_merge_reuses_given_connections(workdir, fake_redis, monkeypatch):
+    redis_client = fake_redis()
+    closed = []
+    monkeypatch.setattr(redis_client, "close", lambda: closed.append(redis_client))
+    monkeypatch.setattr(load, "get_redis_connection", lambda: pytest.fail("abrió otra conexión"))
+    carts = transform_redis_carts(pd.read_csv(CART_CSV))
+
+    assert load.merge_carts_to_redis(carts.iloc[:5], redis_client=redis_client, cart_clients=[redis_client])
+    assert load.merge_carts_to_redis(carts.iloc[5:], redis_client=redis_client, cart_clients=[redis_client])
+    # Las cierra quien las abrió
+    assert closed == []
@@ -0,0 +1,60 @@
+import pytest
+
+import src.metrics as metrics
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    monkeypatch.setattr(metrics, "_counters", {})
+    monkeypatch.setattr(metrics, "_histograms", {})
+    monkeypatch.setattr(metrics, "_stage", "load")
+
+
+def sample_lines(text: str) -> dict:
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+
+
+def test_every_metric_has_help_and_type():
+    text = metrics.render_prometheus()
+    for name, (kind, _, _) in metrics.METRICS.items():
+        assert f"# HELP {name} " in text
+        assert f"# TYPE {name} {kind}\n" in text
+    assert text.endswith("\n")
+
+
+def test_counters_are_labelled_and_summed():
+    metrics.record_rows(10, dataset="products")
+    metrics.record_rows(5, dataset="products")
+    metrics.record_rows(3, dataset="carts", stage="transform")
+
+    samples = sample_lines(metrics.render_prometheus())
+    assert samples['etl_rows_processed_total{dataset="products",stage="load"}'] == "15"
+    assert samples['etl_rows_processed_total{dataset="carts",stage="transform"}'] == "3"
+
+
+def test_histogram_buckets_are_cumulative():
+    for size in (1, 50, 50, 2_000, 10**6):
+        metrics.observe("etl_batch_size", size, db="redis", operation="hset")
+
+    samples = sample_lines(metrics.render_prometheus())
+    prefix = 'etl_batch_size_bucket{db="redis",operation="hset",stage="load",le='
+    assert samples[prefix + '"1"}'] == "1"
+    assert samples[prefix + '"100"}'] == "3"
+    assert samples[prefix + '"5000"}'] == "4"
+    assert samples[prefix + '"+Inf"}'] == "5"
+    assert samples['etl_batch_size_count{db="redis",operation="hset",stage="load"}'] == "5"
+    assert float(samples['etl_batch_size_sum{db="redis",operation="hset",stage="load"}']) == 1_002_101
+
+
+def test_label_values_are_escaped():
+    metrics.inc("etl_cache_requests_total", cache='viz "main"\\', result="hit")
+    text = metrics.render_prometheus()
+    assert 'cache="viz \\"main\\"\\\\"' in text
+
+
+def test_write_textfile_is_atomic(workdir):
+    metrics.record_rows(1)
+    path = metrics.write_textfile("data/metrics/etl.prom")
+    assert (workdir / path).read_text(encoding="utf-8") == metrics.render_prometheus()
+    assert not (workdir / f"{path}.tmp").exists()
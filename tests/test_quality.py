@@ -0,0 +1,87 @@
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from conftest import make_products
+from src.quality import CART_RULES, PROFILE_FILE, QUARANTINE_DIR, apply_quality_rules
+from src.transform import transform_amazon_products
+
+
+def read_quarantine(path: Path) -> pd.DataFrame:
+    return pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_csv(path)
+
+
+def quarantine_files(dataset: str) -> list:
+    return sorted(Path(QUARANTINE_DIR).glob(f"{dataset}_quarantine_*"))
+
+
+def carts() -> pd.DataFrame:
+    return pd.DataFrame({
+        "cart_id": ["CART-1", "", "CART-3", "CART-4"],
+        "event_type": ["add", "add", None, "checkout"],
+        "event_time": ["2025-05-05 10:00:00", "2025-05-05 10:01:00", "2025-05-05 10:02:00", "no es fecha"],
+        "quantity": [1, 500, 2, 1],
+    })
+
+
+def parse(raw: pd.DataFrame) -> pd.DataFrame:
+    return raw.assign(event_time=pd.to_datetime(raw["event_time"], errors="coerce"))
+
+
+def test_rejected_rows_go_to_quarantine_with_reason_codes(workdir):
+    raw = carts()
+    kept, counts = apply_quality_rules(raw, parse(raw), CART_RULES, "carts")
+
+    assert list(kept["cart_id"]) == ["CART-1"]
+    assert counts["MISSING_CART_ID"]["rows"] == 1
+    assert counts["QUANTITY_OUT_OF_RANGE"]["rows"] == 1
+
+    [path] = quarantine_files("carts")
+    rejected = read_quarantine(path)
+    assert list(rejected["reason_codes"]) == [
+        "MISSING_CART_ID;QUANTITY_OUT_OF_RANGE", "MISSING_EVENT_TYPE", "INVALID_EVENT_TIME",
+    ]
+
+
+def test_result_is_a_copy(workdir):
+    raw = carts()
+    parsed = parse(raw)
+    kept, _ = apply_quality_rules(raw, parsed, CART_RULES, "carts")
+    kept["quantity"] = 0
+    assert list(parsed["quantity"]) == [1, 500, 2, 1]
+
+
+def test_quarantines_in_the_same_second_do_not_overwrite(workdir):
+    for _ in range(3):
+        raw = carts()
+        apply_quality_rules(raw, parse(raw), CART_RULES, "carts")
+    assert len(quarantine_files("carts")) == 3
+
+
+def test_stream_chunks_share_one_profile_entry(workdir):
+    for chunk in range(3):
+        raw = carts()
+        apply_quality_rules(raw, parse(raw), CART_RULES, "carts", run_id="20250505T100000", chunk=chunk)
+
+    profile = json.loads(Path(PROFILE_FILE).read_text(encoding="utf-8"))
+    assert profile["carts"]["rows"] == 12
+    assert profile["carts"]["rejected"] == 9
+    assert profile["carts"]["rules"]["MISSING_CART_ID"]["rows"] == 3
+    assert len(quarantine_files("carts")) == 3
+
+    # Otra ejecución reemplaza la entrada en lugar de sumarse
+    raw = carts()
+    apply_quality_rules(raw, parse(raw), CART_RULES, "carts", run_id="20250506T100000", chunk=0)
+    profile = json.loads(Path(PROFILE_FILE).read_text(encoding="utf-8"))
+    assert profile["carts"]["rows"] == 4
+
+
+def test_unparseable_rating_count_is_rejected(workdir):
+    raw = make_products(4, copies=1)
+    raw["rating_count"] = ["1,234", "muchas", None, "87"]
+
+    products = transform_amazon_products(raw)
+    assert len(products) == 3
+    assert products.attrs["quality"]["UNPARSEABLE_RATING_COUNT"]["rows"] == 1
+    assert sorted(products["rating_count"].astype(int)) == [0, 87, 1234]
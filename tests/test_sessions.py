@@ -0,0 +1,38 @@
+import pandas as pd
+
+from conftest import CART_CSV
+from src.sessions import SESSION_FIELDS, build_cart_sessions, parse_session_fields, session_mappings
+from src.transform import transform_redis_carts
+
+
+def sessions() -> pd.DataFrame:
+    return build_cart_sessions(transform_redis_carts(pd.read_csv(CART_CSV)))
+
+
+def test_one_summary_row_per_cart(workdir):
+    table = sessions()
+    assert list(table.index) == ["CART-001", "CART-002", "CART-003", "CART-004", "CART-005"]
+
+    cart = table.loc["CART-001"]
+    assert (cart["n_events"], cart["n_add"], cart["n_checkout"]) == (4, 2, 2)
+    assert (cart["items_added"], cart["items_checked_out"], cart["distinct_products"]) == (3, 3, 2)
+    assert cart["duration_s"] == 300
+    assert cart["total_revenue"] == 2999 + 578
+    assert list(table["outcome"]) == ["checkout", "checkout", "checkout", "stock_out", "abandon"]
+    assert table.loc["CART-004", "lost_revenue"] == 8997
+
+
+def test_empty_events_give_an_empty_table():
+    assert list(build_cart_sessions(None).columns) == ["customer_id"] + SESSION_FIELDS
+
+
+def test_mappings_round_trip_through_hmget_strings(workdir):
+    table = sessions()
+    mapping = session_mappings(table)["CART-004"]
+    # Redis devuelve todo como texto
+    values = [str(mapping[field]) for field in SESSION_FIELDS]
+
+    parsed = parse_session_fields(values, SESSION_FIELDS)
+    assert parsed["n_stock_out"] == 1 and parsed["lost_revenue"] == 8997.0
+    assert parsed["outcome"] == "stock_out"
+    assert parse_session_fields([None, None], ["n_events", "total_revenue"]) == {"n_events": 0, "total_revenue": 0.0}
@@ -0,0 +1,68 @@
+from src.sharding import build_hash_ring, group_keys_by_shard, shard_for_key
+
+KEYS = [f"cart:CART-{i:05d}" for i in range(3000)]
+SHARDS = ["redis-a:6379", "redis-b:6379", "redis-c:6379"]
+
+
+def test_placement_is_deterministic_and_in_range():
+    ring = build_hash_ring(SHARDS)
+    placement = [shard_for_key(ring, key) for key in KEYS]
+    assert placement == [shard_for_key(build_hash_ring(SHARDS), key) for key in KEYS]
+    assert set(placement) == {0, 1, 2}
+
+
+def test_keys_are_spread_across_shards():
+    groups = group_keys_by_shard(build_hash_ring(SHARDS), KEYS)
+    assert sum(len(keys) for keys in groups.values()) == len(KEYS)
+    for keys in groups.values():
+        assert 0.2 < len(keys) / len(KEYS) < 0.47
+
+
+def test_adding_a_shard_only_moves_keys_to_the_new_shard():
+    before = build_hash_ring(SHARDS)
+    after = build_hash_ring(SHARDS + ["redis-d:6379"])
+    moved = [key for key in KEYS if shard_for_key(before, key) != shard_for_key(after, key)]
+
+    assert all(shard_for_key(after, key) == 3 for key in moved)
+    assert 0.15 < len(moved) / len(KEYS) < 0.35
+
+
+def test_owner_follows_shard_name_not_position():
+    ring = build_hash_ring(SHARDS)
+    reordered = build_hash_ring(list(reversed(SHARDS)))
+    for key in KEYS[:200]:
+        assert SHARDS[shard_for_key(ring, key)] == SHARDS[::-1][shard_for_key(reordered, key)]
+
+
+def test_single_shard_owns_everything():
+    ring = build_hash_ring(["redis:6379"])
+    assert {shard_for_key(ring, key) for key in KEYS} == {0}
+
+
+def test_benchmark_scan_visits_every_cart(fake_redis):
+    from src.sharding import benchmark_sharding
+
+    rows = benchmark_sharding([fake_redis()], n_carts=300, batch_size=100)
+    assert rows[0]["carts_scanned"] == 300
+
+
+def test_visualization_aggregates_cover_every_shard(monkeypatch):
+    import fakeredis
+
+    import src.visualizations as visualizations
+    from src.sharding import ring_for_clients, run_sharded_pipelines
+
+    shards = [fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True) for _ in range(3)]
+    for i, shard in enumerate(shards):
+        shard.connection_pool.connection_kwargs["port"] = 7000 + i
+    keys = [f"cart:CART-{i:04d}" for i in range(90)]
+    run_sharded_pipelines(shards, keys, lambda pipe, key: pipe.hset(key, mapping={
+        "total_revenue": 10, "lost_revenue": 0, "n_add": 1, "n_checkout": 1,
+    }), ring_for_clients(shards))
+    assert all(shard.dbsize() for shard in shards)
+
+    monkeypatch.setattr(visualizations, "get_cart_clients", lambda: shards)
+    carts = visualizations.fetch_cart_aggregates()
+    assert carts["carts"] == 90
+    assert carts["total_revenue"] == 900
+    assert carts["events_by_type"]["checkout"] == 90
@@ -0,0 +1,97 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import src.stream_etl as stream_etl
+from conftest import CART_CSV, make_products
+
+STREAM_THREADS = ("reader", "transform-", "dedup", "load-mongo-", "load-redis-")
+
+
+@pytest.fixture
+def stream_env(workdir, fake_redis, collection, monkeypatch):
+    """Pipeline en streaming contra fakeredis y la colección stub (sin índices ni volcado de stock)."""
+    products_csv = workdir / "amazon.csv"
+    make_products(40, copies=3).to_csv(products_csv, index=False)
+    monkeypatch.setattr(stream_etl, "AMAZON_CSV", str(products_csv))
+    monkeypatch.setattr(stream_etl, "REDIS_CART_CSV", str(CART_CSV))
+
+    client = SimpleNamespace(close=lambda: None)
+    monkeypatch.setattr(stream_etl, "get_mongo_connection", lambda: (client, None, collection))
+    for name in ("drop_product_indexes", "create_product_key_index", "create_product_indexes"):
+        monkeypatch.setattr(stream_etl, name, lambda *args, **kwargs: None)
+    monkeypatch.setattr(stream_etl, "sync_stock_to_mongodb", lambda *args, **kwargs: 0)
+    return SimpleNamespace(products_csv=products_csv, collection=collection, redis=fake_redis())
+
+
+def run_with_timeout(timeout: float = 60, **kwargs):
+    """Ejecuta el pipeline en un hilo: si el cierre se cuelga el test falla en lugar de bloquearse."""
+    result = {}
+    runner = threading.Thread(target=lambda: result.update(summary=stream_etl.run_streaming_pipeline(**kwargs)))
+    runner.start()
+    runner.join(timeout)
+    assert not runner.is_alive(), "el pipeline no terminó"
+    return result["summary"]
+
+
+def alive_stream_threads() -> list:
+    return [t.name for t in threading.enumerate() if t.name.startswith(STREAM_THREADS)]
+
+
+def test_stream_loads_products_and_ordered_carts(stream_env):
+    summary = run_with_timeout(chunksize=3, queue_depth=2, transform_workers=3, redis_loaders=2)
+
+    assert summary is not None
+    assert set(stream_env.collection.docs) == {f"P-{i:04d}" for i in range(40)}
+
+    # Cada carrito tiene todos sus eventos en el orden del archivo, aunque vengan de varios bloques
+    carts = pd.read_csv(CART_CSV)
+    for cart_id, rows in carts.groupby("cart_id", sort=False):
+        events = json.loads(stream_env.redis.hget(f"cart:{cart_id}", "events"))
+        assert [e["event_time"][:19].replace("T", " ") for e in events] == list(rows["event_time"])
+
+    # Una entrada de calidad por dataset (no una por bloque)
+    with open("data/quarantine/quality_profile.json", encoding="utf-8") as f:
+        profile = json.load(f)
+    assert set(profile) == {"products", "carts"}
+    assert profile["products"]["rows"] == 120
+    assert profile["carts"]["rows"] == len(carts)
+    assert not alive_stream_threads()
+
+    # Memoria de la transformación sumada por dataset, sin reporte por bloque
+    assert set(summary["memory"]) == {"products", "carts"}
+    assert summary["memory"]["carts"]["after_bytes"] < summary["memory"]["carts"]["before_bytes"]
+
+
+def test_stream_does_not_clear_targets_when_input_is_missing(stream_env, monkeypatch):
+    stream_env.collection.docs["P-OLD"] = {"product_id": "P-OLD"}
+    stream_env.redis.set("cart:CART-OLD", "1")
+    monkeypatch.setattr(stream_etl, "AMAZON_CSV", str(stream_env.products_csv.with_name("missing.csv")))
+
+    assert run_with_timeout() is None
+    assert "P-OLD" in stream_env.collection.docs
+    assert stream_env.redis.get("cart:CART-OLD") == "1"
+
+
+def test_stream_fails_when_no_product_is_loaded(stream_env):
+    products = make_products(10)
+    products["product_name"] = ""
+    products.to_csv(stream_env.products_csv, index=False)
+
+    assert run_with_timeout(chunksize=5) is None
+
+
+def test_stream_stops_every_thread_when_a_loader_fails(stream_env, monkeypatch):
+    make_products(400, copies=2).to_csv(stream_env.products_csv, index=False)
+
+    def failing_upsert(collection, rows, loaded_at):
+        raise RuntimeError("MongoDB no disponible")
+
+    monkeypatch.setattr(stream_etl, "upsert_product_batch", failing_upsert)
+
+    # Colas de un bloque: lector y transformadores quedan bloqueados en put() cuando falla el cargador
+    assert run_with_timeout(chunksize=10, queue_depth=1, transform_workers=2) is None
+    assert not alive_stream_threads()
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+from redis.exceptions import ResponseError
+
+import src.streaming as streaming
+
+
+@pytest.fixture
+def stream_redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(streaming, "get_redis_connection", fake_redis)
+    monkeypatch.setattr(streaming, "get_mongo_connection", lambda: (None, None, None))
+    return fake_redis()
+
+
+def event(cart_id: str, event_type: str, revenue: float = 0) -> dict:
+    return {"cart_id": cart_id, "customer_id": "CUST-01", "event_time": "2025-05-05 10:00:00",
+            "event_type": event_type, "product_id": "P-1001", "quantity": 1, "revenue": revenue, "lost_revenue": 0}
+
+
+def wait_for(condition, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_consumer_recovers_after_flushdb(stream_redis):
+    stop = threading.Event()
+    consumer = threading.Thread(target=streaming.run_stream_consumer, kwargs={"stop_event": stop})
+    consumer.start()
+    try:
+        streaming.publish_cart_event(stream_redis, event("CART-001", "add"))
+        assert wait_for(lambda: stream_redis.hget(streaming.LIVE_METRICS_KEY, "total_events") == "1")
+
+        # Una carga completa borra el stream y el grupo de consumidores
+        stream_redis.flushdb()
+        assert wait_for(lambda: stream_redis.exists(streaming.CART_STREAM_KEY))
+        streaming.publish_cart_event(stream_redis, event("CART-002", "checkout", 100))
+        streaming.publish_cart_event(stream_redis, event("CART-002", "checkout", 50))
+        assert wait_for(lambda: stream_redis.hget(streaming.LIVE_METRICS_KEY, "total_events") == "2")
+    finally:
+        stop.set()
+        consumer.join(10)
+    assert not consumer.is_alive()
+
+    metrics = streaming.get_live_metrics(stream_redis)
+    assert metrics["total_carts"] == 1
+    assert metrics["checkout_carts"] == 1
+    assert metrics["checkout_events"] == 2
+    assert metrics["total_revenue"] == 150
+
+
+def test_consumer_stops_when_reader_dies(stream_redis, monkeypatch):
+    def broken_xreadgroup(self, *args, **kwargs):
+        raise ResponseError("WRONGTYPE Operation against a key holding the wrong kind of value")
+
+    monkeypatch.setattr(type(stream_redis), "xreadgroup", broken_xreadgroup)
+    result = {}
+
+    def run():
+        try:
+            streaming.run_stream_consumer()
+        except RuntimeError as e:
+            result["error"] = e
+
+    consumer = threading.Thread(target=run)
+    consumer.start()
+    consumer.join(10)
+    assert not consumer.is_alive(), "el consumidor siguió esperando con el lector muerto"
+    assert "WRONGTYPE" in str(result["error"])
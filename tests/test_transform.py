@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from src.transform import optimize_dataframe_memory, transform_redis_carts
+
+
+def cart_log(n_events: int, seed: int = 0) -> pd.DataFrame:
+    """Log de carritos sintético con la forma de redis_cart_sim.csv (5 eventos por carrito)."""
+    rng = np.random.default_rng(seed)
+    carts = np.arange(n_events) // 5
+    return pd.DataFrame({
+        "cart_id": [f"CART-{c:06d}" for c in carts],
+        "customer_id": [f"CUST-{c % 5000:05d}" for c in carts],
+        "event_time": (pd.Timestamp("2025-05-05 10:00:00")
+                       + pd.to_timedelta(np.arange(n_events) * 2, unit="s")).astype(str),
+        "event_type": rng.choice(["add", "remove", "checkout", "abandon"], n_events),
+        "product_id": [f"P-{p:04d}" for p in rng.integers(1000, 1500, n_events)],
+        "quantity": rng.integers(1, 5, n_events),
+        "stock_before": rng.integers(0, 300, n_events),
+        "stock_after": rng.integers(0, 300, n_events),
+        "revenue": rng.integers(0, 5000, n_events).astype(float),
+        "lost_revenue": rng.integers(0, 5000, n_events).astype(float),
+    })
+
+
+def test_cart_log_memory_drops_at_least_3x(workdir):
+    carts = transform_redis_carts(cart_log(20_000))
+    memory = carts.attrs["memory"]
+    assert memory["before_bytes"] / memory["after_bytes"] >= 3
+
+    # Los consumidores siguen viendo los mismos valores
+    assert carts["revenue"].dtype == "float64"
+    assert carts["quantity"].sum() == cart_log(20_000)["quantity"].clip(1, 100).sum()
+
+
+def test_report_is_printed_only_when_verbose(capsys):
+    df = pd.DataFrame({"event_type": ["add"] * 10, "quantity": range(10)})
+
+    optimized, report = optimize_dataframe_memory(df, "carritos")
+    assert "event_type" in capsys.readouterr().out
+    assert list(report.index) == ["event_type", "quantity"]
+
+    optimized, _ = optimize_dataframe_memory(df, "carritos", verbose=False)
+    assert capsys.readouterr().out == ""
+    assert optimized.attrs["memory"]["after_bytes"] < optimized.attrs["memory"]["before_bytes"]